@@ -1,9 +1,12 @@
 # render.py
-import json, subprocess, shlex, tempfile, os, sys
+import json, shlex, tempfile, os, sys
 
-def run(cmd):
-    print("→", cmd)
-    subprocess.check_call(cmd, shell=True)
+from renderer import ffmpeg
+from renderer.overlay import is_image, still_chain
+
+def run(cmd, stage=None):
+    print("→", shlex.join(cmd))
+    ffmpeg.run(cmd, stage=stage)
 
 def main(template_path, var_mapping):
     with open(template_path) as f:
@@ -32,7 +35,7 @@ def main(template_path, var_mapping):
     # Pre-normalize music (optional but consistent)
     music_src = [a for a in spec["tracks"]["audio"] if a.get("id") == "music"][0]["src"]
     music_norm = os.path.join(tempfile.gettempdir(), "music_norm.wav")
-    run(f'ffmpeg -y -i "{music_src}" -af "loudnorm=I=-14:LRA=11:TP=-1.5" "{music_norm}"')
+    run(["ffmpeg", "-y", "-i", music_src, "-af", "loudnorm=I=-14:LRA=11:TP=-1.5", music_norm], stage="loudnorm")
 
     # Build ffmpeg args
     all_inputs = []
@@ -70,7 +73,12 @@ def main(template_path, var_mapping):
     for gi, g in enumerate(spec["tracks"]["graphics"]):
         enable = f"enable='between(t,{g['at']},{g['at']+g['duration']})'"
         x = g["x"]; y = g["y"]
-        fc.append(f'{base}[{len(inputs)+gi}:v]overlay=x={x}:y={y}:{enable}[vg{gi}]')
+        src = f'[{len(inputs)+gi}:v]'
+        if is_image(g["src"]):
+            # one decoded frame held for the window only, instead of re-reading the image every frame
+            fc.append(still_chain(src, g['at'], g['at'] + g['duration']) + f'[gfx{gi}]')
+            src = f'[gfx{gi}]'
+        fc.append(f'{base}{src}overlay=x={x}:y={y}:eof_action=pass:{enable}[vg{gi}]')
         base = f'[vg{gi}]'
     vout = base
 
@@ -99,7 +107,7 @@ def main(template_path, var_mapping):
         "-movflags", "+faststart",
         out_mp4
     ]
-    run(" ".join(shlex.quote(x) for x in cmd))
+    run(cmd, stage="template_encode")
     print("Done →", out_mp4)
 
 if __name__ == "__main__":
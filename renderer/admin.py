@@ -1,7 +1,8 @@
 from django.contrib import admin
+from django.db.models import Avg, Count, Max, Sum
 from django.urls import reverse
-from django.utils.html import format_html
-from .models import InputData, PiPClip, BrollClip
+from django.utils.html import format_html, format_html_join
+from .models import InputData, PiPClip, BrollClip, RenderRun, RenderStage, RenderJob, RenderChunk
 
 class PiPClipInline(admin.TabularInline):
     model = PiPClip
@@ -35,12 +36,73 @@ class BrollClipInline(admin.TabularInline):
         return "Save to edit"
     edit_link.short_description = "Edit"
 
+class RenderRunInline(admin.TabularInline):
+    model = RenderRun
+    extra = 0
+    can_delete = False
+    fields = ('created_at', 'status', 'wall_sec', 'source_duration', 'stage_count', 'edit_link')
+    readonly_fields = fields
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def stage_count(self, obj):
+        return obj.stages.count()
+    stage_count.short_description = "Stages"
+
+    def edit_link(self, obj):
+        if obj.pk:
+            return format_html(
+                '<a href="/admin/renderer/renderrun/{}/change/" target="_blank">Stages</a>',
+                obj.pk
+            )
+        return ""
+    edit_link.short_description = "Detail"
+
+def _fmt(value, spec):
+    return "-" if value is None else format(value, spec)
+
+def stage_aggregates(stages):
+    """HTML table of per-stage-name totals for a RenderStage queryset."""
+    rows = (
+        stages.values('name')
+        .annotate(n=Count('id'), wall=Sum('wall_sec'), avg_wall=Avg('wall_sec'),
+                  cpu_user=Sum('cpu_user_sec'), cpu_sys=Sum('cpu_sys_sec'),
+                  rss=Max('max_rss_kb'), fps=Avg('fps'))
+        .order_by('-wall')
+    )
+    if not rows:
+        return "No telemetry recorded"
+    body = format_html_join("", "<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td></tr>", (
+        (r['name'], r['n'], _fmt(r['wall'], ".1f"), _fmt(r['avg_wall'], ".2f"),
+         _fmt((r['cpu_user'] or 0) + (r['cpu_sys'] or 0), ".1f"),
+         _fmt(r['rss'] and r['rss'] / 1024, ".0f"), _fmt(r['fps'], ".1f"))
+        for r in rows
+    ))
+    return format_html(
+        "<table><tr><th>Stage</th><th>Runs</th><th>Wall s</th><th>Avg wall s</th>"
+        "<th>CPU s</th><th>Peak RSS MiB</th><th>Avg fps</th></tr>{}</table>",
+        body
+    )
+
 class InputDataAdmin(admin.ModelAdmin):
-    list_display = ('title', 'completed_video', 'created_at')
-    inlines = [PiPClipInline, BrollClipInline]
+    list_display = ('title', 'completed_video', 'stream_status', 'created_at', 'last_render_sec')
+    inlines = [PiPClipInline, BrollClipInline, RenderRunInline]
     search_fields = ('title',)
-    list_filter = ('created_at',)
-    readonly_fields = ('created_at',)
+    list_filter = ('created_at', 'stream_status')
+    readonly_fields = ('created_at', 'render_summary', 'outputs', 'stream_status', 'stream_manifest', 'stream_dash_manifest',
+                       'stream_error')
+
+    def last_render_sec(self, obj):
+        run = obj.render_runs.first()
+        return f"{run.wall_sec:.1f}" if run else "-"
+    last_render_sec.short_description = "Render (s)"
+
+    def render_summary(self, obj):
+        if not obj.pk:
+            return "-"
+        return stage_aggregates(RenderStage.objects.filter(run__input_data=obj))
+    render_summary.short_description = "Render time by stage"
 
 # Hidden admin classes for PiPClip and BrollClip
 class PiPClipAdmin(admin.ModelAdmin):
@@ -51,9 +113,63 @@ class BrollClipAdmin(admin.ModelAdmin):
     list_display = ('input_data', 'file', 'start', 'duration')
     list_filter = ('input_data',)
 
+class RenderStageInline(admin.TabularInline):
+    model = RenderStage
+    extra = 0
+    can_delete = False
+    fields = ('order', 'name', 'wall_sec', 'cpu_user_sec', 'cpu_sys_sec', 'max_rss_kb',
+              'input_bytes', 'output_bytes', 'frames', 'fps', 'returncode', 'command')
+    readonly_fields = fields
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+class RenderRunAdmin(admin.ModelAdmin):
+    list_display = ('title', 'input_data', 'status', 'priority', 'queue_wait_sec', 'wall_sec', 'source_duration', 'created_at')
+    list_filter = ('status', 'priority', 'created_at')
+    search_fields = ('title',)
+    readonly_fields = ('input_data', 'title', 'status', 'priority', 'error', 'source_duration', 'queue_wait_sec', 'wall_sec',
+                       'created_at', 'stage_summary')
+    inlines = [RenderStageInline]
+
+    def stage_summary(self, obj):
+        return stage_aggregates(obj.stages.all())
+    stage_summary.short_description = "By stage"
+
+class RenderChunkInline(admin.TabularInline):
+    model = RenderChunk
+    extra = 0
+    can_delete = False
+    fields = ('index', 'start', 'end', 'status', 'worker', 'attempts', 'heartbeat_at', 'error')
+    readonly_fields = fields
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+class RenderJobAdmin(admin.ModelAdmin):
+    list_display = ('title', 'status', 'priority', 'owner', 'estimated', 'worker', 'attempts', 'heartbeat_at',
+                    'created_at', 'finished_at')
+    list_filter = ('status', 'priority', 'created_at')
+    search_fields = ('title', 'worker', 'owner')
+    readonly_fields = ('title', 'spec', 'status', 'owner', 'estimate', 'error', 'log', 'output', 'input_data', 'worker', 'attempts',
+                       'heartbeat_at', 'lease_expires_at', 'created_at', 'started_at', 'finished_at')
+    inlines = [RenderChunkInline]
+
+    @admin.display(description='Estimated')
+    def estimated(self, obj):
+        if not obj.estimate:
+            return '-'
+        return f"{obj.estimate['wall_sec']:.0f}s" + (" ~" if obj.estimate.get('approximate') else "")
+
 # Register only InputDataAdmin - this will show only InputData in the admin interface
 admin.site.register(InputData, InputDataAdmin)
 
+# Render telemetry across all renders (regressions, hardware sizing)
+admin.site.register(RenderRun, RenderRunAdmin)
+
+# API render queue and which worker holds each job
+admin.site.register(RenderJob, RenderJobAdmin)
+
 # Register the related models but hide them from the admin index
 admin.site.register(PiPClip, PiPClipAdmin)
 admin.site.register(BrollClip, BrollClipAdmin)
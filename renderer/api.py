@@ -0,0 +1,127 @@
+# renderer/api.py
+"""JSON render API: submit a timeline spec that references uploaded assets, poll or cancel the job, estimate, preview frames and streams."""
+from django.http import FileResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from rest_framework import status
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+
+from . import ffmpeg, jobs, preview, progressive, scheduler, telemetry
+from .estimate import estimate_spec
+from .models import RenderJob
+from .serializers import (
+    RenderRequestSerializer, RenderJobSerializer, TimelineSpecSerializer, PreviewFrameSerializer, PreviewClipSerializer,
+    PreviewStreamSerializer,
+)
+
+@api_view(["POST"])
+def render_jobs(request):
+    """Validate and queue a render; returns 202 with the job (poll its Location)."""
+    serializer = RenderRequestSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    user = request.user
+    owner = user.get_username() if user.is_authenticated else request.META.get("REMOTE_ADDR", "")
+    job = jobs.submit(serializer.to_spec(), serializer.validated_data["priority"], owner)
+    data = RenderJobSerializer(job, context={"request": request}).data
+    location = request.build_absolute_uri(f"{request.path.rstrip('/')}/{job.id}/")
+    return Response(data, status=status.HTTP_202_ACCEPTED, headers={"Location": location})
+
+@api_view(["GET"])
+def render_job_detail(request, job_id):
+    job = get_object_or_404(RenderJob, pk=job_id)
+    return Response(RenderJobSerializer(job, context={"request": request}).data)
+
+@api_view(["POST"])
+def render_job_cancel(request, job_id):
+    """Cancel a queued or running job; its ffmpeg processes stop within a few seconds. 409 if it already finished."""
+    job = get_object_or_404(RenderJob, pk=job_id)
+    code = status.HTTP_202_ACCEPTED if jobs.cancel(job.pk) else status.HTTP_409_CONFLICT
+    job.refresh_from_db()
+    return Response(RenderJobSerializer(job, context={"request": request}).data, status=code)
+
+@api_view(["POST"])
+def render_estimate(request):
+    """Dry run: predicted wall time per stage, peak scratch disk and output size for a spec. Runs no ffmpeg."""
+    serializer = TimelineSpecSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    return Response(estimate_spec(serializer.to_spec()).to_dict())
+
+@api_view(["GET"])
+def render_stats(request):
+    """Queue depth, queue wait and run time per priority class (?hours=24)."""
+    try:
+        hours = float(request.query_params.get("hours", 24))
+    except ValueError:
+        return Response({"detail": "hours must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(scheduler.class_metrics(hours))
+
+def _interactive(title, render, *args):
+    """Run a preview in the interactive class; cache misses are recorded as RenderRuns."""
+    with ffmpeg.priority(ffmpeg.INTERACTIVE), telemetry.recording(title=title) as rec:
+        rec.priority = ffmpeg.INTERACTIVE
+        try:
+            return render(*args)
+        except Exception as e:
+            rec.error = str(e)
+            raise
+        finally:
+            if rec.stages:
+                telemetry.save_run(rec)
+
+@api_view(["POST"])
+def preview_frame(request):
+    """Render (or reuse) one JPEG frame of a spec without rendering the whole video."""
+    serializer = PreviewFrameSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    data = serializer.validated_data
+    try:
+        path = _interactive("preview frame", preview.render_frame, data["spec"]["spec"], data["t"], data["width"])
+    except ValueError as e:
+        return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    response = FileResponse(open(path, "rb"), content_type="image/jpeg")
+    response["Cache-Control"] = "private, max-age=3600"
+    return response
+
+@api_view(["POST"])
+def preview_clip(request):
+    """Render (or reuse) a preview-quality MP4 of the few seconds around one B-roll/PiP row."""
+    serializer = PreviewClipSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    data = serializer.validated_data
+    try:
+        path = _interactive("preview clip", preview.render_clip,
+                            data["spec"]["spec"], data["kind"], data["index"], data["pad"], data["width"])
+    except ValueError as e:
+        return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    response = FileResponse(open(path, "rb"), content_type="video/mp4")
+    response["Cache-Control"] = "private, max-age=3600"
+    return response
+
+@api_view(["POST"])
+def preview_stream(request):
+    """Start (or join) a progressive preview of the whole spec; returns 202 with the URL to play while it renders."""
+    serializer = PreviewStreamSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    data = serializer.validated_data
+    sid = progressive.start(data["spec"]["spec"], data["width"])
+    url = request.build_absolute_uri(f"{request.path.rstrip('/')}/{sid}/")
+    return Response({"id": sid, "stream_url": url}, status=status.HTTP_202_ACCEPTED, headers={"Location": url})
+
+@api_view(["GET"])
+def preview_stream_detail(request, stream_id):
+    """The progressive preview's fragmented MP4, sent as it is written (the response ends when the render does)."""
+    if not progressive.STREAM_ID_RE.match(stream_id):
+        return Response({"detail": "No such preview stream."}, status=status.HTTP_404_NOT_FOUND)
+    try:
+        f, part = progressive.open_stream(stream_id)
+    except FileNotFoundError:
+        err = progressive.error_path(progressive.stream_path(stream_id))
+        if err.exists():
+            return Response({"detail": err.read_text(encoding="utf-8")}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response({"detail": "No such preview stream."}, status=status.HTTP_404_NOT_FOUND)
+    if part is None:
+        return FileResponse(f, content_type="video/mp4")
+    response = StreamingHttpResponse(progressive.follow(f, part), content_type="video/mp4")
+    response["Cache-Control"] = "no-store"
+    response["X-Accel-Buffering"] = "no"  # let nginx pass fragments through as they arrive
+    return response
@@ -0,0 +1,215 @@
+# renderer/bench.py
+"""
+Renderer benchmarks on deterministic synthetic media.
+
+Fixtures are generated with ffmpeg lavfi (testsrc2 video, sine audio) so every machine
+renders the same input. Each case runs `repeat` times inside a telemetry recorder; we
+keep the median wall time plus the summed child CPU time and the peak RSS of its
+ffmpeg processes. Results are plain JSON so two runs can be diffed with compare().
+"""
+import json, os, platform, statistics, time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from . import ffmpeg, telemetry
+from .broll import BRollSeg, encode_base_only, encode_with_overlays
+from .captions import burn_in_subtitles
+from .shrink import apply_shrink_pip
+
+DEFAULT_SIZES = ["640x360", "1280x720", "1920x1080"]
+DEFAULT_DURATIONS = [10.0, 60.0]
+SEGMENT_COUNTS = [1, 10, 50]
+FPS = 30
+REGRESSION_THRESHOLD = 0.10  # 10% slower than the baseline
+BITEXACT = ["-fflags", "+bitexact", "-flags:v", "+bitexact", "-flags:a", "+bitexact", "-map_metadata", "-1"]
+
+# ---------- fixtures ----------
+@dataclass
+class Fixtures:
+    size: str
+    duration: float
+    video: Path      # main video with a sine tone
+    broll: Path      # second clip for overlays / PiP backgrounds
+    image: Path      # still for image PiP / graphics
+    voice: Path
+    music: Path
+    srt: Path
+
+def _lavfi_video(out: Path, size: str, dur: float, pattern: str, freq: int):
+    if out.exists():
+        return
+    ffmpeg.run([
+        "ffmpeg", "-y",
+        "-f", "lavfi", "-i", f"{pattern}=size={size}:rate={FPS}:duration={dur}",
+        "-f", "lavfi", "-i", f"sine=frequency={freq}:sample_rate=48000:duration={dur}",
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", "23", "-pix_fmt", "yuv420p", "-g", str(FPS * 2),
+        "-c:a", "aac", "-b:a", "128k", *BITEXACT, "-shortest", out,
+    ], stage="fixture")
+
+def _lavfi_audio(out: Path, dur: float, freq: int):
+    if out.exists():
+        return
+    ffmpeg.run([
+        "ffmpeg", "-y", "-f", "lavfi", "-i", f"sine=frequency={freq}:sample_rate=48000:duration={dur}",
+        *BITEXACT, out,
+    ], stage="fixture")
+
+def _lavfi_image(out: Path, size: str):
+    if out.exists():
+        return
+    ffmpeg.run([
+        "ffmpeg", "-y", "-f", "lavfi", "-i", f"testsrc=size={size}:rate=1",
+        "-frames:v", "1", *BITEXACT, out,
+    ], stage="fixture")
+
+def _srt(out: Path, dur: float, every: float = 2.0):
+    def ts(t):
+        ms = int(round(t * 1000))
+        return f"{ms // 3600000:02d}:{ms // 60000 % 60:02d}:{ms // 1000 % 60:02d},{ms % 1000:03d}"
+    lines, t, i = [], 0.0, 1
+    while t < dur:
+        lines += [str(i), f"{ts(t)} --> {ts(min(dur, t + every))}", f"Benchmark caption {i}", ""]
+        t += every
+        i += 1
+    out.write_text("\n".join(lines), encoding="utf-8")
+
+def build_fixtures(root: Path, size: str, duration: float) -> Fixtures:
+    """Generate (or reuse) the fixture set for one size/duration under root."""
+    d = Path(root) / "fixtures" / f"{size}_{duration:g}s"
+    d.mkdir(parents=True, exist_ok=True)
+    fx = Fixtures(
+        size=size, duration=duration,
+        video=d / "main.mp4", broll=d / "broll.mp4", image=d / "still.png",
+        voice=d / "voice.wav", music=d / "music.m4a", srt=d / "captions.srt",
+    )
+    _lavfi_video(fx.video, size, duration, "testsrc2", 440)
+    _lavfi_video(fx.broll, size, duration, "smptehdbars", 660)
+    _lavfi_image(fx.image, "480x270")
+    _lavfi_audio(fx.voice, duration, 220)
+    _lavfi_audio(fx.music, duration, 330)
+    _srt(fx.srt, duration)
+    return fx
+
+# ---------- cases ----------
+def _segments(fx: Fixtures, n: int) -> List[BRollSeg]:
+    """n evenly spaced B-roll windows, each covering half its slot."""
+    slot = fx.duration / n
+    return [BRollSeg(t0=i * slot, t1=i * slot + slot / 2, clip_path=fx.broll) for i in range(n)]
+
+def _render_template(fx: Fixtures, workdir: Path):
+    import render  # repo-root script; writes output/video.mp4 relative to the cwd
+    template = Path(__file__).resolve().parent.parent / "template.json"
+    mapping = {
+        "INTRO_MP4": str(fx.video), "A_ROLL1": str(fx.video), "B_ROLL1": str(fx.broll),
+        "TITLE_PNG": str(fx.image), "LOWER_THIRD_PNG": str(fx.image),
+        "VOICEOVER_WAV": str(fx.voice), "MUSIC_MP3": str(fx.music), "CAPTIONS_SRT": str(fx.srt),
+    }
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        render.main(str(template), mapping)
+    finally:
+        os.chdir(cwd)
+
+def cases(fx: Fixtures, workdir: Path) -> List[Tuple[str, Callable[[], None]]]:
+    out = workdir / "out.mp4"
+    mid, half = fx.duration * 0.25, fx.duration * 0.5
+    items = [("encode_base_only", lambda: encode_base_only(fx.video, out))]
+    for n in SEGMENT_COUNTS:
+        items.append((f"encode_with_overlays[{n}]",
+                      lambda n=n: encode_with_overlays(fx.video, _segments(fx, n), out)))
+    items += [
+        ("shrink_pip", lambda: apply_shrink_pip(fx.video, out, mid, half)),
+        ("shrink_pip[video+zoom]", lambda: apply_shrink_pip(
+            fx.video, out, mid, half, overlay_path=fx.broll,
+            zoom_direction="center", zoom_start=mid + 1, zoom_end=mid + half - 1)),
+        ("shrink_pip[image]", lambda: apply_shrink_pip(fx.video, out, mid, half, overlay_path=fx.image)),
+        ("burn_in_subtitles", lambda: burn_in_subtitles(fx.video, fx.srt, out)),
+        ("render_template", lambda: _render_template(fx, workdir)),
+    ]
+    return items
+
+# ---------- running ----------
+def measure(fn: Callable[[], None], repeat: int) -> Dict:
+    walls, cpus, rss = [], [], []
+    for _ in range(repeat):
+        with telemetry.recording() as rec:
+            t0 = time.perf_counter()
+            fn()
+            walls.append(time.perf_counter() - t0)
+        cpus.append(sum(s.cpu_user_sec + s.cpu_sys_sec for s in rec.stages))
+        rss.append(max((s.max_rss_kb or 0 for s in rec.stages), default=0))
+    return {
+        "wall_sec": statistics.median(walls),
+        "wall_min_sec": min(walls),
+        "cpu_sec": statistics.median(cpus),
+        "max_rss_kb": max(rss),
+        "processes": len(rec.stages),
+    }
+
+def _ffmpeg_version() -> str:
+    try:
+        return ffmpeg.run(["ffmpeg", "-version"]).stdout.splitlines()[0]
+    except Exception:
+        return "unknown"
+
+def run_suite(workdir: Path, sizes: List[str] = DEFAULT_SIZES, durations: List[float] = DEFAULT_DURATIONS,
+              repeat: int = 3, only: Optional[str] = None, log=print) -> Dict:
+    """Run every case for every size/duration; failures are recorded, not raised."""
+    workdir = Path(workdir)
+    results = []
+    for size in sizes:
+        for dur in durations:
+            fx = build_fixtures(workdir, size, dur)
+            for name, fn in cases(fx, workdir):
+                if only and only not in name:
+                    continue
+                row = {"case": name, "size": size, "duration": dur}
+                try:
+                    row.update(measure(fn, repeat))
+                    log(f"{name:28s} {size:>9s} {dur:6.0f}s  {row['wall_sec']:8.2f}s wall  {row['cpu_sec']:8.2f}s cpu")
+                except Exception as e:
+                    row["error"] = str(getattr(e, "stderr", "") or e)[-500:]
+                    log(f"{name:28s} {size:>9s} {dur:6.0f}s  FAILED: {row['error'][-120:]}")
+                results.append(row)
+    return {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "host": platform.node(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "ffmpeg": _ffmpeg_version(),
+            "ffmpeg_threads": ffmpeg.THREADS,
+            "ffmpeg_max_procs": ffmpeg.MAX_PROCS,
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+# ---------- comparing ----------
+def _key(row) -> Tuple:
+    return (row["case"], row["size"], float(row["duration"]))
+
+def compare(baseline: Dict, current: Dict, threshold: float = REGRESSION_THRESHOLD) -> List[Dict]:
+    """Per-case wall-time ratios (current / baseline); `regressed` when slower than 1 + threshold."""
+    base = {_key(r): r for r in baseline["results"] if "wall_sec" in r}
+    rows = []
+    for r in current["results"]:
+        old = base.get(_key(r))
+        if not old or "wall_sec" not in r:
+            continue
+        ratio = r["wall_sec"] / old["wall_sec"] if old["wall_sec"] > 0 else 1.0
+        rows.append({
+            "case": r["case"], "size": r["size"], "duration": r["duration"],
+            "baseline_sec": old["wall_sec"], "current_sec": r["wall_sec"],
+            "ratio": ratio, "regressed": ratio > 1 + threshold,
+        })
+    return rows
+
+def load(path: Path) -> Dict:
+    return json.loads(Path(path).read_text())
+
+def save(report: Dict, path: Path):
+    Path(path).write_text(json.dumps(report, indent=2))
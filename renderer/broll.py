@@ -1,8 +1,12 @@
 # renderer/broll.py
-import subprocess, uuid
+import hashlib, os, uuid
 from dataclasses import dataclass
+from functools import partial
 from pathlib import Path
-from typing import List, Dict, Tuple, Iterable
+from typing import List, Dict, Tuple, Iterable, Optional, Callable
+
+from .ffmpeg import run
+from .pipeline import PIPE, Source, input_arg, output_args, render_stages
 
 # ===== Output / encode settings =====
 W, H, FPS = 1920, 1080, 30
@@ -10,20 +14,33 @@ CRF = 18
 AUDIO_BR = "192k"
 DEFAULT_FADE_IN = 0.25
 DEFAULT_FADE_OUT = 0.25
+XFADE_MIN = 1.0 / FPS  # blends shorter than a frame are hard cuts
+NORMALIZE = f"scale={W}:{H},fps={FPS},format=yuv420p,setsar=1"
 
 # ---------- low-level utils ----------
-def run(cmd: str):
-    return subprocess.run(cmd, capture_output=True, text=True, check=True, shell=True)
-
 def probe_duration_seconds(path: Path) -> float:
     """Return media duration in seconds (0 on failure)."""
-    cmd = f'ffprobe -v error -show_entries format=duration -of default=nw=1:nk=1 "{path}"'
-    res = subprocess.run(cmd, capture_output=True, text=True, check=True, shell=True)
+    cmd = ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=nw=1:nk=1", path]
+    res = run(cmd)
     try:
         return max(0.0, float(res.stdout.strip()))
     except Exception:
         return 0.0
 
+def media_fingerprint(path: Path, sample: int = 1 << 20) -> str:
+    """
+    Cheap content key for caching per-video analysis: size plus a hash of the
+    first and last `sample` bytes. Avoids reading multi-GB files end to end.
+    """
+    size = os.path.getsize(path)
+    h = hashlib.sha1(str(size).encode())
+    with open(path, "rb") as f:
+        h.update(f.read(sample))
+        if size > sample:
+            f.seek(max(sample, size - sample))
+            h.update(f.read(sample))
+    return h.hexdigest()
+
 @dataclass
 class BRollSeg:
     t0: float
@@ -45,11 +62,16 @@ def save_uploaded_file(upload, dest_dir: Path) -> Path:
 def build_segments_from_rows(
     files: Iterable, starts: Iterable[str], durs: Iterable[str],
     upload_dir: Path, video_dur: float,
-    fade_in: float = DEFAULT_FADE_IN, fade_out: float = DEFAULT_FADE_OUT
+    fade_in: float = DEFAULT_FADE_IN, fade_out: float = DEFAULT_FADE_OUT,
+    cuts: Optional[List[float]] = None,
+    time_map: Optional[Callable[[float], float]] = None,
 ) -> Tuple[List[BRollSeg], List[str]]:
     """
-    Aligns b-roll rows by index (DOM order), saves files, clamps to video duration,
+    Aligns b-roll rows by index (DOM order), saves files (rows may also be paths of
+    already-stored files), clamps to video duration,
     returns non-overlapping, sorted segments + human-readable debug lines.
+    `time_map` converts row times onto the rendered timeline (e.g. after silence trimming).
+    If `cuts` (scene-cut times) are given, start/end are snapped to nearby cuts.
     """
     segs: List[BRollSeg] = []
     debug: List[str] = []
@@ -70,12 +92,21 @@ def build_segments_from_rows(
         if dur <= 0:
             debug.append(f"Row {i+1}: duration <= 0 → skipped")
             continue
-        t1 = min(video_dur, t0 + dur)
+        t1 = t0 + dur
+        if time_map:
+            t0, t1 = time_map(t0), time_map(t1)
+        t1 = min(video_dur, t1)
+        if cuts:
+            from .scenes import snap_to_cut
+            s0, s1 = snap_to_cut(t0, cuts), min(video_dur, snap_to_cut(t1, cuts))
+            if (s0, s1) != (t0, t1):
+                debug.append(f"Row {i+1}: snapped {t0:.2f}–{t1:.2f} → {s0:.2f}–{s1:.2f}")
+            t0, t1 = s0, s1
         if t1 <= t0:
             debug.append(f"Row {i+1}: end <= start after clamp → skipped")
             continue
 
-        clip_path = save_uploaded_file(br, upload_dir)
+        clip_path = br if isinstance(br, Path) else save_uploaded_file(br, upload_dir)
         segs.append(BRollSeg(t0=t0, t1=t1, clip_path=clip_path, fade_in=fade_in, fade_out=fade_out))
         debug.append(f"{t0:.2f}–{t1:.2f} → {clip_path.name}")
 
@@ -90,57 +121,151 @@ def build_segments_from_rows(
     return pruned, debug
 
 # ---------- ffmpeg filter graph ----------
-def build_overlay_graph(base_path: Path, segs: List[BRollSeg]) -> Tuple[str, str, str]:
+def _base_windows(base_path: Source, windows: List[Tuple[float, Optional[float]]]) -> Tuple[List[str], List[str], List[str]]:
     """
-    Returns (inputs, filter_complex, final_video_label).
-    Each B-roll is trimmed to its duration, time-shifted to absolute t0,
-    faded in/out, and overlaid ONLY between [t0, t1] (enable=between).
+    Normalized base-video streams for each (start, end) window, each starting at t=0.
+    The base is decoded once and split, and each window is trimmed out of it, so one
+    decoder serves every window however many clips there are. A file is input-seeked to
+    the first window (previews only decode their part); a pipe keeps its timestamps.
+    Returns (input args, filter chains, labels).
     """
-    inputs = [f'-i "{base_path}"']
-    chains = [f"[0:v]scale={W}:{H},fps={FPS},format=yuv420p,setsar=1[base]"]
-    last = "[base]"
-    in_idx = 1
+    if base_path == PIPE:
+        inputs, origin = input_arg(base_path), 0.0
+    else:
+        origin, last = windows[0][0], windows[-1][1]
+        inputs = ["-ss", f"{origin:.3f}"] if origin else []
+        if last is not None:
+            inputs += ["-t", f"{last - origin:.3f}"]
+        inputs += ["-i", str(base_path)]
+    outs = "".join(f"[w{k}]" for k in range(len(windows)))
+    chains = [f"[0:v]{NORMALIZE},split={len(windows)}{outs}"]
+    labels = []
+    for k, (a, b) in enumerate(windows):
+        end = f":end={b - origin:.3f}" if b is not None else ""
+        chains.append(f"[w{k}]trim=start={a - origin:.3f}{end},setpts=PTS-STARTPTS[base{k}]")
+        labels.append(f"[base{k}]")
+    return inputs, chains, labels
 
-    for i, seg in enumerate(segs):
-        dur = seg.t1 - seg.t0
-        if dur <= 0:
+def _edge(seconds: float, dur: float) -> float:
+    """Blend length that fits the segment; very short blends become hard cuts."""
+    seconds = min(max(seconds, 0.0), dur / 2)
+    return seconds if seconds >= XFADE_MIN else 0.0
+
+def expand_window(window: Tuple[float, float], segs: List[BRollSeg]) -> Tuple[float, float]:
+    """Grow [w0, w1] so it never cuts through a B-roll segment; its blends then render exactly."""
+    w0, w1 = window
+    for s in segs:
+        if s.t0 < w0 < s.t1:
+            w0 = s.t0
+        if s.t0 < w1 < s.t1:
+            w1 = s.t1
+    return max(0.0, w0), w1
+
+def build_timeline_graph(base_path: Source, segs: List[BRollSeg],
+                         window: Optional[Tuple[float, float]] = None) -> Tuple[List[str], str, str]:
+    """
+    Returns (input args, filter_complex, final_video_label).
+
+    B-roll is full-frame and opaque, so instead of overlaying every clip over the whole
+    timeline the output *switches* source: base | broll 1 | base | broll 2 | ... joined by
+    a single concat, with xfade blends against the base only at each clip's edges.
+    Only the piece that is playing gets decoded and filtered, so per-frame cost stays flat
+    however many clips there are. base_path may be PIPE (previous pipeline stage).
+
+    With a window (w0, w1) only that part of the timeline is rendered (widened to whole
+    B-roll segments), and frames keep their absolute timestamps, so later stages' enable/
+    fade times still line up. Used for previews.
+    """
+    w0, w1 = expand_window(window, segs) if window else (0.0, None)
+    segs = [s for s in segs if s.t1 > s.t0 and s.t1 > w0 and (w1 is None or s.t0 < w1)]
+    fades = [(_edge(s.fade_in, s.t1 - s.t0), _edge(s.fade_out, s.t1 - s.t0)) for s in segs]
+
+    # Base window k runs from the previous clip's fade-out to the next clip's fade-in:
+    # [head: blends out of clip k-1][gap: plain base][tail: blends into clip k]
+    windows = []
+    for k in range(len(segs) + 1):
+        a = segs[k - 1].t1 - fades[k - 1][1] if k > 0 else w0
+        b = segs[k].t0 + fades[k][0] if k < len(segs) else w1
+        windows.append((a, b))
+    inputs, chains, base_labels = _base_windows(base_path, windows)
+
+    heads, gaps, tails = {}, {}, {}
+    for k, label in enumerate(base_labels):
+        head = fades[k - 1][1] if k > 0 else 0.0
+        a, b = windows[k]
+        gap_end = segs[k].t0 - a if k < len(segs) else (b - a if b is not None else None)
+        tail = fades[k][0] if k < len(segs) else 0.0
+        pieces = []
+        if head:
+            pieces.append(("h", f"trim=end={head:.3f}"))
+        if gap_end is None or gap_end - head > 0:
+            end = f":end={gap_end:.3f}" if gap_end is not None else ""
+            pieces.append(("g", f"trim=start={head:.3f}{end}"))
+        if tail:
+            pieces.append(("t", f"trim=start={gap_end:.3f}"))
+        if not pieces:
+            chains.append(f"{label}nullsink")
             continue
-        inputs.append(f'-i "{seg.clip_path}"')
-        chains.append(
-            f"[{in_idx}:v]"
-            f"scale={W}:{H},fps={FPS},format=rgba,"
-            f"trim=0:{dur:.3f},setpts=PTS-STARTPTS,"
-            f"setpts=PTS+{seg.t0}/TB,"
-            f"fade=t=in:st={seg.t0:.3f}:d={seg.fade_in:.3f}:alpha=1,"
-            f"fade=t=out:st={(seg.t1 - seg.fade_out):.3f}:d={seg.fade_out:.3f}:alpha=1"
-            f"[b{i}]"
-        )
+        if len(pieces) > 1:
+            chains.append(f"{label}split={len(pieces)}" + "".join(f"[s{k}{p}]" for p, _ in pieces))
+        for p, trim in pieces:
+            src = f"[s{k}{p}]" if len(pieces) > 1 else label
+            chains.append(f"{src}{trim},setpts=PTS-STARTPTS[{p}{k}]")
+        heads[k] = "[h%d]" % k if head else None
+        gaps[k] = "[g%d]" % k if any(p == "g" for p, _ in pieces) else None
+        tails[k] = "[t%d]" % k if tail else None
+
+    concat = []
+    in_idx = 1  # input 0 is the base
+    for k in range(len(segs) + 1):
+        if gaps.get(k):
+            concat.append(gaps[k])
+        if k == len(segs):
+            break
+        seg, (fi, fo) = segs[k], fades[k]
+        dur = seg.t1 - seg.t0
+        inputs += ["-t", f"{dur:.3f}", "-i", str(seg.clip_path)]
+        # Hold the last frame if the clip is shorter than its slot, so the timeline never shifts
         chains.append(
-            f"{last}[b{i}]overlay=x=0:y=0:format=auto:eof_action=pass:"
-            f"enable='between(t,{seg.t0:.3f},{seg.t1:.3f})'[v{i}]"
+            f"[{in_idx}:v]{NORMALIZE},setpts=PTS-STARTPTS,"
+            f"tpad=stop_mode=clone:stop_duration={dur:.3f},trim=end={dur:.3f}[c{k}]"
         )
-        last = f"[v{i}]"
         in_idx += 1
+        last = f"[c{k}]"
+        if fi:
+            chains.append(f"{tails[k]}{last}xfade=transition=fade:duration={fi:.3f}:offset=0[ci{k}]")
+            last = f"[ci{k}]"
+        if fo:
+            chains.append(f"{last}{heads[k + 1]}xfade=transition=fade:duration={fo:.3f}:offset={dur - fo:.3f}[co{k}]")
+            last = f"[co{k}]"
+        concat.append(last)
+
+    shift = f",setpts=PTS+{w0:.3f}/TB" if w0 else ""
+    chains.append(f"{''.join(concat)}concat=n={len(concat)}:v=1:a=0{shift}[vout]")
+    return inputs, ";".join(chains), "[vout]"
+
+# ---------- stage commands ----------
+def build_overlay_cmd(base_path: Source, out_path: Optional[Path], segs: List[BRollSeg],
+                      window: Optional[Tuple[float, float]] = None) -> List[str]:
+    """B-roll stage; out_path=None writes NUT frames to stdout for the next stage."""
+    ff_inputs, filter_complex, last_label = build_timeline_graph(base_path, segs, window)
+    return [
+        "ffmpeg", "-y", *ff_inputs,
+        "-filter_complex", filter_complex,
+        "-map", last_label,
+        *output_args(out_path, CRF),
+    ]
 
-    return " ".join(inputs), ";".join(chains), last
+def build_base_only_cmd(base_path: Source, out_path: Optional[Path]) -> List[str]:
+    return [
+        "ffmpeg", "-y", *input_arg(base_path),
+        "-vf", NORMALIZE,
+        *output_args(out_path, CRF),
+    ]
 
 # ---------- encoders ----------
 def encode_with_overlays(base_path: Path, segs: List[BRollSeg], out_path: Path):
-    ff_inputs, filter_complex, last_label = build_overlay_graph(base_path, segs)
-    cmd = (
-        f'ffmpeg -y {ff_inputs} '
-        f'-filter_complex "{filter_complex}" '
-        f'-map "{last_label}" -map 0:a? '
-        f'-c:v libx264 -preset medium -crf {CRF} '
-        f'-c:a aac -b:a {AUDIO_BR} -movflags +faststart "{out_path}"'
-    )
-    run(cmd)
+    render_stages(base_path, [partial(build_overlay_cmd, segs=segs)], out_path, audio_br=AUDIO_BR)
 
 def encode_base_only(base_path: Path, out_path: Path):
-    cmd = (
-        f'ffmpeg -y -i "{base_path}" '
-        f'-vf "scale={W}:{H},fps={FPS},format=yuv420p,setsar=1" '
-        f'-c:v libx264 -preset medium -crf {CRF} '
-        f'-c:a aac -b:a {AUDIO_BR} -movflags +faststart "{out_path}"'
-    )
-    run(cmd)
+    render_stages(base_path, [build_base_only_cmd], out_path, audio_br=AUDIO_BR)
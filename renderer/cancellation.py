@@ -0,0 +1,67 @@
+# renderer/cancellation.py
+"""
+Cancelling renders started from the form (those run inside the POST request itself).
+
+The form posts a random render token with each render. When the page is closed or the
+form is submitted again, the browser beacons the previous token to /render/cancel/,
+which drops a marker file under MEDIA_ROOT/cancel/ (seen by every web process and node).
+The request rendering with that token watches for its marker and kills its ffmpeg
+processes (ffmpeg.cancellable); in-process work such as whisper finishes its step first.
+"""
+import re, threading
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+
+from django.conf import settings
+
+from . import ffmpeg
+
+TOKEN_RE = re.compile(r"^[0-9a-f]{32}$")
+WATCH_SECONDS = 0.5
+
+def marker_dir() -> Path:
+    return Path(settings.MEDIA_ROOT) / "cancel"
+
+def marker_path(token: str) -> Path:
+    if not TOKEN_RE.match(token or ""):
+        raise ValueError("Bad render token")
+    return marker_dir() / token
+
+def request_cancel(token: str):
+    path = marker_path(token)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.touch()
+
+@contextmanager
+def watching(token: str):
+    """Cancel ffmpeg started in this context once the token's marker appears; the marker is removed afterwards."""
+    path = marker_path(token)
+    cancelled, done = threading.Event(), threading.Event()
+
+    def watch():
+        while not path.exists():
+            if done.wait(WATCH_SECONDS):
+                return
+        cancelled.set()
+
+    thread = threading.Thread(target=watch, name=f"cancel-{token[:8]}", daemon=True)
+    thread.start()
+    try:
+        with ffmpeg.cancellable(cancelled):
+            yield cancelled
+    finally:
+        done.set()
+        thread.join()
+        path.unlink(missing_ok=True)
+
+def cancellable_render(view):
+    """View decorator: a POST carrying a render_token can be stopped with request_cancel(token)."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        token = request.POST.get("render_token", "") if request.method == "POST" else ""
+        if not TOKEN_RE.match(token):
+            return view(request, *args, **kwargs)
+        with watching(token):
+            return view(request, *args, **kwargs)
+    return wrapper
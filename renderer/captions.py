@@ -1,9 +1,10 @@
 # --- captions helpers ---
-import subprocess, tempfile
+from functools import partial
 from pathlib import Path
+from typing import List, Optional
 
-def _run(cmd: str):
-    return subprocess.run(cmd, capture_output=True, text=True, check=True, shell=True)
+from .ffmpeg import run
+from .pipeline import Source, input_arg, output_args, render_stages
 
 def transcribe_to_srt(media_path: Path, model_size: str = "base") -> Path:
     """
@@ -66,21 +67,29 @@ def burn_in_subtitles(input_path: Path, srt_path: Path, out_path: Path, W=1920,
     Burn subtitles onto video (hard subs) using libass renderer.
     Works well for styled subtitles (CapCut-like look can be achieved with ASS).
     """
+    stage = partial(build_burn_in_cmd, srt_path=srt_path, W=W, H=H, FPS=FPS, CRF=CRF)
+    render_stages(input_path, [stage], out_path, audio_br=AUDIO_BR)
+
+def build_burn_in_cmd(input_path: Source, out_path: Optional[Path], srt_path: Path,
+                      W=1920, H=1080, FPS=30, CRF=18) -> List[str]:
+    """Caption stage command; input_path may be PIPE and out_path None for piped use."""
     # Note: You can force styles via ASS (convert SRT→ASS for richer styling).
-    cmd = (
-        f'ffmpeg -y -i "{input_path}" -vf '
-        f'"scale={W}:{H},fps={FPS},format=yuv420p,setsar=1,subtitles={srt_path.as_posix()}:force_style=\'FontSize=28\'" '
-        f'-c:v libx264 -preset medium -crf {CRF} -c:a aac -b:a {AUDIO_BR} -movflags +faststart "{out_path}"'
-    )
-    _run(cmd)
+    return [
+        "ffmpeg", "-y", *input_arg(input_path),
+        "-vf", f"scale={W}:{H},fps={FPS},format=yuv420p,setsar=1,"
+               f"subtitles={srt_path.as_posix()}:force_style='FontSize=28'",
+        *output_args(out_path, CRF),
+    ]
 
 def mux_soft_subtitles(input_path: Path, srt_path: Path, out_path: Path, CRF=18, AUDIO_BR="192k"):
     """
     Keep captions as a selectable track (not burned in). For MP4: mov_text.
     """
-    cmd = (
-        f'ffmpeg -y -i "{input_path}" -i "{srt_path}" -c:v libx264 -preset medium -crf {CRF} '
-        f'-c:a aac -b:a {AUDIO_BR} -c:s mov_text -map 0:v -map 0:a? -map 1:s:0 '
-        f'-movflags +faststart "{out_path}"'
-    )
-    _run(cmd)
+    cmd = [
+        "ffmpeg", "-y", "-i", input_path, "-i", srt_path,
+        "-c:v", "libx264", "-preset", "medium", "-crf", str(CRF),
+        "-c:a", "aac", "-b:a", AUDIO_BR, "-c:s", "mov_text",
+        "-map", "0:v", "-map", "0:a?", "-map", "1:s:0",
+        "-movflags", "+faststart", out_path,
+    ]
+    run(cmd, stage="soft_subtitles")
@@ -0,0 +1,148 @@
+# renderer/coalesce.py
+"""
+Coalescing of duplicate form renders (double-clicks, browser retries).
+
+A submission's key hashes its parameters and its inputs' content: uploaded files and the
+pre-production video by size plus their first and last MB (like broll.media_fingerprint),
+chunked-upload assets by id (immutable once complete). Keys are scoped to the submitting
+browser (its CSRF cookie), since the page sent back embeds that browser's CSRF token.
+
+The first request with a key renders while holding an flock on FLIGHT_DIR/<key>.flight
+and leaves its response in that file. A duplicate arriving meanwhile waits for the lock
+and answers with the same response, so the video is rendered once. Locks are host-wide,
+like the ffmpeg slots, and released if the process dies; a duplicate whose render left
+no response (crashed, cancelled) renders itself.
+
+The form posts the token of the render it replaces as previous_render_token: a different
+submission cancels that render, a duplicate attaches to it instead (and cancels it if
+the page is closed while waiting).
+"""
+import fcntl, hashlib, json, os, tempfile, time
+from functools import wraps
+from pathlib import Path
+from typing import Optional
+
+from django.conf import settings
+from django.http import HttpResponse
+
+from . import cancellation, ffmpeg
+from .broll import media_fingerprint
+
+FLIGHT_DIR = os.path.join(tempfile.gettempdir(), "videocreator-render-flights")
+POLL_SECONDS = 0.5
+STALE_SECONDS = 24 * 3600
+SAMPLE_BYTES = 1 << 20
+IGNORED_FIELDS = {"csrfmiddlewaretoken", "render_token", "previous_render_token"}
+
+# ---------- keys ----------
+def _upload_fingerprint(f) -> str:
+    """media_fingerprint() for an uploaded (not yet saved) file; leaves it rewound."""
+    h = hashlib.sha1(str(f.size).encode())
+    f.seek(0)
+    h.update(f.read(SAMPLE_BYTES))
+    if f.size > SAMPLE_BYTES:
+        f.seek(max(SAMPLE_BYTES, f.size - SAMPLE_BYTES))
+        h.update(f.read(SAMPLE_BYTES))
+    f.seek(0)
+    return h.hexdigest()
+
+def _preprod_path(value: str) -> Path:
+    # same URL -> path mapping as views.process_main_video
+    if value.startswith(settings.MEDIA_URL):
+        return Path(settings.MEDIA_ROOT) / value[len(settings.MEDIA_URL):]
+    return Path(value)
+
+def submission_key(request) -> str:
+    """Canonical hash of a render form submission: parameters plus input content."""
+    parts = {
+        "client": request.COOKIES.get(settings.CSRF_COOKIE_NAME) or request.META.get("REMOTE_ADDR", ""),
+        "params": {k: request.POST.getlist(k) for k in request.POST if k not in IGNORED_FIELDS},
+        "files": {k: [_upload_fingerprint(f) for f in request.FILES.getlist(k)] for k in request.FILES},
+    }
+    preprod = request.POST.get("use_preprod_main")
+    if preprod and _preprod_path(preprod).is_file():
+        parts["preprod"] = media_fingerprint(_preprod_path(preprod))
+    return hashlib.sha1(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+# ---------- flight files ----------
+def _try_lock(fd: int) -> bool:
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        return False
+
+def _read(fd: int) -> dict:
+    try:
+        return json.loads(os.pread(fd, os.fstat(fd).st_size, 0) or b"{}")
+    except ValueError:
+        return {}  # being rewritten
+
+def _write(fd: int, data: dict):
+    os.ftruncate(fd, 0)
+    os.pwrite(fd, json.dumps(data).encode(), 0)
+
+def _sweep():
+    """Remove flight files nobody has used for STALE_SECONDS (skipping any that are locked)."""
+    now = time.time()
+    for path in Path(FLIGHT_DIR).glob("*.flight"):
+        try:
+            if now - path.stat().st_mtime < STALE_SECONDS:
+                continue
+            fd = os.open(path, os.O_RDWR)
+        except FileNotFoundError:
+            continue
+        try:
+            if _try_lock(fd):
+                path.unlink(missing_ok=True)
+        finally:
+            os.close(fd)
+
+def _stored(response) -> Optional[dict]:
+    if response.streaming or ffmpeg.cancelled():
+        return None  # a cancelled render's page is not an answer for the duplicate
+    return {"status": response.status_code, "content_type": response.get("Content-Type", ""),
+            "body": response.content.decode(response.charset or "utf-8")}
+
+# ---------- view decorator ----------
+def coalesced(view):
+    """View decorator: a render POST identical to one in flight waits for it and returns the same page."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method != "POST" or request.POST.get("submit_completed") == "true":
+            return view(request, *args, **kwargs)
+        token = request.POST.get("render_token", "")
+        previous = request.POST.get("previous_render_token", "")
+        previous = previous if cancellation.TOKEN_RE.match(previous) else ""
+        os.makedirs(FLIGHT_DIR, exist_ok=True)
+        fd = os.open(os.path.join(FLIGHT_DIR, f"{submission_key(request)}.flight"), os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            arrived = time.time()
+            waited = False
+            while not _try_lock(fd):
+                waited = True
+                if ffmpeg.cancelled():
+                    # the page went away while waiting; stop the render it was attached to
+                    leader = _read(fd).get("token", "")
+                    if previous and leader == previous:
+                        cancellation.request_cancel(previous)
+                    return HttpResponse("Render cancelled", status=409, content_type="text/plain")
+                time.sleep(POLL_SECONDS)
+            try:
+                done = _read(fd).get("response") if waited and os.fstat(fd).st_mtime >= arrived else None
+                if done:
+                    return HttpResponse(done["body"], status=done["status"], content_type=done["content_type"])
+                if previous and previous != token:
+                    cancellation.request_cancel(previous)  # replaced by a different submission
+                _sweep()
+                _write(fd, {"token": token})
+                response = view(request, *args, **kwargs)
+                stored = _stored(response)
+                if stored:
+                    _write(fd, {"token": token, "response": stored})
+                return response
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+    return wrapper
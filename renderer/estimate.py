@@ -0,0 +1,204 @@
+# renderer/estimate.py
+"""
+Dry-run planner: predict a render's wall time per stage, peak scratch disk and output
+size without running ffmpeg.
+
+Durations come from the cached probe metadata (renderer/mediainfo.py) and the silence /
+scene / transcript caches; speeds come from past RenderStages (wall seconds per second
+of source), preferring this host's history, then every host's, then DEFAULT_RATES.
+Inputs that were never probed are sized from their file size and the estimate is
+flagged approximate.
+"""
+import json, socket
+from collections import defaultdict
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from statistics import median
+from typing import Dict, List, Mapping, Optional
+
+from django.conf import settings
+
+from .broll import media_fingerprint
+from .mediainfo import media_info
+from .models import RenderStage
+from .timeline import TimelineSpec, resolve_assets
+from .workspace import EST_BYTES_PER_SEC
+
+# Wall seconds per second of source, used until a host has history for a stage
+DEFAULT_RATES = {
+    "overlay": 0.5,
+    "base_only": 0.3,
+    "shrink_pip": 0.4,
+    "burn_in": 0.4,
+    "mux_audio": 0.02,
+    "silence_detect": 0.02,
+    "silence_trim": 0.02,
+    "scene_detect": 0.1,
+    "keyframe_scan": 0.005,
+    "transcribe": 0.5,
+    "concat_chunks": 0.01,
+    "fanout": 0.4,
+    "loudnorm": 0.01,
+    "template_encode": 0.8,
+}
+MIN_SAMPLES = 3       # samples needed before a host's own history is trusted
+HISTORY_ROWS = 2000   # most recent successful stages considered
+
+# ---------- throughput history ----------
+def _history(names) -> List[tuple]:
+    return list(
+        RenderStage.objects.filter(name__in=list(names), returncode=0, run__source_duration__gt=0)
+        .order_by("-run__created_at")
+        .values_list("name", "run__host", "wall_sec", "output_bytes", "run__source_duration")[:HISTORY_ROWS]
+    )
+
+def stage_rates(names, host: Optional[str] = None) -> Dict[str, tuple]:
+    """name -> (wall sec per source sec, basis), basis being "host", "all hosts" or "default"."""
+    host = host or socket.gethostname()
+    mine, every = defaultdict(list), defaultdict(list)
+    for name, run_host, wall, _, src in _history(names):
+        every[name].append(wall / src)
+        if run_host == host:
+            mine[name].append(wall / src)
+    rates = {}
+    for name in names:
+        if len(mine[name]) >= MIN_SAMPLES:
+            rates[name] = (median(mine[name]), "host")
+        elif len(every[name]) >= MIN_SAMPLES:
+            rates[name] = (median(every[name]), "all hosts")
+        else:
+            rates[name] = (DEFAULT_RATES.get(name, 1.0), "default")
+    return rates
+
+def output_bytes_per_sec() -> float:
+    """Final file bytes per source second, from past mux_audio stages."""
+    sizes = [out / src for *_, out, src in _history(["mux_audio"]) if out]
+    return median(sizes) if len(sizes) >= MIN_SAMPLES else EST_BYTES_PER_SEC
+
+# ---------- estimates ----------
+@dataclass
+class StageEstimate:
+    name: str
+    seconds: float
+    basis: str
+
+@dataclass
+class Estimate:
+    duration_sec: float
+    stages: List[StageEstimate] = field(default_factory=list)
+    wall_sec: float = 0.0
+    output_bytes: int = 0
+    peak_scratch_bytes: int = 0
+    approximate: bool = False
+    notes: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+def _add(est: Estimate, rates: Dict[str, tuple], name: str, source_sec: float):
+    rate, basis = rates[name]
+    est.stages.append(StageEstimate(name, round(rate * source_sec, 2), basis))
+
+def _duration(path: Path, est: Estimate) -> float:
+    """Cached duration; a never-probed file is sized by its bytes and marks the estimate approximate."""
+    path = Path(path)
+    info = media_info(path, probe=False) if path.exists() else None
+    if info and info.get("duration"):
+        return info["duration"]
+    est.approximate = True
+    if not path.exists():
+        est.notes.append(f"{path} not found")
+        return 0.0
+    est.notes.append(f"{path.name} not probed yet; duration guessed from file size")
+    return path.stat().st_size / EST_BYTES_PER_SEC
+
+def _cached_trim(main_path: Path, padding: float):
+    """(base path, duration) from preview.cached_trim's metadata, or None if silence was never analysed."""
+    meta = (Path(settings.MEDIA_ROOT) / "cache" / "trimmed"
+            / f"{media_fingerprint(main_path)}_{padding:.3f}" / "keeps.json")
+    try:
+        data = json.loads(meta.read_text())
+        return Path(data["path"] or main_path), float(data["dur"])
+    except Exception:
+        return None
+
+def estimate_spec(spec: TimelineSpec, host: Optional[str] = None) -> Estimate:
+    """Predict a timeline render (the same steps render_timeline / the farm would run)."""
+    paths = resolve_assets(spec)
+    main_path = paths[spec.main_asset]
+    est = Estimate(duration_sec=0.0)
+    source_dur = _duration(main_path, est)
+    base, dur, trimmed = main_path, source_dur, False
+
+    pipeline = ["overlay" if spec.broll else "base_only"] + ["shrink_pip"] * len(spec.pip)
+    if spec.captions:
+        pipeline.append("burn_in")
+    if spec.outputs:
+        pipeline.append("fanout")
+    rates = stage_rates(set(DEFAULT_RATES) | set(pipeline), host)
+
+    # Preparation runs before the pipeline, one step after another; cached steps are free
+    if spec.trim_silence:
+        cached = _cached_trim(main_path, spec.silence_padding)
+        if cached is None:
+            _add(est, rates, "silence_detect", source_dur)
+            _add(est, rates, "silence_trim", source_dur)
+            trimmed = True
+            est.approximate = True
+            est.notes.append("silence not analysed yet; trimmed length unknown, using the full length")
+        else:
+            base, dur = cached
+    # Scene and transcript caches belong to the (trimmed) base; a new trim has neither
+    if spec.snap_broll or spec.snap_pip:
+        scenes = Path(settings.MEDIA_ROOT) / "cache" / "scenes" / f"{media_fingerprint(base)}.json"
+        if trimmed or not scenes.exists():
+            _add(est, rates, "scene_detect", dur)
+    if spec.captions and (trimmed or not Path(base).with_suffix(".auto.srt").exists()):
+        _add(est, rates, "transcribe", dur)
+
+    # The stages stream into each other, so the slowest one sets the pace
+    slowest = max(pipeline, key=lambda n: rates[n][0])
+    _add(est, rates, slowest, dur)
+    est.stages[-1].name = "+".join(pipeline)
+    _add(est, rates, "mux_audio", dur)
+
+    est.duration_sec = round(dur, 3)
+    est.output_bytes = int(dur * output_bytes_per_sec())
+    # extra targets: roughly proportional to their pixel count
+    est.output_bytes += sum(int(est.output_bytes * t.width * t.height / (1920 * 1080)) for t in spec.outputs)
+    # a trimmed copy of the main video, plus the video-only intermediate and the muxed output
+    trim_copy = main_path.stat().st_size if trimmed and main_path.exists() else 0
+    est.peak_scratch_bytes = trim_copy + 2 * est.output_bytes
+    est.wall_sec = round(sum(s.seconds for s in est.stages), 2)
+    return est
+
+def estimate_template(template_path: Path, mapping: Mapping[str, str], host: Optional[str] = None) -> Estimate:
+    """Predict a render.py run: music loudness normalisation, then one encode of the whole timeline."""
+    tpl = Path(template_path).read_text()
+    for k, v in mapping.items():
+        tpl = tpl.replace("{{" + k + "}}", v)
+    spec = json.loads(tpl)
+    tracks = spec["tracks"]
+    est = Estimate(duration_sec=0.0)
+    dur = max(
+        [v.get("at", 0) + v["out"] - v["in"] for v in tracks["video"]]
+        + [g["at"] + g["duration"] for g in tracks["graphics"]]
+        + [0.0]
+    )
+    for v in tracks["video"]:
+        if not Path(v["src"]).exists():
+            est.approximate = True
+            est.notes.append(f"{v['src']} not found")
+    rates = stage_rates(["loudnorm", "template_encode"], host)
+    music = [a for a in tracks["audio"] if a.get("id") == "music"]
+    if music and Path(music[0]["src"]).exists():
+        _add(est, rates, "loudnorm", _duration(Path(music[0]["src"]), est))
+    else:
+        _add(est, rates, "loudnorm", dur)
+    _add(est, rates, "template_encode", dur)
+
+    est.duration_sec = round(dur, 3)
+    est.output_bytes = int(dur * output_bytes_per_sec())
+    est.peak_scratch_bytes = est.output_bytes
+    est.wall_sec = round(sum(s.seconds for s in est.stages), 2)
+    return est
@@ -0,0 +1,269 @@
+# renderer/farm.py
+"""
+Render farm: any number of worker processes, on any number of nodes, share the job
+table and MEDIA_ROOT.
+
+Workers claim RenderJob / RenderChunk rows with a compare-and-swap UPDATE (works the
+same on SQLite and Postgres) and keep a lease on them alive from a heartbeat thread. A
+row whose lease runs out (worker killed, node lost) goes back to the queue on the next
+sweep, up to RENDER_MAX_ATTEMPTS claims. Cancelling a job (jobs.cancel) takes the row out
+of RUNNING; the heartbeat notices within CANCEL_POLL_SECONDS and the worker's ffmpeg
+processes are killed.
+
+Long renders are split into chunks at keyframes. Any worker may render a chunk (the
+preview's windowed stages, at full quality); the job's owner renders chunks too while it
+waits, then stitches them with a stream-copy concat and muxes the audio once.
+
+Media must live on storage every node mounts at the same MEDIA_ROOT (e.g. NFS);
+scratch (RENDER_SCRATCH_DIR) stays node-local.
+"""
+import os, shutil, socket, threading, time
+from datetime import timedelta
+from functools import partial
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+
+from . import ffmpeg, preflight, preview, scheduler, telemetry
+from .broll import CRF, FPS
+from .ffmpeg import run, run_pipeline
+from .keyframes import KeyframeIndex
+from .mediainfo import media_duration
+from .models import RenderChunk, RenderJob
+from .pipeline import Stage, build_pipeline, mux_audio
+from .telemetry import stage_name
+from .timeline import TimelineSpec, load_keyframes, render_timeline, resolve_assets, save_render_rows
+from .workspace import open_workspace, scratch_files
+
+CLAIM_BATCH = 10     # candidates tried per claim before giving up until the next poll
+POLL_SECONDS = 2.0
+CANCEL_POLL_SECONDS = 2.0  # how often a lease checks that its row is still ours
+MAX_ERROR_CHARS = 2000
+
+def lease_seconds() -> float:
+    return float(getattr(settings, "RENDER_LEASE_SECONDS", 60))
+
+def max_attempts() -> int:
+    return int(getattr(settings, "RENDER_MAX_ATTEMPTS", 3))
+
+def chunk_seconds() -> float:
+    return float(getattr(settings, "RENDER_CHUNK_SECONDS", 0))
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+class LeaseLost(RuntimeError):
+    pass
+
+# ---------- claiming ----------
+def requeue_expired(model) -> int:
+    """Put RUNNING rows whose lease lapsed back in the queue; fail them after max_attempts() claims."""
+    now = timezone.now()
+    expired = model.objects.filter(status=model.RUNNING, lease_expires_at__lt=now)
+    failed = expired.filter(attempts__gte=max_attempts()).update(
+        status=model.FAILED, error="Worker lost (lease expired) too many times.",
+        lease_expires_at=None, finished_at=now,
+    )
+    return failed + expired.update(status=model.QUEUED, worker="", lease_expires_at=None)
+
+def claim(model, worker: str, queryset=None, classes=None):
+    """Atomically take the next QUEUED row in scheduler order (of queryset, default all); returns it or None."""
+    for pk in scheduler.claim_order(model, queryset, classes)[:CLAIM_BATCH]:
+        now = timezone.now()
+        taken = model.objects.filter(pk=pk, status=model.QUEUED).update(
+            status=model.RUNNING, worker=worker, attempts=F("attempts") + 1, started_at=now,
+            heartbeat_at=now, lease_expires_at=now + timedelta(seconds=lease_seconds()),
+        )
+        if taken:
+            return model.objects.get(pk=pk)
+    return None
+
+class Lease:
+    """
+    Renews a claimed row's lease from a background thread until the with-block ends.
+    `lost` is set as soon as the row stops being this worker's RUNNING row (cancelled, or
+    requeued after a lapse); pass it to ffmpeg.cancellable() to stop the work with it.
+    """
+    def __init__(self, obj, worker: str):
+        self.model, self.pk, self.worker = type(obj), obj.pk, worker
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._beat, name=f"lease-{obj.pk}", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+
+    def _mine(self):
+        return self.model.objects.filter(pk=self.pk, worker=self.worker, status=self.model.RUNNING)
+
+    def renew(self) -> bool:
+        now = timezone.now()
+        ok = self._mine().update(heartbeat_at=now, lease_expires_at=now + timedelta(seconds=lease_seconds()))
+        if not ok:
+            self.lost.set()
+        return bool(ok)
+
+    def check(self):
+        if self.lost.is_set():
+            raise LeaseLost(f"Lease on {self.model.__name__} {self.pk} was lost")
+
+    def _beat(self):
+        try:
+            renewed = time.monotonic()
+            while not self._stop.wait(min(CANCEL_POLL_SECONDS, lease_seconds() / 4)):
+                if time.monotonic() - renewed >= lease_seconds() / 4:
+                    if not self.renew():
+                        break
+                    renewed = time.monotonic()
+                elif not self._mine().exists():
+                    self.lost.set()
+                    break
+        finally:
+            connection.close()  # this thread's own DB connection
+
+    def finish(self, **fields) -> bool:
+        """Store the final state, only if this worker still owns the row."""
+        fields.setdefault("finished_at", timezone.now())
+        return bool(self._mine().update(lease_expires_at=None, **fields))
+
+def error_text(e: Exception) -> str:
+    stderr = getattr(e, "stderr", None)
+    return (stderr.strip() if isinstance(stderr, str) and stderr.strip() else str(e))[-MAX_ERROR_CHARS:]
+
+# ---------- chunks ----------
+def chunk_bounds(video_dur: float, size: float, keyframes: Optional[KeyframeIndex] = None) -> List[Tuple[float, float]]:
+    """
+    Split [0, video_dur) into ~size-second pieces. Each cut moves to the next keyframe (so
+    each chunk's input seek starts decoding right there) and onto the frame grid.
+    """
+    bounds, t = [], 0.0
+    while video_dur - t > size * 1.5:
+        target = t + size
+        cut = keyframes.after(target) if keyframes else None
+        if cut is None or cut > target + size / 2:
+            cut = target
+        cut = round(cut * FPS) / FPS
+        bounds.append((t, cut))
+        t = cut
+    bounds.append((t, video_dur))
+    return bounds
+
+def chunk_dir(job_id) -> Path:
+    return Path(settings.MEDIA_ROOT) / "chunks" / str(job_id)
+
+def chunk_stages(prep: preview.Prepared, start: float, end: float) -> List[Stage]:
+    """The stages rendering [start, end) of the timeline at full quality, rebased to 0."""
+    return preview.windowed_stages(prep, (start, end)) + [
+        partial(preview.build_clip_cmd, w0=start, w1=end, width=None, crf=CRF, preset="medium")
+    ]
+
+def render_chunk(chunk: RenderChunk) -> Path:
+    """Render one chunk, full quality, video only, timestamps starting at 0."""
+    prep = preview.prepare(TimelineSpec.from_dict(chunk.job.spec))
+    stages = chunk_stages(prep, chunk.start, chunk.end)
+    out = chunk_dir(chunk.job_id) / f"{chunk.index:05d}.mp4"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_name(f".{os.getpid()}.{out.name}")
+    try:
+        run_pipeline(build_pipeline(prep.base_path, stages, tmp), names=[stage_name(s) for s in stages])
+        os.replace(tmp, out)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return out
+
+def run_chunk(worker: str, queryset=None, classes=None) -> bool:
+    """Claim and render one queued chunk; returns whether one was claimed."""
+    chunk = claim(RenderChunk, worker, queryset, classes)
+    if chunk is None:
+        return False
+    with Lease(chunk, worker) as lease, ffmpeg.cancellable(lease.lost), ffmpeg.priority(chunk.job.priority), \
+            telemetry.recording(title=f"{chunk.job.title or chunk.job_id} chunk {chunk.index}") as rec:
+        rec.priority = chunk.job.priority
+        rec.source_duration = chunk.end - chunk.start
+        rec.queue_wait_sec = (chunk.started_at - chunk.created_at).total_seconds()
+        try:
+            out = render_chunk(chunk)
+            lease.finish(status=RenderChunk.DONE, output=str(out.relative_to(settings.MEDIA_ROOT)))
+        except Exception as e:
+            rec.error = error_text(e)
+            lease.finish(status=RenderChunk.FAILED, error=rec.error)
+    if rec.stages:
+        telemetry.save_run(rec)
+    return True
+
+def concat_chunks(paths: List[Path], out_path: Path):
+    """Join same-codec chunk files with the concat demuxer (stream copy)."""
+    list_path = out_path.with_suffix(".concat.txt")
+    lines = ["ffconcat version 1.0"]
+    for p in paths:
+        lines.append("file '{}'".format(Path(p).resolve().as_posix().replace("'", "'\\''")))
+    list_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    try:
+        run(["ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", list_path, "-map", "0:v", "-c", "copy", out_path],
+            stage="concat_chunks")
+    finally:
+        list_path.unlink(missing_ok=True)
+
+def wait_for_chunks(job: RenderJob, worker: str, lease: Lease) -> List[RenderChunk]:
+    """Help render this job's chunks until all are done; raise if one failed or the job lease is lost."""
+    while True:
+        lease.check()
+        requeue_expired(RenderChunk)
+        failed = job.chunks.filter(status=RenderChunk.FAILED).first()
+        if failed:
+            raise RuntimeError(f"Chunk {failed.index} failed: {failed.error}")
+        if not job.chunks.exclude(status=RenderChunk.DONE).exists():
+            return list(job.chunks.order_by("index"))
+        if not run_chunk(worker, job.chunks.all()):
+            lease.lost.wait(POLL_SECONDS)
+
+def render_chunked(job: RenderJob, spec: TimelineSpec, worker: str, lease: Lease, log):
+    prep = preview.prepare(spec)
+    preflight.check_stages(prep.base_path, prep.plan.stages)
+    if spec.captions:
+        prep = preview.prepare(spec, transcribe=True)  # everything else comes from the caches now
+    rec = telemetry.current()
+    if rec:
+        rec.source_duration = prep.video_dur
+    for msg in prep.plan.messages:
+        log(msg)
+    if not job.chunks.exists():  # a retried job keeps the chunks already rendered
+        bounds = chunk_bounds(prep.video_dur, chunk_seconds(), load_keyframes(prep.base_path))
+        RenderChunk.objects.bulk_create([
+            RenderChunk(job=job, index=i, start=a, end=b) for i, (a, b) in enumerate(bounds)
+        ])
+    log(f"Rendering {job.chunks.count()} chunks")
+    chunks = wait_for_chunks(job, worker, lease)
+
+    outdir = Path(settings.MEDIA_ROOT) / "outputs"
+    outdir.mkdir(parents=True, exist_ok=True)
+    with open_workspace(prep.video_dur, outdir, files=scratch_files()) as ws:  # the concat and the muxed file
+        video_only = ws.new_path()
+        concat_chunks([Path(settings.MEDIA_ROOT) / c.output.name for c in chunks], video_only)
+        out_path = ws.new_path()
+        mux_audio(video_only, prep.base_path, out_path)
+        out_path = ws.promote(out_path, outdir)
+    shutil.rmtree(chunk_dir(job.pk), ignore_errors=True)
+    return out_path, save_render_rows(spec, prep.main_path, out_path, prep.plan)
+
+def render_job(job: RenderJob, worker: str, lease: Lease, log):
+    """
+    Render a claimed job; long ones (>= 2 chunks of RENDER_CHUNK_SECONDS) are split across
+    workers, unless the job has extra output targets (those fan out from one composite).
+    """
+    spec = TimelineSpec.from_dict(job.spec)
+    size = chunk_seconds()
+    if size > 0 and not spec.outputs:
+        main = resolve_assets(spec)[spec.main_asset]
+        if media_duration(main) >= 2 * size:
+            return render_chunked(job, spec, worker, lease, log)
+    return render_timeline(spec, log=log)
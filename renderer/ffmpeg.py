@@ -0,0 +1,406 @@
+# renderer/ffmpeg.py
+"""
+Single execution layer for ffmpeg/ffprobe.
+
+Commands are argv lists (no shell, no quoting). Every ffmpeg process runs inside a
+host-wide slot (flock'd lock files, shared by all web/worker processes and released
+automatically if a process dies), with a fixed thread count, a nice level and
+optional CPU affinity, so concurrent renders queue instead of thrashing the CPU.
+
+Work runs in a priority class (see priority()): "interactive" previews may also use
+FFMPEG_INTERACTIVE_SLOTS reserved slots that render jobs never take, and run un-niced,
+so an editor's preview is not stuck behind a batch; "batch" runs at the lowest CPU priority.
+
+Every ffmpeg process leads its own process group. Waits poll a cancel event (see
+cancellable()) and a per-stage deadline scaled from the recorder's source duration; when
+either fires the whole group is killed and Cancelled / StageTimeout is raised.
+
+Tunables (environment):
+  FFMPEG_MAX_PROCS        concurrent ffmpeg processes per host (default: sized to cores and RAM)
+  FFMPEG_THREADS          threads per ffmpeg process (default: min(4, cores))
+  FFMPEG_MEM_PER_PROC_MB  RAM budget per process used to size the default slot count (1024)
+  FFMPEG_NICE             nice increment for ffmpeg processes (5; batch work adds 10)
+  FFMPEG_INTERACTIVE_SLOTS extra slots only interactive work may use (1)
+  FFMPEG_CPU_AFFINITY     CPU list such as "0-7,12" to pin ffmpeg processes to
+  FFMPEG_LOCK_DIR         directory for the slot lock files
+  FFMPEG_TIMEOUT_FACTOR   a stage may run this many seconds per second of source (10; 0 = no limit)
+  FFMPEG_TIMEOUT_MIN_SEC  ...plus this much, for startup and short sources (300)
+  FFPROBE_TIMEOUT_SEC     limit for one ffprobe call (60)
+"""
+import fcntl, os, shutil, signal, subprocess, tempfile, threading, time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, Optional, Sequence
+
+from . import telemetry
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, ""))
+    except ValueError:
+        return default
+
+def _parse_cpu_list(spec: str) -> Optional[set]:
+    cpus = set()
+    for part in (spec or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            a, b = part.split("-", 1)
+            cpus.update(range(int(a), int(b) + 1))
+        else:
+            cpus.add(int(part))
+    return cpus or None
+
+def _total_mem_mb() -> int:
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // (1 << 20)
+    except (ValueError, OSError, AttributeError):
+        return 0
+
+CPU_AFFINITY = _parse_cpu_list(os.environ.get("FFMPEG_CPU_AFFINITY", ""))
+CPU_COUNT = len(CPU_AFFINITY) if CPU_AFFINITY else (os.cpu_count() or 1)
+THREADS = max(1, _env_int("FFMPEG_THREADS", min(4, CPU_COUNT)))
+MEM_PER_PROC_MB = max(1, _env_int("FFMPEG_MEM_PER_PROC_MB", 1024))
+NICE = _env_int("FFMPEG_NICE", 5)
+LOCK_DIR = os.environ.get("FFMPEG_LOCK_DIR") or os.path.join(tempfile.gettempdir(), "videocreator-ffmpeg-slots")
+
+def _default_slots() -> int:
+    by_cpu = max(1, CPU_COUNT // THREADS)
+    mem = _total_mem_mb()
+    by_mem = max(1, mem // MEM_PER_PROC_MB) if mem else by_cpu
+    return min(by_cpu, by_mem)
+
+MAX_PROCS = max(1, _env_int("FFMPEG_MAX_PROCS", _default_slots()))
+INTERACTIVE_SLOTS = max(0, _env_int("FFMPEG_INTERACTIVE_SLOTS", 1))
+SLOT_POLL_SEC = 0.05
+WAIT_POLL_SEC = 0.2
+TIMEOUT_FACTOR = max(0, _env_int("FFMPEG_TIMEOUT_FACTOR", 10))
+TIMEOUT_MIN_SEC = max(1, _env_int("FFMPEG_TIMEOUT_MIN_SEC", 300))
+PROBE_TIMEOUT_SEC = max(1, _env_int("FFPROBE_TIMEOUT_SEC", 60))
+
+# ---------- priority classes ----------
+INTERACTIVE, FINAL, BATCH = "interactive", "final", "batch"
+PRIORITIES = (INTERACTIVE, FINAL, BATCH)  # most urgent first
+CLASS_NICE = {INTERACTIVE: 0, FINAL: NICE, BATCH: min(19, NICE + 10)}
+
+_priority: ContextVar[str] = ContextVar("ffmpeg_priority", default=FINAL)
+
+@contextmanager
+def priority(name: str):
+    """Run ffmpeg started in this context in the given class (slots and nice level)."""
+    token = _priority.set(name if name in PRIORITIES else FINAL)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+# ---------- cancellation and timeouts ----------
+class Cancelled(RuntimeError):
+    pass
+
+class StageTimeout(RuntimeError):
+    pass
+
+_cancel: ContextVar[Optional[threading.Event]] = ContextVar("ffmpeg_cancel", default=None)
+
+@contextmanager
+def cancellable(event: threading.Event):
+    """Kill ffmpeg started in this context (and refuse to start more) once event is set."""
+    token = _cancel.set(event)
+    try:
+        yield
+    finally:
+        _cancel.reset(token)
+
+def cancelled() -> bool:
+    event = _cancel.get()
+    return event is not None and event.is_set()
+
+def check_cancelled():
+    if cancelled():
+        raise Cancelled("Render cancelled")
+
+def stage_timeout() -> Optional[float]:
+    """Wall-clock limit for one process or pipeline, from the current recorder's source duration."""
+    rec = telemetry.current()
+    if not TIMEOUT_FACTOR or rec is None or not rec.source_duration:
+        return None
+    return TIMEOUT_MIN_SEC + TIMEOUT_FACTOR * rec.source_duration
+
+def _pause(seconds: float):
+    """Sleep, waking early if the render is cancelled."""
+    event = _cancel.get()
+    if event is not None:
+        event.wait(seconds)
+    else:
+        time.sleep(seconds)
+
+# ---------- host-wide semaphore ----------
+def _lock_file(name: str) -> int:
+    return os.open(os.path.join(LOCK_DIR, f"{name}.lock"), os.O_RDWR | os.O_CREAT, 0o666)
+
+def _try_lock_slots(n: int, order: Sequence[int]) -> List[int]:
+    fds = []
+    for i in order:
+        if len(fds) == n:
+            break
+        fd = _lock_file(f"slot-{i}")
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            fds.append(fd)
+        except BlockingIOError:
+            os.close(fd)
+    if len(fds) < n:
+        _release(fds)
+        return []
+    return fds
+
+def _release(fds: List[int]):
+    for fd in fds:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+def _take_turnstile(name: str) -> int:
+    """Hold a host-wide turnstile (polled, so a cancelled render stops waiting)."""
+    fd = _lock_file(name)
+    try:
+        while True:
+            check_cancelled()
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                _pause(SLOT_POLL_SEC)
+    except BaseException:
+        os.close(fd)
+        raise
+
+def _turnstile_held(name: str) -> bool:
+    fd = _lock_file(name)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        return False
+    except BlockingIOError:
+        return True
+    finally:
+        os.close(fd)
+
+@contextmanager
+def process_slots(n: int = 1) -> Iterator[None]:
+    """
+    Hold n of the host's MAX_PROCS ffmpeg slots. All n are taken at once or not at all
+    (no hold-and-wait, so pipelines can't deadlock each other).
+
+    Claimants queue on a turnstile: only its holder takes slots, so a pipeline needing
+    several is not starved by single-slot work grabbing each slot as it frees up.
+    Interactive work has its own turnstile, tries the reserved slots first, and while
+    it waits no other class takes a slot. Time spent waiting is added to the telemetry
+    recorder's queue wait.
+    """
+    interactive = _priority.get() == INTERACTIVE
+    if interactive:
+        order = range(MAX_PROCS + INTERACTIVE_SLOTS - 1, -1, -1)
+    else:
+        order = range(MAX_PROCS)
+    n = max(1, min(n, len(order)))
+    os.makedirs(LOCK_DIR, exist_ok=True)
+    t0 = time.monotonic()
+    turnstile = _take_turnstile("turnstile-interactive" if interactive else "turnstile")
+    try:
+        while True:
+            check_cancelled()
+            if interactive or not _turnstile_held("turnstile-interactive"):
+                fds = _try_lock_slots(n, order)
+                if fds:
+                    break
+            _pause(SLOT_POLL_SEC)
+    finally:
+        _release([turnstile])
+    telemetry.add_queue_wait(time.monotonic() - t0)
+    try:
+        yield
+    finally:
+        _release(fds)
+
+# ---------- process setup ----------
+NICE_BIN = shutil.which("nice")
+TASKSET_BIN = shutil.which("taskset")
+
+def _limit_prefix(nice: int) -> List[str]:
+    """
+    `nice -n N` / `taskset -c CPUS` to exec through, so the limits apply before ffmpeg
+    starts any thread (preexec_fn is unsafe in this threaded process; renicing after
+    spawn would miss threads ffmpeg already started).
+    """
+    prefix = []
+    if nice and NICE_BIN:
+        prefix += [NICE_BIN, "-n", str(nice)]
+    if CPU_AFFINITY and TASKSET_BIN:
+        prefix += [TASKSET_BIN, "-c", ",".join(str(c) for c in sorted(CPU_AFFINITY))]
+    return prefix
+
+def with_resource_args(args: Sequence[str]) -> List[str]:
+    """Add thread limits to an ffmpeg argv (the output target is always the last argument)."""
+    args = [str(a) for a in args]
+    if not args or os.path.basename(args[0]) != "ffmpeg":
+        return args
+    t = str(THREADS)
+    return [args[0], "-filter_threads", t, *args[1:-1], "-threads", t, args[-1]]
+
+def script_graphs(args: Sequence[str], tmpdir: str, prefix: str = "graph") -> List[str]:
+    """
+    Move -filter_complex graphs into -filter_complex_script files under tmpdir, so graph
+    size is never bounded by argv limits (large timelines produce very long graphs).
+    """
+    out, i = [], 0
+    while i < len(args):
+        if args[i] == "-filter_complex" and i + 1 < len(args):
+            path = os.path.join(tmpdir, f"{prefix}-{i}.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(args[i + 1])
+            out += ["-filter_complex_script", path]
+            i += 2
+        else:
+            out.append(args[i])
+            i += 1
+    return out
+
+def popen(args: Sequence[str], **kwargs) -> subprocess.Popen:
+    """Start a resource-limited process in a new process group. Caller must already hold a slot for ffmpeg."""
+    check_cancelled()
+    prefix = _limit_prefix(CLASS_NICE[_priority.get()])
+    return subprocess.Popen(prefix + with_resource_args(args), start_new_session=True, **kwargs)
+
+def kill(procs: Sequence[subprocess.Popen]):
+    """SIGKILL each process's whole group (ffmpeg and anything it spawned) and reap them."""
+    for p in procs:
+        if p.poll() is None:
+            try:
+                os.killpg(p.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                p.kill()
+    for p in procs:
+        p.wait()
+
+def _try_reap(p: subprocess.Popen):
+    """(exited, rusage): a non-blocking wait4, giving the child's own rusage (None if already reaped)."""
+    try:
+        pid, status, ru = os.wait4(p.pid, os.WNOHANG)
+    except ChildProcessError:
+        p.wait()
+        return True, None
+    if pid == 0:
+        return False, None
+    p.returncode = os.waitstatus_to_exitcode(status)
+    return True, ru
+
+def _reap_all(procs: Sequence[subprocess.Popen], label: str) -> List[tuple]:
+    """
+    Wait for every process, noticing cancellation and the stage deadline within
+    WAIT_POLL_SEC. Returns (rusage, wall seconds) per process; raises Cancelled or
+    StageTimeout (the caller kills the processes).
+    """
+    t0 = time.monotonic()
+    limit = stage_timeout()
+    usage = [None] * len(procs)
+    pending = list(range(len(procs)))
+    while True:
+        for i in list(pending):
+            exited, ru = _try_reap(procs[i])
+            if exited:
+                usage[i] = (ru, time.monotonic() - t0)
+                pending.remove(i)
+        if not pending:
+            return usage
+        check_cancelled()
+        if limit is not None and time.monotonic() - t0 > limit:
+            raise StageTimeout(f"{label} timed out after {limit:.0f}s")
+        _pause(WAIT_POLL_SEC)
+
+def run(args: Sequence[str], check: bool = True, stage: Optional[str] = None,
+        slots: int = 1) -> subprocess.CompletedProcess:
+    """
+    Run one command to completion, capturing text stdout/stderr.
+    ffmpeg waits for `slots` host slots first (more for one process running several
+    encoders) and is reported to telemetry under `stage`; ffprobe (cheap, demux-only) does neither.
+    """
+    args = [str(a) for a in args]
+    if os.path.basename(args[0]) != "ffmpeg":
+        return subprocess.run(args, capture_output=True, text=True, check=check, timeout=PROBE_TIMEOUT_SEC)
+    with process_slots(slots), tempfile.TemporaryDirectory() as tmp, \
+            tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+        p = popen(script_graphs(args, tmp), stdout=out, stderr=err)
+        try:
+            [(ru, wall)] = _reap_all([p], stage or "ffmpeg")
+        except BaseException:
+            kill([p])
+            raise
+        out.seek(0)
+        err.seek(0)
+        stdout = out.read().decode("utf-8", "replace")
+        stderr = err.read().decode("utf-8", "replace")
+    telemetry.record_process(stage, args, wall, ru, p.returncode, stderr)
+    if check and p.returncode != 0:
+        raise subprocess.CalledProcessError(p.returncode, args, output=stdout, stderr=stderr)
+    return subprocess.CompletedProcess(args, p.returncode, stdout, stderr)
+
+def _broken_pipe(returncode: int, stderr: str) -> bool:
+    """Whether a stage only failed because the stage it writes to went away."""
+    return returncode == -signal.SIGPIPE or "Broken pipe" in (stderr or "")
+
+def run_pipeline(cmds: List[List[str]], names: Optional[List[str]] = None,
+                 weights: Optional[List[int]] = None):
+    """
+    Start every stage at once, each reading the previous one's stdout, so all stages
+    run concurrently across cores. The pipeline takes one slot per stage, or weights[i]
+    for a stage running several encoders.
+    Raises CalledProcessError for the first stage that failed on its own (not just
+    with a broken pipe into a failed later stage).
+    """
+    cmds = [[str(a) for a in cmd] for cmd in cmds]
+    names = names or [None] * len(cmds)
+    procs = []
+    logs = []
+    with process_slots(sum(weights) if weights else len(cmds)), tempfile.TemporaryDirectory() as tmp:
+        prev = None
+        try:
+            for i, cmd in enumerate(cmds):
+                last = i == len(cmds) - 1
+                log = tempfile.TemporaryFile()
+                p = popen(
+                    script_graphs(cmd, tmp, prefix=f"stage{i}"),
+                    stdin=prev.stdout if prev else subprocess.DEVNULL,
+                    stdout=None if last else subprocess.PIPE,
+                    stderr=log,
+                )
+                if prev:
+                    prev.stdout.close()  # downstream owns the pipe; upstream sees EPIPE if it dies
+                procs.append(p)
+                logs.append(log)
+                prev = p
+            usage = _reap_all(procs, "+".join(n or "ffmpeg" for n in names))
+        except BaseException:
+            kill(procs)
+            raise
+        finally:
+            stderr = []
+            for log in logs:
+                log.seek(0)
+                stderr.append(log.read().decode("utf-8", "replace"))
+                log.close()
+
+    for cmd, name, p, (ru, wall), err in zip(cmds, names, procs, usage, stderr):
+        telemetry.record_process(name, cmd, wall, ru, p.returncode, err)
+
+    # Report the stage that broke: when a later stage dies, the ones before it only fail
+    # writing into its closed pipe, so those failures come last
+    failed = [(cmd, p, err) for cmd, p, err in zip(cmds, procs, stderr) if p.returncode != 0]
+    failed.sort(key=lambda f: _broken_pipe(f[1].returncode, f[2]))
+    if failed:
+        cmd, p, err = failed[0]
+        raise subprocess.CalledProcessError(p.returncode, cmd, output="", stderr=err)
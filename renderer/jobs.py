@@ -0,0 +1,129 @@
+# renderer/jobs.py
+"""
+Render job queue for the JSON API.
+
+Jobs are RenderJob rows. submit() stores the spec; with RENDER_WORKERS > 0 it also hands
+the id to a small thread pool in this web process. Separate `render_worker` processes
+(any node sharing the database and MEDIA_ROOT) claim queued jobs and chunks the same way,
+see renderer/farm.py. Each ffmpeg process still waits for a host-wide slot
+(renderer/ffmpeg.py), so the pool size only bounds queued Python work.
+
+cancel() stops a queued or running job: its worker notices through the lease heartbeat,
+its ffmpeg processes are killed and its partial chunks removed.
+"""
+import shutil, threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from . import farm, ffmpeg, scheduler, telemetry
+from .estimate import estimate_spec
+from .models import RenderChunk, RenderJob
+from .outputs import sibling_path
+from .timeline import TimelineSpec
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _pool() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, "RENDER_WORKERS", 2), thread_name_prefix="render-job"
+            )
+        return _executor
+
+def submit(spec: TimelineSpec, priority: str = RenderJob.FINAL, owner: str = "") -> RenderJob:
+    """Store a validated spec as a queued job; run it in-process once committed unless RENDER_WORKERS is 0."""
+    try:
+        estimate = estimate_spec(spec).to_dict()
+    except Exception as e:
+        print(f"Could not estimate render {spec.title!r}: {e}")
+        estimate = None
+    job = RenderJob.objects.create(title=spec.title, spec=spec.to_dict(), priority=priority, owner=owner[:255],
+                                   estimate=estimate)
+    if getattr(settings, "RENDER_WORKERS", 2) > 0:
+        transaction.on_commit(lambda: _pool().submit(run_job, job.id))
+    return job
+
+def cancel(job_id) -> bool:
+    """Cancel a queued or running job and its unfinished chunks; False if it had already finished."""
+    now = timezone.now()
+    unfinished = [RenderJob.QUEUED, RenderJob.RUNNING]
+    fields = {"status": RenderJob.CANCELLED, "lease_expires_at": None, "finished_at": now}
+    if not RenderJob.objects.filter(pk=job_id, status__in=unfinished).update(error="Cancelled", **fields):
+        return False
+    RenderChunk.objects.filter(job_id=job_id, status__in=unfinished).update(**fields)
+    return True
+
+def run_job(job_id=None, worker: str = "", classes=None) -> bool:
+    """Claim and execute one queued job (job_id, or the next in scheduler order); never raises. Returns whether one was claimed."""
+    worker = worker or farm.worker_name()
+    try:
+        queryset = RenderJob.objects.filter(pk=job_id) if job_id else None
+        job = farm.claim(RenderJob, worker, queryset, classes)
+        if job is None:
+            return False  # already taken or finished
+        lines = []
+        with farm.Lease(job, worker) as lease, ffmpeg.cancellable(lease.lost), ffmpeg.priority(job.priority), \
+                telemetry.recording(title=job.title) as rec:
+            rec.priority = job.priority
+            rec.queue_wait_sec = (job.started_at - job.created_at).total_seconds()
+            try:
+                out_path, input_data = farm.render_job(job, worker, lease, log=lines.append)
+                rec.input_data = input_data
+                result = {
+                    "status": RenderJob.DONE,
+                    "output": str(Path(out_path).relative_to(settings.MEDIA_ROOT)),
+                    "outputs": {
+                        t["name"]: str(sibling_path(out_path, t["name"]).relative_to(settings.MEDIA_ROOT))
+                        for t in job.spec.get("outputs", [])
+                    },
+                    "input_data": input_data,
+                }
+            except Exception as e:
+                rec.error = farm.error_text(e)
+                result = {"status": RenderJob.FAILED, "error": rec.error}
+            log = "\n".join(lines)
+            if not lease.finish(log=log, **result):
+                if RenderJob.objects.filter(pk=job.pk, status=RenderJob.CANCELLED).update(log=log):
+                    shutil.rmtree(farm.chunk_dir(job.pk), ignore_errors=True)  # chunks rendered so far
+                else:
+                    print(f"Render job {job_id or job.pk}: lease lost, result discarded")
+        if rec.stages:
+            telemetry.save_run(rec)
+        return True
+    except Exception as e:
+        print(f"Render job {job_id} crashed: {e}")
+        return True
+    finally:
+        close_old_connections()
+
+def work(stop: threading.Event, once: bool = False, poll: float = farm.POLL_SECONDS, classes=None):
+    """
+    Worker loop: requeue lapsed leases, then take the best-ranked chunk or job (chunks win
+    ties, they unblock a running job). `classes` limits this worker to some priority
+    classes, e.g. to keep capacity reserved for interactive work.
+    """
+    worker = farm.worker_name()
+    while not stop.is_set():
+        try:
+            farm.requeue_expired(RenderChunk)
+            farm.requeue_expired(RenderJob)
+            if scheduler.chunks_first(classes):
+                busy = farm.run_chunk(worker, classes=classes) or run_job(worker=worker, classes=classes)
+            else:
+                busy = run_job(worker=worker, classes=classes) or farm.run_chunk(worker, classes=classes)
+        except Exception as e:
+            print(f"Render worker {worker}: {e}")
+            busy = False
+        finally:
+            close_old_connections()
+        if not busy:
+            if once:
+                return
+            stop.wait(poll)
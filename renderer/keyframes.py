@@ -0,0 +1,103 @@
+# renderer/keyframes.py
+"""
+Keyframe index per media file.
+
+One demux-only ffprobe packet scan records every video keyframe's timestamp and byte
+offset; the result is stored as a small .npy file keyed by the media fingerprint, so
+cut planning and seeking never rescan the file. Lookups are binary searches.
+"""
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+
+from .broll import media_fingerprint
+from .ffmpeg import run
+
+INDEX_DTYPE = np.dtype([("t", "<f8"), ("pos", "<i8")])
+EPS = 1e-3  # timestamps this close count as equal (ffprobe prints microseconds)
+
+_loaded: Dict[str, "KeyframeIndex"] = {}  # fingerprint -> index, per process
+
+@dataclass
+class KeyframeIndex:
+    times: np.ndarray    # seconds, ascending
+    offsets: np.ndarray  # byte position of each keyframe packet (-1 if unknown)
+
+    def __len__(self):
+        return len(self.times)
+
+    def before(self, t: float) -> Optional[float]:
+        """Keyframe at or before t, or None if t precedes the first one."""
+        i = int(np.searchsorted(self.times, t + EPS, side="right"))
+        return float(self.times[i - 1]) if i else None
+
+    def after(self, t: float) -> Optional[float]:
+        """Keyframe at or after t, or None if there is none."""
+        i = int(np.searchsorted(self.times, t - EPS, side="left"))
+        return float(self.times[i]) if i < len(self.times) else None
+
+    def offset_before(self, t: float) -> Optional[int]:
+        """Byte offset of the keyframe at or before t."""
+        i = int(np.searchsorted(self.times, t + EPS, side="right"))
+        return int(self.offsets[i - 1]) if i else None
+
+# ---------- scanning ----------
+def _field(value: str, cast, default):
+    try:
+        return cast(value)
+    except ValueError:
+        return default
+
+def scan_keyframes(media_path: Path) -> np.ndarray:
+    """Keyframe (time, byte offset) pairs of the first video stream, sorted by time."""
+    cmd = [
+        "ffprobe", "-v", "error", "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,dts_time,pos,flags", "-of", "compact=p=0", media_path,
+    ]
+    res = run(cmd, stage="keyframe_scan")
+    rows = []
+    for line in res.stdout.splitlines():
+        fields = dict(kv.split("=", 1) for kv in line.strip().split("|") if "=" in kv)
+        if "K" not in fields.get("flags", ""):
+            continue
+        t = _field(fields.get("pts_time", ""), float, None)
+        if t is None:
+            t = _field(fields.get("dts_time", ""), float, None)
+        if t is not None:
+            rows.append((t, _field(fields.get("pos", ""), int, -1)))
+    index = np.array(rows, dtype=INDEX_DTYPE)
+    index.sort(order="t")
+    return index
+
+# ---------- cached access ----------
+def keyframe_index(media_path: Path, cache_dir: Path) -> KeyframeIndex:
+    """
+    Cached keyframe index for a file: in memory, then <cache_dir>/<fingerprint>.npy,
+    scanning only on a miss.
+    """
+    key = media_fingerprint(media_path)
+    if key in _loaded:
+        return _loaded[key]
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    cache_path = cache_dir / f"{key}.npy"
+    data = None
+    if cache_path.exists():
+        try:
+            data = np.load(cache_path, allow_pickle=False)
+            if data.dtype != INDEX_DTYPE:
+                data = None
+        except Exception:
+            data = None
+    if data is None:
+        data = scan_keyframes(media_path)
+        tmp = cache_dir / f".{os.getpid()}.{key}.npy"
+        np.save(tmp, data, allow_pickle=False)
+        os.replace(tmp, cache_path)
+
+    index = KeyframeIndex(times=data["t"], offsets=data["pos"])
+    _loaded[key] = index
+    return index
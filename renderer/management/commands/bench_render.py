@@ -0,0 +1,70 @@
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from renderer import bench
+
+
+class Command(BaseCommand):
+    help = "Benchmark the render stages on synthetic lavfi media; optionally compare against a baseline JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default=",".join(bench.DEFAULT_SIZES),
+                            help="Comma-separated WxH list")
+        parser.add_argument("--durations", default=",".join(f"{d:g}" for d in bench.DEFAULT_DURATIONS),
+                            help="Comma-separated fixture durations in seconds")
+        parser.add_argument("--repeat", type=int, default=3, help="Runs per case (median is reported)")
+        parser.add_argument("--case", default=None, help="Only run cases whose name contains this")
+        parser.add_argument("--workdir", default=None,
+                            help="Keep fixtures and outputs here (reused between runs); default is a temp dir")
+        parser.add_argument("--out", default=None, help="Write results JSON to this file")
+        parser.add_argument("--compare", nargs="+", metavar="JSON",
+                            help="BASELINE [CURRENT]: compare two result files, or a fresh run against BASELINE")
+        parser.add_argument("--threshold", type=float, default=bench.REGRESSION_THRESHOLD,
+                            help="Flag cases slower than baseline by more than this fraction")
+
+    def handle(self, *args, **options):
+        compare = options["compare"] or []
+        if len(compare) > 2:
+            raise CommandError("--compare takes BASELINE [CURRENT]")
+
+        if len(compare) == 2:
+            current = bench.load(compare[1])
+        else:
+            current = self._run(options)
+
+        if compare:
+            self._report(bench.compare(bench.load(compare[0]), current, options["threshold"]),
+                         options["threshold"])
+
+    def _run(self, options):
+        workdir = Path(options["workdir"]) if options["workdir"] else Path(tempfile.mkdtemp(prefix="bench-"))
+        workdir.mkdir(parents=True, exist_ok=True)
+        try:
+            report = bench.run_suite(
+                workdir,
+                sizes=[s.strip() for s in options["sizes"].split(",") if s.strip()],
+                durations=[float(d) for d in options["durations"].split(",") if d.strip()],
+                repeat=max(1, options["repeat"]),
+                only=options["case"],
+                log=self.stdout.write,
+            )
+        finally:
+            if not options["workdir"]:
+                shutil.rmtree(workdir, ignore_errors=True)
+        if options["out"]:
+            bench.save(report, options["out"])
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['out']}"))
+        return report
+
+    def _report(self, rows, threshold):
+        regressions = [r for r in rows if r["regressed"]]
+        for r in rows:
+            line = (f"{r['case']:28s} {r['size']:>9s} {r['duration']:6.0f}s  "
+                    f"{r['baseline_sec']:8.2f}s -> {r['current_sec']:8.2f}s  ({r['ratio'] - 1:+.1%})")
+            self.stdout.write(self.style.ERROR(line) if r["regressed"] else line)
+        if regressions:
+            raise CommandError(f"{len(regressions)} case(s) regressed by more than {threshold:.0%}")
+        self.stdout.write(self.style.SUCCESS(f"No regressions over {threshold:.0%} in {len(rows)} case(s)"))
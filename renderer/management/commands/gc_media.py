@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from renderer.workspace import collect_garbage
+
+
+class Command(BaseCommand):
+    help = "Delete orphaned uploads, old unreferenced outputs and abandoned render scratch dirs. Run from cron."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scratch-hours", type=float, default=6.0,
+                            help="Age after which a scratch job dir is considered abandoned")
+        parser.add_argument("--media-days", type=float, default=7.0,
+                            help="Age after which unreferenced uploads/outputs and unused prescaled stills are deleted")
+        parser.add_argument("--upload-days", type=float, default=2.0,
+                            help="Age after which incomplete chunked uploads are deleted")
+        parser.add_argument("--dry-run", action="store_true", help="List what would be deleted")
+
+    def handle(self, *args, **options):
+        removed = collect_garbage(
+            scratch_age_sec=options["scratch_hours"] * 3600,
+            media_age_sec=options["media_days"] * 86400,
+            upload_age_sec=options["upload_days"] * 86400,
+            dry_run=options["dry_run"],
+        )
+        verb = "Would remove" if options["dry_run"] else "Removed"
+        for path in removed:
+            self.stdout.write(f"{verb} {path}")
+        self.stdout.write(self.style.SUCCESS(f"{verb} {len(removed)} item(s)"))
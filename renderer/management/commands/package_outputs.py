@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from renderer import packaging
+from renderer.models import InputData
+
+
+class Command(BaseCommand):
+    help = "Build the HLS/DASH ladder for completed videos that are unpackaged or failed. Run from cron."
+
+    def add_arguments(self, parser):
+        parser.add_argument("ids", nargs="*", type=int, help="InputData ids (default: every one that needs it)")
+        parser.add_argument("--force", action="store_true",
+                            help="Also repackage done ones and ones marked running (e.g. after a crash)")
+
+    def handle(self, *args, **options):
+        todo = InputData.objects.exclude(completed_video="").exclude(completed_video__isnull=True)
+        if options["ids"]:
+            todo = todo.filter(pk__in=options["ids"])
+        if not options["force"]:
+            todo = todo.filter(~Q(stream_status__in=[InputData.STREAM_DONE, InputData.STREAM_RUNNING]))
+        done = 0
+        for pk in todo.values_list("pk", flat=True):
+            InputData.objects.filter(pk=pk).update(stream_status=InputData.STREAM_QUEUED, stream_error="")
+            packaging.package(pk)
+            obj = InputData.objects.get(pk=pk)
+            if obj.stream_status == InputData.STREAM_DONE:
+                done += 1
+                self.stdout.write(f"{obj.title}: {obj.stream_manifest}")
+            else:
+                self.stdout.write(self.style.ERROR(f"{obj.title}: {obj.stream_error[-300:]}"))
+        self.stdout.write(self.style.SUCCESS(f"Packaged {done} video(s)"))
@@ -0,0 +1,42 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from renderer.estimate import estimate_spec, estimate_template
+from renderer.serializers import TimelineSpecSerializer
+
+
+class Command(BaseCommand):
+    help = "Dry run: predict render time per stage, peak scratch disk and output size without running ffmpeg."
+
+    def add_arguments(self, parser):
+        src = parser.add_mutually_exclusive_group(required=True)
+        src.add_argument("--spec", help="JSON file with a timeline spec (same body as POST /api/renders/)")
+        src.add_argument("--template", help="render.py template (e.g. template.json)")
+        parser.add_argument("--var", action="append", default=[], metavar="KEY=VALUE",
+                            help="Template variable, repeatable")
+        parser.add_argument("--host", default=None, help="Use this host's throughput history (default: this host)")
+        parser.add_argument("--json", action="store_true", help="Print the estimate as JSON")
+
+    def handle(self, *args, **options):
+        if options["spec"]:
+            with open(options["spec"]) as f:
+                serializer = TimelineSpecSerializer(data=json.load(f))
+            if not serializer.is_valid():
+                raise CommandError(json.dumps(serializer.errors))
+            est = estimate_spec(serializer.to_spec(), host=options["host"])
+        else:
+            mapping = dict(v.split("=", 1) for v in options["var"] if "=" in v)
+            est = estimate_template(options["template"], mapping, host=options["host"])
+
+        if options["json"]:
+            self.stdout.write(json.dumps(est.to_dict(), indent=2))
+            return
+        for st in est.stages:
+            self.stdout.write(f"{st.name:<40} {st.seconds:>9.1f}s  ({st.basis})")
+        for note in est.notes:
+            self.stdout.write(self.style.WARNING(note))
+        self.stdout.write(self.style.SUCCESS(
+            f"{'~' if est.approximate else ''}{est.wall_sec:.1f}s for {est.duration_sec:.1f}s of video; "
+            f"output ~{est.output_bytes / (1 << 20):.0f} MB, peak scratch ~{est.peak_scratch_bytes / (1 << 20):.0f} MB"
+        ))
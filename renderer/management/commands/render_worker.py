@@ -0,0 +1,41 @@
+import signal, threading
+
+from django.core.management.base import BaseCommand, CommandError
+
+from renderer import jobs, scheduler
+
+
+class Command(BaseCommand):
+    help = "Claim and run queued render jobs and chunks from the shared database. Run one per node (or several)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=1,
+                            help="Jobs/chunks this process renders at once")
+        parser.add_argument("--poll", type=float, default=jobs.farm.POLL_SECONDS,
+                            help="Seconds to wait when the queue is empty")
+        parser.add_argument("--classes", default="",
+                            help=f"Comma-separated priority classes to take ({', '.join(scheduler.PRIORITIES)}); "
+                                 "default all. E.g. run one worker with --classes interactive to reserve it")
+        parser.add_argument("--once", action="store_true",
+                            help="Exit when nothing is left to claim (for scripts and local tests)")
+
+    def handle(self, *args, **options):
+        classes = [c.strip() for c in options["classes"].split(",") if c.strip()] or None
+        unknown = set(classes or ()) - set(scheduler.PRIORITIES)
+        if unknown:
+            raise CommandError(f"Unknown priority class(es): {', '.join(sorted(unknown))}")
+        stop = threading.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: stop.set())
+        threads = [
+            threading.Thread(target=jobs.work, args=(stop, options["once"], options["poll"], classes),
+                             name=f"render-worker-{i}")
+            for i in range(max(1, options["threads"]))
+        ]
+        for t in threads:
+            t.start()
+        self.stdout.write(f"Render worker running {len(threads)} thread(s); Ctrl-C finishes the current work and exits")
+        for t in threads:
+            while t.is_alive():
+                t.join(1.0)
+        self.stdout.write(self.style.SUCCESS("Render worker stopped"))
@@ -0,0 +1,77 @@
+# renderer/mediainfo.py
+"""
+Probe metadata per media file (duration, size, video geometry), probed once and cached as
+JSON under MEDIA_ROOT/cache/probe by media fingerprint. Renders reuse it instead of
+re-running ffprobe, and the estimator reads it without running anything.
+"""
+import json, os
+from pathlib import Path
+from typing import Dict, Optional
+
+from django.conf import settings
+
+from .broll import media_fingerprint
+from .ffmpeg import run
+
+def _cache_path(path: Path) -> Path:
+    return Path(settings.MEDIA_ROOT) / "cache" / "probe" / f"{media_fingerprint(path)}.json"
+
+def probe_media(path: Path) -> Dict:
+    """
+    Duration, size and first video stream geometry from one ffprobe call. A file ffprobe
+    cannot read gets zero duration, no video and its complaint under "error".
+    """
+    res = run([
+        "ffprobe", "-v", "error", "-show_entries",
+        "format=duration,size:stream=codec_type,width,height,avg_frame_rate",
+        "-of", "json", path,
+    ], check=False)
+    info = {"duration": 0.0, "size": os.path.getsize(path), "width": None, "height": None,
+            "fps": None, "has_audio": False}
+    if res.returncode != 0:
+        lines = (res.stderr or "").strip().splitlines()
+        info["error"] = lines[-1] if lines else f"ffprobe exited with {res.returncode}"
+        return info
+    try:
+        data = json.loads(res.stdout or "{}")
+    except ValueError:
+        data = {}
+    fmt = data.get("format", {})
+    try:
+        info["duration"] = max(0.0, float(fmt.get("duration", 0)))
+    except ValueError:
+        pass
+    for s in data.get("streams", []):
+        if s.get("codec_type") == "audio":
+            info["has_audio"] = True
+        elif s.get("codec_type") == "video" and info["width"] is None:
+            info["width"], info["height"] = s.get("width"), s.get("height")
+            num, _, den = (s.get("avg_frame_rate") or "0/1").partition("/")
+            try:
+                info["fps"] = float(num) / float(den or 1) or None
+            except (ValueError, ZeroDivisionError):
+                pass
+    return info
+
+def media_info(path: Path, probe: bool = True) -> Optional[Dict]:
+    """Cached probe metadata; with probe=False a cache miss returns None instead of running ffprobe."""
+    cache_path = _cache_path(path)
+    if cache_path.exists():
+        try:
+            return json.loads(cache_path.read_text(encoding="utf-8"))
+        except Exception:
+            pass
+    if not probe:
+        return None
+    info = probe_media(path)
+    # don't cache a failed probe; stills have a video stream but no duration
+    if not info.get("error") and (info["duration"] > 0 or info["width"]):
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cache_path.with_name(f".{os.getpid()}.{cache_path.name}")
+        tmp.write_text(json.dumps(info), encoding="utf-8")
+        os.replace(tmp, cache_path)
+    return info
+
+def media_duration(path: Path) -> float:
+    """Duration in seconds (0 on failure), from the cache when possible."""
+    return media_info(path)["duration"]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.5 on 2026-10-19 10:15
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('renderer', '0005_inputdata_completed_video'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadedAsset',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=255)),
+                ('file', models.FileField(max_length=500, upload_to='uploads/')),
+                ('size', models.BigIntegerField()),
+                ('offset', models.BigIntegerField(default=0)),
+                ('sha256', models.CharField(blank=True, default='', max_length=64)),
+                ('completed', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
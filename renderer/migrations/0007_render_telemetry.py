@@ -0,0 +1,52 @@
+# Generated by Django 5.1.5 on 2026-10-19 10:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('renderer', '0006_uploadedasset'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RenderRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(blank=True, max_length=255)),
+                ('status', models.CharField(choices=[('ok', 'OK'), ('failed', 'Failed')], default='ok', max_length=10)),
+                ('error', models.TextField(blank=True)),
+                ('source_duration', models.FloatField(blank=True, null=True)),
+                ('wall_sec', models.FloatField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('input_data', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='render_runs', to='renderer.inputdata')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RenderStage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order', models.PositiveIntegerField(default=0)),
+                ('name', models.CharField(max_length=64)),
+                ('command', models.TextField(blank=True)),
+                ('wall_sec', models.FloatField()),
+                ('cpu_user_sec', models.FloatField(default=0)),
+                ('cpu_sys_sec', models.FloatField(default=0)),
+                ('max_rss_kb', models.BigIntegerField(blank=True, null=True)),
+                ('input_bytes', models.BigIntegerField(blank=True, null=True)),
+                ('output_bytes', models.BigIntegerField(blank=True, null=True)),
+                ('frames', models.IntegerField(blank=True, null=True)),
+                ('fps', models.FloatField(blank=True, null=True)),
+                ('returncode', models.IntegerField(blank=True, null=True)),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stages', to='renderer.renderrun')),
+            ],
+            options={
+                'ordering': ['run', 'order'],
+            },
+        ),
+    ]
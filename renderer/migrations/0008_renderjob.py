@@ -0,0 +1,34 @@
+# Generated by Django 5.1.5 on 2026-10-19 10:34
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('renderer', '0007_render_telemetry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RenderJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('title', models.CharField(blank=True, max_length=255)),
+                ('spec', models.JSONField()),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], db_index=True, default='queued', max_length=10)),
+                ('error', models.TextField(blank=True)),
+                ('log', models.TextField(blank=True)),
+                ('output', models.FileField(blank=True, max_length=500, null=True, upload_to='outputs/')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('input_data', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='render_jobs', to='renderer.inputdata')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.1.5 on 2026-10-19 10:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('renderer', '0008_renderjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='renderjob',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='renderjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='renderjob',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='renderjob',
+            name='worker',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.CreateModel(
+            name='RenderChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveIntegerField()),
+                ('start', models.FloatField()),
+                ('end', models.FloatField()),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], db_index=True, default='queued', max_length=10)),
+                ('error', models.TextField(blank=True)),
+                ('output', models.FileField(blank=True, max_length=500, null=True, upload_to='chunks/')),
+                ('worker', models.CharField(blank=True, max_length=255)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True)),
+                ('lease_expires_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='renderer.renderjob')),
+            ],
+            options={
+                'ordering': ['job', 'index'],
+                'unique_together': {('job', 'index')},
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.5 on 2026-10-19 10:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('renderer', '0009_render_farm'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='renderjob',
+            name='owner',
+            field=models.CharField(blank=True, help_text='User (or client address) for fair sharing', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='renderjob',
+            name='priority',
+            field=models.CharField(choices=[('interactive', 'Interactive'), ('final', 'Final'), ('batch', 'Batch')], db_index=True, default='final', max_length=12),
+        ),
+        migrations.AddField(
+            model_name='renderrun',
+            name='priority',
+            field=models.CharField(blank=True, choices=[('interactive', 'Interactive'), ('final', 'Final'), ('batch', 'Batch')], max_length=12),
+        ),
+        migrations.AddField(
+            model_name='renderrun',
+            name='queue_wait_sec',
+            field=models.FloatField(default=0),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.5 on 2026-10-19 10:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('renderer', '0010_render_priority'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='renderjob',
+            name='estimate',
+            field=models.JSONField(blank=True, help_text='Predicted time/disk at submit (renderer/estimate.py)', null=True),
+        ),
+        migrations.AddField(
+            model_name='renderrun',
+            name='host',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
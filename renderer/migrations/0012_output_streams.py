@@ -0,0 +1,33 @@
+# Generated by Django 5.1.5 on 2026-10-19 10:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('renderer', '0011_render_estimate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inputdata',
+            name='stream_dash_manifest',
+            field=models.CharField(blank=True, help_text='DASH manifest, if packaged', max_length=500),
+        ),
+        migrations.AddField(
+            model_name='inputdata',
+            name='stream_error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='inputdata',
+            name='stream_manifest',
+            field=models.CharField(blank=True, help_text='HLS master playlist', max_length=500),
+        ),
+        migrations.AddField(
+            model_name='inputdata',
+            name='stream_status',
+            field=models.CharField(blank=True, choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], max_length=10),
+        ),
+    ]
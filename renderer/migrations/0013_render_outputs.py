@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-19 10:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('renderer', '0012_output_streams'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='renderjob',
+            name='outputs',
+            field=models.JSONField(blank=True, default=dict, help_text='Extra output targets: name -> path under MEDIA_ROOT'),
+        ),
+    ]
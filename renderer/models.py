@@ -1,3 +1,4 @@
+import uuid
 from django.db import models
 from django.db.models.signals import post_save
 from django.dispatch import receiver
@@ -26,14 +27,156 @@ class BrollClip(models.Model):
     duration = models.FloatField()
 
 class InputData(models.Model):
+    STREAM_QUEUED, STREAM_RUNNING, STREAM_DONE, STREAM_FAILED = "queued", "running", "done", "failed"
+    STREAM_STATUS_CHOICES = [
+        (STREAM_QUEUED, "Queued"), (STREAM_RUNNING, "Running"), (STREAM_DONE, "Done"), (STREAM_FAILED, "Failed"),
+    ]
+
     title = models.CharField(max_length=255)
     main_video = models.FileField(upload_to='uploads/', max_length=500)
     completed_video = models.FileField(upload_to='outputs/', max_length=500, null=True, blank=True)
+    outputs = models.JSONField(default=dict, blank=True, help_text="Extra output targets: name -> path under MEDIA_ROOT")
     created_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)
+    # Adaptive-bitrate ladder of completed_video (renderer/packaging.py), relative to MEDIA_ROOT
+    stream_status = models.CharField(max_length=10, choices=STREAM_STATUS_CHOICES, blank=True)
+    stream_manifest = models.CharField(max_length=500, blank=True, help_text="HLS master playlist")
+    stream_dash_manifest = models.CharField(max_length=500, blank=True, help_text="DASH manifest, if packaged")
+    stream_error = models.TextField(blank=True)
 
     def __str__(self):
         return self.title
 
+class UploadedAsset(models.Model):
+    """A media file received through the chunked, resumable upload endpoint"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    filename = models.CharField(max_length=255)
+    file = models.FileField(upload_to='uploads/', max_length=500)
+    size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True, default='')
+    completed = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size})"
+
+class RenderJob(models.Model):
+    """
+    A render submitted through the JSON API; `spec` is a serialized TimelineSpec.
+    A worker owns a running job while `lease_expires_at` is in the future (see renderer/farm.py).
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed'),
+                      (CANCELLED, 'Cancelled')]
+    INTERACTIVE = 'interactive'
+    FINAL = 'final'
+    BATCH = 'batch'
+    PRIORITY_CHOICES = [(INTERACTIVE, 'Interactive'), (FINAL, 'Final'), (BATCH, 'Batch')]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    title = models.CharField(max_length=255, blank=True)
+    spec = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED, db_index=True)
+    priority = models.CharField(max_length=12, choices=PRIORITY_CHOICES, default=FINAL, db_index=True)
+    owner = models.CharField(max_length=255, blank=True, help_text="User (or client address) for fair sharing")
+    estimate = models.JSONField(null=True, blank=True, help_text="Predicted time/disk at submit (renderer/estimate.py)")
+    error = models.TextField(blank=True)
+    log = models.TextField(blank=True)
+    output = models.FileField(upload_to='outputs/', max_length=500, null=True, blank=True)
+    outputs = models.JSONField(default=dict, blank=True, help_text="Extra output targets: name -> path under MEDIA_ROOT")
+    input_data = models.ForeignKey('InputData', related_name='render_jobs', null=True, blank=True, on_delete=models.SET_NULL)
+    worker = models.CharField(max_length=255, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.title or self.id} ({self.status})"
+
+class RenderChunk(models.Model):
+    """A time slice [start, end) of a long RenderJob, rendered by any worker and stitched by the job's owner"""
+    QUEUED = RenderJob.QUEUED
+    RUNNING = RenderJob.RUNNING
+    DONE = RenderJob.DONE
+    FAILED = RenderJob.FAILED
+    CANCELLED = RenderJob.CANCELLED
+
+    job = models.ForeignKey(RenderJob, related_name='chunks', on_delete=models.CASCADE)
+    index = models.PositiveIntegerField()
+    start = models.FloatField()
+    end = models.FloatField()
+    status = models.CharField(max_length=10, choices=RenderJob.STATUS_CHOICES, default=QUEUED, db_index=True)
+    error = models.TextField(blank=True)
+    output = models.FileField(upload_to='chunks/', max_length=500, null=True, blank=True)
+    worker = models.CharField(max_length=255, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['job', 'index']
+        unique_together = [('job', 'index')]
+
+    def __str__(self):
+        return f"{self.job_id} #{self.index} {self.start:.1f}-{self.end:.1f}s ({self.status})"
+
+class RenderRun(models.Model):
+    """One render request and where its time went (see renderer/telemetry.py)"""
+    OK = 'ok'
+    FAILED = 'failed'
+
+    input_data = models.ForeignKey('InputData', related_name='render_runs', null=True, blank=True, on_delete=models.SET_NULL)
+    title = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=10, choices=[(OK, 'OK'), (FAILED, 'Failed')], default=OK)
+    error = models.TextField(blank=True)
+    priority = models.CharField(max_length=12, blank=True, choices=RenderJob.PRIORITY_CHOICES)
+    host = models.CharField(max_length=255, blank=True)
+    source_duration = models.FloatField(null=True, blank=True)
+    queue_wait_sec = models.FloatField(default=0)
+    wall_sec = models.FloatField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.title or 'render'} @ {self.created_at:%Y-%m-%d %H:%M} ({self.wall_sec:.1f}s)"
+
+class RenderStage(models.Model):
+    """One ffmpeg process or in-process step (e.g. whisper) within a RenderRun"""
+    run = models.ForeignKey(RenderRun, related_name='stages', on_delete=models.CASCADE)
+    order = models.PositiveIntegerField(default=0)
+    name = models.CharField(max_length=64)
+    command = models.TextField(blank=True)
+    wall_sec = models.FloatField()
+    cpu_user_sec = models.FloatField(default=0)
+    cpu_sys_sec = models.FloatField(default=0)
+    max_rss_kb = models.BigIntegerField(null=True, blank=True)
+    input_bytes = models.BigIntegerField(null=True, blank=True)
+    output_bytes = models.BigIntegerField(null=True, blank=True)
+    frames = models.IntegerField(null=True, blank=True)
+    fps = models.FloatField(null=True, blank=True)
+    returncode = models.IntegerField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['run', 'order']
+
+    def __str__(self):
+        return f"{self.name} ({self.wall_sec:.1f}s)"
+
 # Signal to log when InputData is created
 @receiver(post_save, sender=InputData)
 def log_input_data_creation(sender, instance, created, **kwargs):
@@ -0,0 +1,91 @@
+# renderer/outputs.py
+"""
+Extra output targets rendered alongside the master from a single decode and composite.
+
+A fan-out stage is appended to the pipeline: it reads the composited frames once,
+`split`s them, and encodes the master (as before) plus each target (crop window ->
+raster -> encoder profile) in the same process. Each target's file sits next to the
+master as <master stem>.<target name>.mp4; audio is muxed into each once, as usual.
+"""
+from dataclasses import dataclass
+from functools import partial
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from . import ffmpeg
+from .ffmpeg import run_pipeline
+from .overlay import W, H
+from .pipeline import AUDIO_BR, Source, Stage, build_pipeline, input_arg, mux_audio, output_args
+from .telemetry import stage_name
+
+X264_PRESETS = ("ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow", "slower", "veryslow")
+X264_PROFILES = ("baseline", "main", "high")
+MAX_TARGETS = 4
+
+@dataclass
+class OutputTarget:
+    name: str
+    width: int
+    height: int
+    crop: Optional[List[int]] = None  # [x, y, w, h] window of the W x H composite; None = whole frame
+    crf: int = 20
+    preset: str = "medium"
+    profile: str = "high"
+    audio_br: str = AUDIO_BR
+
+def center_crop(aspect_w: int, aspect_h: int, w: int = W, h: int = H) -> List[int]:
+    """Largest centered aspect_w:aspect_h window of a w x h frame (even sizes for yuv420p)."""
+    if w * aspect_h > h * aspect_w:
+        cw, ch = int(h * aspect_w / aspect_h) // 2 * 2, h
+    else:
+        cw, ch = w, int(w * aspect_h / aspect_w) // 2 * 2
+    return [(w - cw) // 2, (h - ch) // 2, cw, ch]
+
+PRESETS: Dict[str, OutputTarget] = {
+    "720p": OutputTarget("720p", 1280, 720),
+    "vertical": OutputTarget("vertical", 1080, 1920, crop=center_crop(9, 16)),
+    "square": OutputTarget("square", 1080, 1080, crop=center_crop(1, 1)),
+}
+
+def sibling_path(master: Path, name: str) -> Path:
+    master = Path(master)
+    return master.with_name(f"{master.stem}.{name}{master.suffix}")
+
+def build_fanout_cmd(src: Source, out_path: Path, targets: List[OutputTarget]) -> List[str]:
+    """Last stage: the master encode to out_path plus every target, all from one read of the frames."""
+    n = len(targets) + 1
+    chains = [f"[0:v]split={n}[master]" + "".join(f"[s{i}]" for i in range(len(targets)))]
+    for i, t in enumerate(targets):
+        crop = f"crop={t.crop[2]}:{t.crop[3]}:{t.crop[0]}:{t.crop[1]}," if t.crop else ""
+        chains.append(f"[s{i}]{crop}scale={t.width}:{t.height},setsar=1,format=yuv420p[o{i}]")
+    threads = ["-threads", str(ffmpeg.THREADS)]  # per output; with_resource_args only covers the last
+    cmd = ["ffmpeg", "-y", *input_arg(src), "-filter_complex", ";".join(chains),
+           "-map", "[master]", *threads, *output_args(out_path)]
+    for i, t in enumerate(targets):
+        cmd += ["-map", f"[o{i}]", "-an", "-c:v", "libx264", "-preset", t.preset, "-profile:v", t.profile,
+                "-crf", str(t.crf), *threads, str(sibling_path(out_path, t.name))]
+    return cmd
+
+def render_outputs(src: Path, stages: List[Stage], out_path: Path, targets: List[OutputTarget],
+                   audio_src: Optional[Path] = None) -> List[Path]:
+    """
+    render_stages() with extra targets: one pipeline whose last stage fans out, then audio
+    muxed into each file. Returns the targets' final paths (siblings of out_path).
+    """
+    out_path = Path(out_path)
+    video_only = out_path.with_name(f"{out_path.stem}.video{out_path.suffix}")
+    stages = list(stages) + [partial(build_fanout_cmd, targets=targets)]
+    intermediates = [video_only] + [sibling_path(video_only, t.name) for t in targets]
+    try:
+        # the fan-out process runs the master encoder plus one per target
+        run_pipeline(build_pipeline(src, stages, video_only), names=[stage_name(s) for s in stages],
+                     weights=[1] * (len(stages) - 1) + [len(targets) + 1])
+        mux_audio(video_only, audio_src or src, out_path)
+        paths = []
+        for t, video in zip(targets, intermediates[1:]):
+            paths.append(sibling_path(out_path, t.name))
+            mux_audio(video, audio_src or src, paths[-1], t.audio_br)
+        return paths
+    finally:
+        for p in intermediates:
+            p.unlink(missing_ok=True)
@@ -1,19 +1,54 @@
 # renderer/overlay.py
-import subprocess
+import os
 from dataclasses import dataclass
+from math import ceil
 from pathlib import Path
 from typing import Optional, List
 
+from django.conf import settings
+
+from .broll import media_fingerprint
+from .ffmpeg import run
+
 # Match project defaults
 W, H, FPS = 1920, 1080, 30
 CRF = 18
 DEFAULT_FADE_IN = 0.25   # fade duration in seconds
 DEFAULT_FADE_OUT = 0.25  # fade duration in seconds
+IMAGE_EXTS = {".png", ".jpg", ".jpeg", ".webp", ".bmp"}
+
+# ---------- still images ----------
+def still_cache_dir() -> Path:
+    """Prescaled stills, shared by every node; unused ones age out in workspace.collect_garbage."""
+    return Path(settings.MEDIA_ROOT) / "cache" / "stills"
 
+def is_image(path) -> bool:
+    return Path(path).suffix.lower() in IMAGE_EXTS
 
+def prepare_still(path: Path, w: int = W, h: int = H, cache_dir: Optional[Path] = None) -> Path:
+    """
+    Scale a still to w x h once and cache it (keyed by content and size), so render
+    graphs never decode and rescale the image per output frame.
+    """
+    cache_dir = Path(cache_dir or still_cache_dir())
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    out = cache_dir / f"{media_fingerprint(Path(path))}_{w}x{h}.png"
+    try:
+        os.utime(out)  # mtime = last use, for garbage collection
+    except FileNotFoundError:
+        tmp = out.with_name(f".{os.getpid()}.{out.name}")
+        run(["ffmpeg", "-y", "-i", path, "-vf", f"scale={w}:{h},format=rgba", "-frames:v", "1", tmp],
+            stage="prescale_still")
+        os.replace(tmp, out)  # atomic: concurrent renders never see a half-written file
+    return out
 
-def _run(cmd: str):
-    return subprocess.run(cmd, capture_output=True, text=True, check=True, shell=True)
+def still_chain(label: str, t0: float, t1: float, fps: int = FPS) -> str:
+    """
+    Filters turning a single-frame image input into frames covering only [t0, t1]:
+    the pixel format is converted once, then the frame is repeated by reference.
+    """
+    n = max(1, ceil((t1 - t0) * fps))
+    return f"{label}format=yuva420p,loop=loop={n - 1}:size=1:start=0,setpts=N/({fps}*TB)+{t0:.3f}/TB"
 
 def prepare_overlay_chain(
     input_idx: int,
@@ -21,6 +56,7 @@ def prepare_overlay_chain(
     t1: float,
     fade_in: float = DEFAULT_FADE_IN,
     fade_out: float = DEFAULT_FADE_OUT,
+    still: bool = False,
 ) -> List[str]:
     """
     Creates ffmpeg filter chains for overlay processing including:
@@ -34,6 +70,7 @@ def prepare_overlay_chain(
         t1: End time in seconds
         fade_in: Fade in duration in seconds
         fade_out: Fade out duration in seconds
+        still: Input is a single pre-scaled image frame (see prepare_still)
         
     Returns:
         List of ffmpeg filter chains
@@ -48,14 +85,18 @@ def prepare_overlay_chain(
     expanded_w = int(W * 1.0)  # 40% larger width
     expanded_h = int(H * 1.0)  # 40% larger height
     
-    # CRITICAL: Trim overlay from 0 to duration, reset timestamps, then shift to timeline position
-    # This ensures the overlay video plays from its beginning, not from timeline position
-    # Same logic as broll.py to prevent trimming issues
-    chains.append(
-        f"[{last_label}]scale={expanded_w}:{expanded_h},format=yuv420p,"
-        f"trim=0:{dur:.3f},setpts=PTS-STARTPTS,"
-        f"setpts=PTS+{t0}/TB[base_{input_idx}]"
-    )
+    if still:
+        # Already at the target size: just hold the one frame for the window
+        chains.append(still_chain(f"[{last_label}]", t0, t1) + f"[base_{input_idx}]")
+    else:
+        # CRITICAL: Trim overlay from 0 to duration, reset timestamps, then shift to timeline position
+        # This ensures the overlay video plays from its beginning, not from timeline position
+        # Same logic as broll.py to prevent trimming issues
+        chains.append(
+            f"[{last_label}]scale={expanded_w}:{expanded_h},format=yuv420p,"
+            f"trim=0:{dur:.3f},setpts=PTS-STARTPTS,"
+            f"setpts=PTS+{t0}/TB[base_{input_idx}]"
+        )
     last_label = f"base_{input_idx}"
     
     # Apply fades
@@ -94,7 +135,7 @@ def apply_overlay_effects(
     """
     if dur_sec <= 0:
         # Nothing to do, just copy the base video
-        _run(f'ffmpeg -y -i "{base_path}" -c copy "{out_path}"')
+        run(["ffmpeg", "-y", "-i", base_path, "-c", "copy", out_path])
         return
         
     t0 = float(start_sec)
@@ -106,14 +147,17 @@ def apply_overlay_effects(
     # Setup base video
     chains.append(f"[0:v]scale={W}:{H},fps={FPS},format=yuv420p,setsar=1[base]")
     
-    # Process overlay
-    is_image = overlay_path.suffix.lower() in {".png", ".jpg", ".jpeg", ".webp", ".bmp"}
+    # Process overlay (stills are pre-scaled once and fed as a single frame)
+    still = is_image(overlay_path)
+    if still:
+        overlay_path = prepare_still(overlay_path)
     overlay_chains = prepare_overlay_chain(
         input_idx=1,
         t0=t0,
         t1=t1,
         fade_in=fade_in,
         fade_out=fade_out,
+        still=still,
     )
     chains.extend(overlay_chains)
     
@@ -126,19 +170,14 @@ def apply_overlay_effects(
     # Build the ffmpeg command
     filter_complex = ";".join(chains)
     
-    if is_image:
-        inputs = f'-i "{base_path}" -loop 1 -i "{overlay_path}"'
-        tail = "-shortest"
-    else:
-        inputs = f'-i "{base_path}" -i "{overlay_path}"'
-        tail = ""
+    inputs = ["-i", str(base_path), "-i", str(overlay_path)]
         
-    cmd = (
-        f'ffmpeg -y {inputs} '
-        f'-filter_complex "{filter_complex}" '
-        f'-map "[v]" -map 0:a? '
-        f'-c:v libx264 -preset medium -crf {CRF} '
-        f'-c:a copy {tail} "{out_path}"'
-    )
+    cmd = [
+        "ffmpeg", "-y", *inputs,
+        "-filter_complex", filter_complex,
+        "-map", "[v]", "-map", "0:a?",
+        "-c:v", "libx264", "-preset", "medium", "-crf", str(CRF),
+        "-c:a", "copy", str(out_path),
+    ]
     
-    _run(cmd)
+    run(cmd, stage="overlay_effects")
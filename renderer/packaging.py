@@ -0,0 +1,169 @@
+# renderer/packaging.py
+"""
+Adaptive-bitrate packaging of completed videos.
+
+Once a video is marked complete, its final MP4 is decoded once, `split` into a ladder of
+scaled renditions that one ffmpeg process encodes side by side, and written as HLS
+(master.m3u8 plus one playlist per rendition, fMP4 segments) under MEDIA_ROOT/streams/<id>/.
+With PACKAGE_DASH the DASH muxer writes manifest.mpd and the HLS playlists from the same
+segments. GOPs are aligned to the segment length so players can switch at every segment.
+
+Packaging runs in the background (batch priority) on a small pool in the web process;
+`manage.py package_outputs` (re)packages anything left queued, failed or missing.
+"""
+import os, shutil, threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from . import ffmpeg, telemetry
+from .farm import error_text
+from .ffmpeg import run
+from .mediainfo import media_info
+from .models import InputData
+
+SEGMENT_SECONDS = 4
+PACKAGE_WORKERS = 1
+PRESET = "veryfast"
+MAXRATE = 1.07  # peak bitrate allowed over the rung's average
+BUFSIZE = 2.0   # VBV buffer, in seconds of the average bitrate
+
+@dataclass(frozen=True)
+class Rung:
+    height: int
+    video_kbps: int
+    audio_kbps: int
+
+LADDER = (
+    Rung(1080, 5000, 128),
+    Rung(720, 2800, 128),
+    Rung(480, 1200, 96),
+    Rung(360, 700, 96),
+)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _pool() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=PACKAGE_WORKERS, thread_name_prefix="package")
+        return _executor
+
+def enabled() -> bool:
+    return bool(getattr(settings, "PACKAGE_OUTPUTS", True))
+
+def dash_enabled() -> bool:
+    return bool(getattr(settings, "PACKAGE_DASH", False))
+
+def stream_dir(input_data_id) -> Path:
+    return Path(settings.MEDIA_ROOT) / "streams" / str(input_data_id)
+
+def ladder_for(height: Optional[int]) -> List[Rung]:
+    """Rungs at or below the source height (never upscale); at least the smallest one."""
+    rungs = [r for r in LADDER if not height or r.height <= height]
+    return rungs or [LADDER[-1]]
+
+# ---------- command ----------
+def build_ladder_cmd(src: Path, outdir: Path, rungs: List[Rung], fps: float,
+                     has_audio: bool = True, dash: bool = False) -> List[str]:
+    """One decode, split into every rung, each encoded with segment-aligned GOPs."""
+    n = len(rungs)
+    chains = [f"[0:v]split={n}" + "".join(f"[s{i}]" for i in range(n))]
+    chains += [f"[s{i}]scale=-2:{r.height},format=yuv420p,setsar=1[v{i}]" for i, r in enumerate(rungs)]
+    gop = max(1, round(fps * SEGMENT_SECONDS))
+    cmd = ["ffmpeg", "-y", "-i", str(src), "-filter_complex", ";".join(chains)]
+
+    # HLS variants each carry their own audio; DASH shares one audio adaptation set
+    audio = [r.audio_kbps for r in rungs] if not dash else [rungs[0].audio_kbps]
+    for i in range(n):
+        cmd += ["-map", f"[v{i}]"]
+    if has_audio:
+        for _ in audio:
+            cmd += ["-map", "0:a:0"]
+    for i, r in enumerate(rungs):
+        cmd += [f"-c:v:{i}", "libx264", f"-b:v:{i}", f"{r.video_kbps}k",
+                f"-maxrate:v:{i}", f"{int(r.video_kbps * MAXRATE)}k", f"-bufsize:v:{i}", f"{int(r.video_kbps * BUFSIZE)}k"]
+    if has_audio:
+        for i, kbps in enumerate(audio):
+            cmd += [f"-c:a:{i}", "aac", f"-b:a:{i}", f"{kbps}k"]
+    cmd += ["-preset", PRESET, "-g", str(gop), "-keyint_min", str(gop), "-sc_threshold", "0"]
+
+    if dash:
+        sets = "id=0,streams=v id=1,streams=a" if has_audio else "id=0,streams=v"
+        return cmd + [
+            "-f", "dash", "-seg_duration", str(SEGMENT_SECONDS), "-use_template", "1", "-use_timeline", "1",
+            "-adaptation_sets", sets, "-hls_playlist", "1", "-hls_master_name", "master.m3u8",
+            "-init_seg_name", "init-$RepresentationID$.m4s",
+            "-media_seg_name", "chunk-$RepresentationID$-$Number%05d$.m4s",
+            str(outdir / "manifest.mpd"),
+        ]
+    var_map = " ".join(f"v:{i},a:{i}" if has_audio else f"v:{i}" for i in range(n))
+    return cmd + [
+        "-f", "hls", "-hls_time", str(SEGMENT_SECONDS), "-hls_playlist_type", "vod",
+        "-hls_segment_type", "fmp4", "-hls_flags", "independent_segments",
+        "-master_pl_name", "master.m3u8", "-var_stream_map", var_map,
+        "-hls_segment_filename", str(outdir / "%v" / "seg_%05d.m4s"),
+        str(outdir / "%v" / "index.m3u8"),
+    ]
+
+def package_output(src: Path, dest: Path, dash: bool = False) -> Tuple[Path, Optional[Path]]:
+    """Write the ladder for src into dest (replaced atomically); returns (HLS master, DASH manifest or None)."""
+    info = media_info(src)
+    rungs = ladder_for(info.get("height"))
+    tmp = dest.with_name(f".{os.getpid()}.{dest.name}")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    try:
+        cmd = build_ladder_cmd(src, tmp, rungs, info.get("fps") or 30, info.get("has_audio", True), dash)
+        run(cmd, stage="package_ladder", slots=len(rungs))  # one process, one encoder per rung
+        shutil.rmtree(dest, ignore_errors=True)
+        os.replace(tmp, dest)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return dest / "master.m3u8", (dest / "manifest.mpd") if dash else None
+
+# ---------- background queue ----------
+def submit(input_data: InputData):
+    """Queue packaging of a completed video; it starts once the current transaction commits."""
+    if not enabled() or not input_data.completed_video:
+        return
+    InputData.objects.filter(pk=input_data.pk).update(stream_status=InputData.STREAM_QUEUED, stream_error="")
+    transaction.on_commit(lambda: _pool().submit(package, input_data.pk))
+
+def package(pk) -> bool:
+    """Claim a queued packaging (compare-and-swap, so one process takes it) and run it; never raises."""
+    try:
+        if not InputData.objects.filter(pk=pk, stream_status=InputData.STREAM_QUEUED).update(
+                stream_status=InputData.STREAM_RUNNING):
+            return False
+        obj = InputData.objects.get(pk=pk)
+        media_root = Path(settings.MEDIA_ROOT)
+        with ffmpeg.priority(ffmpeg.BATCH), telemetry.recording(title=f"{obj.title} (ladder)") as rec:
+            rec.priority = ffmpeg.BATCH
+            try:
+                src = media_root / obj.completed_video.name
+                rec.source_duration = media_info(src)["duration"]
+                hls, mpd = package_output(src, stream_dir(pk), dash_enabled())
+                fields = {
+                    "stream_status": InputData.STREAM_DONE,
+                    "stream_manifest": hls.relative_to(media_root).as_posix(),
+                    "stream_dash_manifest": mpd.relative_to(media_root).as_posix() if mpd else "",
+                }
+            except Exception as e:
+                rec.error = error_text(e)
+                fields = {"stream_status": InputData.STREAM_FAILED, "stream_error": rec.error}
+            InputData.objects.filter(pk=pk).update(**fields)
+        if rec.stages:
+            telemetry.save_run(rec)
+        return True
+    except Exception as e:
+        print(f"Packaging {pk} crashed: {e}")
+        return True
+    finally:
+        close_old_connections()
@@ -0,0 +1,80 @@
+# renderer/pipeline.py
+from pathlib import Path
+from typing import Callable, List, Optional, Union
+
+from .ffmpeg import run, run_pipeline
+from .telemetry import stage_name
+
+# Stages connected by pipes exchange lossless NUT (raw video frames).
+# Only the last stage encodes, so there are no intermediate files, no repeated
+# H.264 decodes and no generation loss between stages.
+# Stages are video-only: audio is muxed once from the source in mux_audio().
+PIPE = "pipe"
+PIPE_OUT_ARGS = ["-an", "-c:v", "rawvideo", "-f", "nut", "pipe:1"]
+AUDIO_BR = "192k"
+AUDIO_COPY_CODECS = {"aac"}  # already MP4-friendly: stream copy instead of re-encoding
+
+Source = Union[Path, str]
+Stage = Callable[[Source, Optional[Path]], List[str]]   # stage(src, out_path or None) -> ffmpeg argv
+
+def input_arg(src: Source) -> List[str]:
+    """
+    ffmpeg input for a stage: a file, or NUT frames from the previous stage on stdin.
+    Piped frames keep the timestamps the previous stage wrote (-copyts; ffmpeg would
+    otherwise restart them at 0), so a windowed preview or chunk that starts at w0 stays
+    on the timeline's clock for every enable/fade/subtitle/trim time downstream. Other
+    inputs of piped stages (PiP overlays, audio) rebase their own timestamps.
+    """
+    if src == PIPE:
+        return ["-copyts", "-f", "nut", "-i", "pipe:0"]
+    return ["-i", str(src)]
+
+def output_args(out_path: Optional[Path], crf: int = 18) -> List[str]:
+    """Final video-only H.264 encode to out_path, or raw NUT to stdout when out_path is None."""
+    if out_path is None:
+        return list(PIPE_OUT_ARGS)
+    return ["-an", "-c:v", "libx264", "-preset", "medium", "-crf", str(crf), str(out_path)]
+
+def build_pipeline(src: Source, stages: List[Stage], out_path: Path) -> List[List[str]]:
+    """Commands for src -> stage1 -> ... -> stageN -> out_path; all but the last write to stdout."""
+    cmds = []
+    for i, stage in enumerate(stages):
+        last = i == len(stages) - 1
+        cmds.append(stage(src if i == 0 else PIPE, out_path if last else None))
+    return cmds
+
+# ---------- audio: handled once ----------
+def probe_audio_codec(path: Path) -> Optional[str]:
+    """Codec name of the first audio stream, or None if the file has no audio."""
+    res = run([
+        "ffprobe", "-v", "error", "-select_streams", "a:0",
+        "-show_entries", "stream=codec_name", "-of", "default=nw=1:nk=1", path,
+    ])
+    return res.stdout.strip() or None
+
+def mux_audio(video_path: Path, audio_src: Path, out_path: Path, audio_br: str = AUDIO_BR):
+    """
+    Final step: video stream copied as-is, audio taken from audio_src exactly once -
+    stream-copied when it is already AAC, otherwise encoded to AAC a single time.
+    """
+    codec = probe_audio_codec(audio_src)
+    if codec is None:
+        cmd = ["ffmpeg", "-y", "-i", video_path, "-map", "0:v", "-c", "copy",
+               "-movflags", "+faststart", out_path]
+    else:
+        a_args = ["-c:a", "copy"] if codec in AUDIO_COPY_CODECS else ["-c:a", "aac", "-b:a", audio_br]
+        cmd = ["ffmpeg", "-y", "-i", video_path, "-i", audio_src,
+               "-map", "0:v", "-map", "1:a:0", "-c:v", "copy", *a_args,
+               "-movflags", "+faststart", out_path]
+    run(cmd, stage="mux_audio")
+
+def render_stages(src: Path, stages: List[Stage], out_path: Path,
+                  audio_src: Optional[Path] = None, audio_br: str = AUDIO_BR):
+    """Run the video-only stage pipeline, then mux audio from audio_src (default: src) once."""
+    out_path = Path(out_path)
+    video_only = out_path.with_name(f"{out_path.stem}.video{out_path.suffix}")
+    try:
+        run_pipeline(build_pipeline(src, stages, video_only), names=[stage_name(s) for s in stages])
+        mux_audio(video_only, audio_src or src, out_path, audio_br)
+    finally:
+        video_only.unlink(missing_ok=True)
@@ -0,0 +1,118 @@
+# renderer/preflight.py
+"""
+Fail-fast checks run after a render is planned and before anything slow (transcription,
+the full encode).
+
+1. Every stage's inputs are checked against the cached probe metadata: each file must
+   exist and have a video stream (and a duration, unless it is a still).
+2. Each stage's filter graph is checked for values ffmpeg only rejects at run time
+   (e.g. a fade that would start before 0s).
+3. Every stage runs for one second into the null muxer, all stages at once, so a graph
+   that doesn't initialise fails in about a second instead of minutes into an encode.
+"""
+import re
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from pathlib import Path
+from typing import List, Sequence
+
+from django.conf import settings
+
+from .ffmpeg import run
+from .mediainfo import media_info
+from .overlay import is_image
+from .pipeline import PIPE, PIPE_OUT_ARGS, Source, Stage
+from .telemetry import input_paths, stage_name
+
+TRIAL_SECONDS = 1
+TRIAL_OUT_ARGS = ["-t", str(TRIAL_SECONDS), "-an", "-f", "null", "-"]
+NEGATIVE_START_RE = re.compile(r"(\w+)=[^;,\[]*?\bst=(-\d[\d.]*)")
+ERROR_LINES = 3  # stderr lines quoted in a trial failure
+
+class PreflightError(ValueError):
+    pass
+
+def enabled() -> bool:
+    return bool(getattr(settings, "RENDER_PREFLIGHT", True))
+
+def _label(i: int, stage: Stage) -> str:
+    return f"Stage {i + 1} ({stage_name(stage)})"
+
+# ---------- inputs ----------
+def check_input(path: Path) -> str:
+    """Problem with one input file, or "" if it looks renderable."""
+    path = Path(path)
+    if not path.exists():
+        return f"{path.name} does not exist"
+    info = media_info(path)
+    if info.get("error"):
+        return f"{path.name} has no duration (unreadable or empty media): {info['error']}"
+    if not info.get("width"):
+        return f"{path.name} has no video stream"
+    if not is_image(path) and info.get("duration", 0) <= 0:
+        return f"{path.name} has no duration (unreadable or empty media)"
+    return ""
+
+def check_inputs(cmds: Sequence[List[str]], labels: Sequence[str]) -> List[str]:
+    problems, seen = [], set()
+    for cmd, label in zip(cmds, labels):
+        for src in input_paths(cmd):
+            if src == "pipe:0" or src in seen:
+                continue
+            seen.add(src)
+            problem = check_input(Path(src))
+            if problem:
+                problems.append(f"{label}: {problem}")
+    return problems
+
+# ---------- graphs ----------
+def _graphs(cmd: List[str]) -> List[str]:
+    return [cmd[i + 1] for i, a in enumerate(cmd[:-1]) if a in ("-filter_complex", "-vf")]
+
+def check_graphs(cmds: Sequence[List[str]], labels: Sequence[str]) -> List[str]:
+    problems = []
+    for cmd, label in zip(cmds, labels):
+        for graph in _graphs(cmd):
+            for name, st in NEGATIVE_START_RE.findall(graph):
+                problems.append(f"{label}: {name} would start at {float(st):.2f}s "
+                                f"(the row ends before its fade can run)")
+    return problems
+
+# ---------- trial runs ----------
+def trial_cmd(cmd: List[str]) -> List[str]:
+    """A stage's command (built to write NUT to stdout) rewritten to encode TRIAL_SECONDS to nowhere."""
+    if cmd[-len(PIPE_OUT_ARGS):] != PIPE_OUT_ARGS:
+        raise ValueError("stage command does not end in the pipe output")
+    return cmd[:-len(PIPE_OUT_ARGS)] + TRIAL_OUT_ARGS
+
+def _error_tail(stderr: str) -> str:
+    lines = [ln.strip() for ln in (stderr or "").splitlines() if ln.strip()]
+    return " | ".join(lines[-ERROR_LINES:]) or "ffmpeg failed"
+
+def trial_run(cmds: Sequence[List[str]], labels: Sequence[str]) -> List[str]:
+    """Run every stage's trial at once; returns the failures."""
+    def one(cmd):
+        return run(trial_cmd(cmd), check=False, stage="preflight")
+
+    with ThreadPoolExecutor(max_workers=max(1, len(cmds)), thread_name_prefix="preflight") as pool:
+        # copy_context: trials keep the caller's priority class and telemetry recorder
+        futures = [pool.submit(copy_context().run, one, cmd) for cmd in cmds]
+        results = [f.result() for f in futures]
+    return [f"{label}: {_error_tail(res.stderr)}"
+            for label, res in zip(labels, results) if res.returncode != 0]
+
+# ---------- entry point ----------
+def check_stages(base_path: Source, stages: Sequence[Stage]):
+    """
+    Raise PreflightError naming every broken stage. Each stage is built reading the base
+    video directly (in the pipeline, stages after the first read the previous one's frames).
+    """
+    if not enabled() or not stages or base_path == PIPE:
+        return
+    cmds = [[str(a) for a in stage(base_path, None)] for stage in stages]
+    labels = [_label(i, s) for i, s in enumerate(stages)]
+    problems = check_inputs(cmds, labels) or check_graphs(cmds, labels)
+    if not problems:
+        problems = trial_run(cmds, labels)
+    if problems:
+        raise PreflightError("Render rejected before encoding:\n" + "\n".join(problems))
@@ -0,0 +1,216 @@
+# renderer/preview.py
+"""
+Fast previews of a timeline spec: a single frame, or a short preview-quality clip around
+one B-roll/PiP row.
+
+Previews run the exact stages a real render runs (plan_stages + the same builders); only
+the first stage is windowed around the requested time, and frames keep their absolute
+timestamps so every later enable/fade/subtitle time still applies unchanged.
+"""
+import hashlib, json, os
+from dataclasses import dataclass
+from functools import partial
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+
+from . import telemetry
+from .broll import FPS, build_overlay_cmd, media_fingerprint
+from .captions import build_burn_in_cmd, transcribe_to_srt
+from .ffmpeg import run, run_pipeline
+from .mediainfo import media_duration
+from .pipeline import Source, Stage, build_pipeline, input_arg
+from .telemetry import stage_name
+from .timeline import Plan, TimelineSpec, load_cuts, place_window, plan_stages, resolve_assets, trim_silence
+
+PREVIEW_WIDTH = 960
+JPEG_QUALITY = 3  # ffmpeg -q:v, 2 (best) .. 31
+
+def cache_dir(*parts: str) -> Path:
+    d = Path(settings.MEDIA_ROOT) / "cache" / "previews"
+    d = d.joinpath(*parts)
+    d.mkdir(parents=True, exist_ok=True)
+    return d
+
+def spec_key(spec: TimelineSpec) -> str:
+    """Stable hash of a spec (asset ids are immutable once an upload completes)."""
+    return hashlib.sha1(json.dumps(spec.to_dict(), sort_keys=True).encode()).hexdigest()
+
+def frame_index(t: float) -> int:
+    return int(round(t * FPS))
+
+# ---------- preparing a spec ----------
+@dataclass
+class Prepared:
+    main_path: Path
+    base_path: Path
+    video_dur: float
+    plan: Plan
+    srt_path: Optional[Path]
+    keeps: Optional[List[Tuple[float, float]]] = None
+    cuts: Optional[List[float]] = None
+
+def cached_trim(main_path: Path, video_dur: float, padding: float):
+    """trim_silence() once per (main video, padding); previews reuse the trimmed file."""
+    d = Path(settings.MEDIA_ROOT) / "cache" / "trimmed" / f"{media_fingerprint(main_path)}_{padding:.3f}"
+    meta = d / "keeps.json"
+    if meta.exists():
+        data = json.loads(meta.read_text())
+        keeps = [tuple(k) for k in data["keeps"]] if data["keeps"] else None
+        return (Path(data["path"]) if keeps else main_path), data["dur"], keeps
+    d.mkdir(parents=True, exist_ok=True)
+    base, dur, keeps = trim_silence(main_path, video_dur, padding, d)
+    meta.write_text(json.dumps({"path": str(base) if keeps else None, "dur": dur, "keeps": keeps}))
+    return base, dur, keeps
+
+def prepare(spec: TimelineSpec, transcribe: bool = False) -> Prepared:
+    """
+    Everything the stages need, from shared caches under MEDIA_ROOT so any worker node
+    can repeat it cheaply. With transcribe=True a missing transcript is created first.
+    """
+    paths = resolve_assets(spec)
+    main_path = paths[spec.main_asset]
+    video_dur = media_duration(main_path)
+    if video_dur <= 0:
+        raise ValueError("Could not detect duration from the main video.")
+    base, dur, keeps = main_path, video_dur, None
+    if spec.trim_silence:
+        base, dur, keeps = cached_trim(main_path, video_dur, spec.silence_padding)
+    cuts = load_cuts(base) if (spec.snap_broll or spec.snap_pip) else None
+    plan = plan_stages(spec, paths, dur, keeps, cuts)
+    # Transcribing is far too slow for a preview: use a transcript from an earlier render if any
+    srt_path = None
+    if spec.captions:
+        candidate = Path(base).with_suffix(".auto.srt")
+        if transcribe and not candidate.exists():
+            try:
+                with telemetry.stage("transcribe", inputs=[base]) as st:
+                    st.output = transcribe_to_srt(Path(base), spec.caption_model)
+            except Exception as cap_err:
+                plan.messages.append(f"Captions skipped: {cap_err}")
+        srt_path = candidate if candidate.exists() else None
+    return Prepared(main_path=main_path, base_path=Path(base), video_dur=dur, plan=plan,
+                    srt_path=srt_path, keeps=keeps, cuts=cuts)
+
+def _time_window(window: Tuple[float, float]):
+    """Size the ffmpeg timeout (ffmpeg.stage_timeout) for a render of just this window."""
+    rec = telemetry.current()
+    if rec is not None:
+        rec.source_duration = window[1] - window[0]
+
+def windowed_stages(prep: Prepared, window: Tuple[float, float]) -> List[Stage]:
+    """The render's stages, with the first (B-roll) stage producing only `window` and
+    only the PiP stages whose span intersects it (plan.stages[i + 1] draws plan.pips[i])."""
+    a, b = window
+    pips = [stage for stage, p in zip(prep.plan.stages[1:], prep.plan.pips)
+            if p["start"] < b and p["start"] + p["duration"] > a]
+    stages = [partial(build_overlay_cmd, segs=prep.plan.segs, window=window)] + pips
+    if prep.srt_path:
+        stages.append(partial(build_burn_in_cmd, srt_path=prep.srt_path))
+    return stages
+
+# ---------- single frame ----------
+def build_frame_cmd(src: Source, out_path: Path, t: float, width: int = PREVIEW_WIDTH) -> List[str]:
+    """Last preview stage: the first frame at or after t, as a JPEG. Reads to EOF so upstream never sees EPIPE."""
+    return [
+        "ffmpeg", "-y", *input_arg(src),
+        "-vf", f"trim=start={t:.6f},trim=end_frame=1,scale={width}:-2",
+        "-an", "-q:v", str(JPEG_QUALITY), "-update", "1", str(out_path),
+    ]
+
+def render_frame(spec: TimelineSpec, t: float, width: int = PREVIEW_WIDTH) -> Path:
+    """JPEG of the composed timeline at time t (seconds on the rendered timeline), cached."""
+    idx = frame_index(t)
+    out = cache_dir("frames") / f"{spec_key(spec)}_{idx}_{width}.jpg"
+    if out.exists():
+        return out
+
+    prep = prepare(spec)
+    if not 0 <= t < prep.video_dur:
+        raise ValueError(f"t must be within 0..{prep.video_dur:.3f}s")
+    t = idx / FPS
+    _time_window((t, t + 2.0 / FPS))
+    stages = windowed_stages(prep, (t, t + 2.0 / FPS)) + [partial(build_frame_cmd, t=t, width=width)]
+    tmp = out.with_name(f".{os.getpid()}.{out.name}")
+    try:
+        run_pipeline(build_pipeline(prep.base_path, stages, tmp), names=[stage_name(s) for s in stages])
+        os.replace(tmp, out)  # atomic: concurrent requests for the same frame never see a partial file
+    finally:
+        tmp.unlink(missing_ok=True)
+    return out
+
+# ---------- mini-render around an edit ----------
+CLIP_PAD = 1.0       # seconds shown before and after the row
+MAX_CLIP_PAD = 5.0
+CLIP_CRF = 30
+CLIP_PRESET = "ultrafast"
+CLIP_AUDIO_BR = "96k"
+ROW_KINDS = ("broll", "pip")
+
+def row_window(spec: TimelineSpec, prep: Prepared, kind: str, index: int) -> Tuple[float, float]:
+    """Where a B-roll/PiP row lands on the rendered timeline (same placement as the render)."""
+    rows = spec.broll if kind == "broll" else spec.pip
+    if not 0 <= index < len(rows):
+        raise ValueError(f"No {kind} row {index}")
+    if kind == "pip":
+        for p in prep.plan.pips:
+            if p["row_index"] == index:
+                return p["start"], p["start"] + p["duration"]
+        raise ValueError(f"PiP row {index} is empty after placement")
+    row = spec.broll[index]
+    start, duration = place_window(row.start, row.duration, prep.video_dur, prep.keeps,
+                                   prep.cuts if spec.snap_broll else None)
+    if duration <= 0:
+        raise ValueError(f"B-roll row {index} is empty after placement")
+    return start, start + duration
+
+def build_clip_cmd(src: Source, out_path: Path, w0: float, w1: float, width: Optional[int] = PREVIEW_WIDTH,
+                   crf: int = CLIP_CRF, preset: str = CLIP_PRESET) -> List[str]:
+    """
+    Last clip stage: cut [w0, w1) from the absolute-time frames, rebase to 0 and encode
+    (small and fast by default; width=None keeps full size). Frames sit on a 1/FPS grid,
+    so the half-frame shift makes back-to-back windows share no frame and drop none.
+    """
+    half = 0.5 / FPS
+    scale = f",scale={width}:-2" if width else ""
+    return [
+        "ffmpeg", "-y", *input_arg(src),
+        "-vf", f"trim=start={w0 - half:.6f}:end={w1 - half:.6f},setpts=PTS-STARTPTS{scale}",
+        "-an", "-c:v", "libx264", "-preset", preset, "-crf", str(crf), "-pix_fmt", "yuv420p",
+        str(out_path),
+    ]
+
+def mux_clip_audio(video_path: Path, audio_src: Path, w0: float, w1: float, out_path: Path):
+    """Add the base video's audio for [w0, w1] (input-seeked, so only that span is decoded)."""
+    run([
+        "ffmpeg", "-y", "-i", video_path, "-ss", f"{w0:.3f}", "-t", f"{w1 - w0:.3f}", "-i", audio_src,
+        "-map", "0:v", "-map", "1:a:0?", "-c:v", "copy", "-c:a", "aac", "-b:a", CLIP_AUDIO_BR,
+        "-shortest", "-movflags", "+faststart", out_path,
+    ], stage="mux_audio")
+
+def render_clip(spec: TimelineSpec, kind: str, index: int, pad: float = CLIP_PAD,
+                width: int = PREVIEW_WIDTH) -> Path:
+    """Preview-quality MP4 of [row start - pad, row end + pad], cached; cost scales with the window."""
+    if kind not in ROW_KINDS:
+        raise ValueError(f"kind must be one of {', '.join(ROW_KINDS)}")
+    pad = max(0.0, min(pad, MAX_CLIP_PAD))
+    out = cache_dir("clips") / f"{spec_key(spec)}_{kind}{index}_{pad:g}_{width}.mp4"
+    if out.exists():
+        return out
+
+    prep = prepare(spec)
+    t0, t1 = row_window(spec, prep, kind, index)
+    w0, w1 = max(0.0, t0 - pad), min(prep.video_dur, t1 + pad)
+    _time_window((w0, w1))
+    stages = windowed_stages(prep, (w0, w1)) + [partial(build_clip_cmd, w0=w0, w1=w1, width=width)]
+    tmp = out.with_name(f".{os.getpid()}.{out.name}")
+    video_only = out.with_name(f".{os.getpid()}.video.{out.name}")
+    try:
+        run_pipeline(build_pipeline(prep.base_path, stages, video_only), names=[stage_name(s) for s in stages])
+        mux_clip_audio(video_only, prep.base_path, w0, w1, tmp)
+        os.replace(tmp, out)
+    finally:
+        tmp.unlink(missing_ok=True)
+        video_only.unlink(missing_ok=True)
+    return out
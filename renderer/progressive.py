@@ -0,0 +1,172 @@
+# renderer/progressive.py
+"""
+Progressive previews: the whole timeline at preview quality, written as fragmented MP4
+(a fragment per keyframe, one per second) while it encodes, so an editor can start
+watching the first minute while the rest is still rendering.
+
+The render writes <key>.mp4.part and renames it to <key>.mp4 when done (or writes
+<key>.mp4.err on failure). It holds an flock on <key>.mp4.lock from start() until it
+finishes, which is what marks the stream as live: start() joins a locked stream instead
+of starting a second render, and follow() streams the part file as it grows until it is
+renamed or removed, or the lock is free (the render died). The lock goes away with the
+process, so a crash never leaves a stream that looks alive. Final renders keep
+`-movflags +faststart`.
+"""
+import fcntl, os, re, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+from django.db import close_old_connections
+
+from . import ffmpeg, telemetry
+from .broll import FPS
+from .captions import build_burn_in_cmd
+from .farm import error_text
+from .ffmpeg import run_pipeline
+from .pipeline import Source, build_pipeline, input_arg
+from .preview import CLIP_AUDIO_BR, CLIP_CRF, CLIP_PRESET, PREVIEW_WIDTH, cache_dir, prepare, spec_key
+from .telemetry import stage_name
+from .timeline import TimelineSpec
+
+FRAG_MOVFLAGS = "frag_keyframe+empty_moov+default_base_moof"
+STREAM_WORKERS = 2      # progressive renders at once per web process
+READ_CHUNK = 64 * 1024
+POLL_SECONDS = 0.25
+STREAM_ID_RE = re.compile(r"^[0-9a-f]{40}_\d+$")
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _pool() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=STREAM_WORKERS, thread_name_prefix="preview-stream")
+        return _executor
+
+# ---------- paths ----------
+def stream_id(spec: TimelineSpec, width: int) -> str:
+    return f"{spec_key(spec)}_{width}"
+
+def stream_path(sid: str) -> Path:
+    if not STREAM_ID_RE.match(sid):
+        raise ValueError("Bad stream id")
+    return cache_dir("streams") / f"{sid}.mp4"
+
+def part_path(path: Path) -> Path:
+    return path.with_name(path.name + ".part")
+
+def error_path(path: Path) -> Path:
+    return path.with_name(path.name + ".err")
+
+def lock_path(path: Path) -> Path:
+    return path.with_name(path.name + ".lock")
+
+def _try_lock(path: Path) -> Optional[int]:
+    """An fd holding the flock on path, or None if another render holds it."""
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return fd
+    except BlockingIOError:
+        os.close(fd)
+        return None
+
+def _rendering(path: Path) -> bool:
+    fd = _try_lock(lock_path(path))
+    if fd is None:
+        return True
+    os.close(fd)  # closing releases the flock
+    return False
+
+# ---------- rendering ----------
+def build_stream_cmd(src: Source, out_path: Path, audio_src: Path, width: int = PREVIEW_WIDTH) -> List[str]:
+    """
+    Last stage: encode frames as they arrive together with the base video's audio, into
+    fragmented MP4 that is playable from the first fragment on.
+    """
+    return [
+        "ffmpeg", "-y", *input_arg(src), "-i", str(audio_src),
+        "-map", "0:v", "-map", "1:a:0?", "-vf", f"scale={width}:-2",
+        "-c:v", "libx264", "-preset", CLIP_PRESET, "-crf", str(CLIP_CRF), "-pix_fmt", "yuv420p",
+        "-g", str(FPS), "-c:a", "aac", "-b:a", CLIP_AUDIO_BR,
+        "-movflags", FRAG_MOVFLAGS, "-f", "mp4", str(out_path),
+    ]
+
+def render_stream(spec: TimelineSpec, width: int, out: Path, lock_fd: int):
+    """Render into out's part file (already created), then publish it under out; releases lock_fd."""
+    part = part_path(out)
+    try:
+        with ffmpeg.priority(ffmpeg.INTERACTIVE), telemetry.recording(title="preview stream") as rec:
+            rec.priority = ffmpeg.INTERACTIVE
+            try:
+                prep = prepare(spec)
+                rec.source_duration = prep.video_dur
+                stages = list(prep.plan.stages)
+                if prep.srt_path:
+                    stages.append(partial(build_burn_in_cmd, srt_path=prep.srt_path))
+                stages.append(partial(build_stream_cmd, audio_src=prep.base_path, width=width))
+                run_pipeline(build_pipeline(prep.base_path, stages, part), names=[stage_name(s) for s in stages])
+                os.replace(part, out)
+            except Exception as e:
+                rec.error = error_text(e)
+                error_path(out).write_text(rec.error, encoding="utf-8")
+                part.unlink(missing_ok=True)
+            finally:
+                if rec.stages:
+                    telemetry.save_run(rec)
+                close_old_connections()
+    finally:
+        os.close(lock_fd)
+
+def start(spec: TimelineSpec, width: int = PREVIEW_WIDTH) -> str:
+    """Start (or join) the progressive render of a spec; returns its stream id."""
+    sid = stream_id(spec, width)
+    out = stream_path(sid)
+    if out.exists():
+        return sid
+    lock_fd = _try_lock(lock_path(out))
+    if lock_fd is None:
+        return sid  # being rendered
+    try:
+        if out.exists():  # finished between the check and the lock
+            os.close(lock_fd)
+            return sid
+        part_path(out).unlink(missing_ok=True)  # a dead render's leftovers (readers keep the old inode)
+        part_path(out).touch()
+        error_path(out).unlink(missing_ok=True)
+        _pool().submit(render_stream, spec, width, out, lock_fd)
+    except BaseException:
+        os.close(lock_fd)
+        raise
+    return sid
+
+# ---------- streaming the growing file ----------
+def open_stream(sid: str):
+    """(file object, part path or None) for a stream; raises FileNotFoundError if there is nothing to read."""
+    out = stream_path(sid)
+    part = part_path(out)
+    try:
+        return open(part, "rb"), part
+    except FileNotFoundError:
+        return open(out, "rb"), None  # finished (or the rename just happened)
+
+def follow(f, part: Optional[Path]) -> Iterator[bytes]:
+    """Yield f's bytes as they are written, until the writer renames/removes `part` or dies."""
+    out = part.with_name(part.name[:-len(".part")]) if part else None
+    try:
+        while True:
+            data = f.read(READ_CHUNK)
+            if data:
+                yield data
+                continue
+            if part is None or not part.exists() or not _rendering(out):
+                rest = f.read()  # anything written just before the rename
+                if rest:
+                    yield rest
+                return
+            time.sleep(POLL_SECONDS)
+    finally:
+        f.close()
@@ -0,0 +1,100 @@
+# renderer/scheduler.py
+"""
+Which queued render work a worker claims next, and per-class queue metrics.
+
+Classes rank interactive > final > batch. Within a class, owners with fewer running
+rows go first (fair share: one user's 200-video batch takes turns with everyone else's),
+then the oldest. Every RENDER_AGING_SECONDS a row has waited lifts it one class (up to
+"final"), so batch work is delayed but never starved. Interactive work additionally gets
+reserved ffmpeg slots and a higher CPU priority on each host (renderer/ffmpeg.py).
+"""
+from datetime import timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import RenderChunk, RenderJob, RenderRun
+
+PRIORITIES = [c for c, _ in RenderJob.PRIORITY_CHOICES]  # most urgent first
+RANKS = {p: i for i, p in enumerate(PRIORITIES)}
+SCAN_LIMIT = 200  # oldest queued rows considered per class on each claim
+
+def aging_seconds() -> float:
+    return float(getattr(settings, "RENDER_AGING_SECONDS", 600))
+
+def effective_rank(priority: str, waited_sec: float) -> int:
+    """Class rank after aging; waiting never lifts work above "final" (interactive stays the editors')."""
+    rank = RANKS.get(priority, RANKS[RenderJob.FINAL])
+    aging = aging_seconds()
+    if aging <= 0 or rank <= RANKS[RenderJob.FINAL]:
+        return rank
+    return max(RANKS[RenderJob.FINAL], rank - int(waited_sec // aging))
+
+def _fields(model) -> Tuple[str, str]:
+    prefix = "job__" if model is RenderChunk else ""
+    return f"{prefix}priority", f"{prefix}owner"
+
+def ranked(model, queryset=None, classes: Optional[Sequence[str]] = None) -> List[Tuple[Tuple, object]]:
+    """Queued rows of model (within queryset / classes) as (sort key, pk), best first."""
+    priority_f, owner_f = _fields(model)
+    queued = (model.objects.all() if queryset is None else queryset).filter(status=model.QUEUED)
+    rows = []
+    for p in classes or PRIORITIES:
+        rows += queued.filter(**{priority_f: p}).order_by("created_at").values_list(
+            "pk", priority_f, owner_f, "created_at")[:SCAN_LIMIT]
+    running = dict(
+        model.objects.filter(status=model.RUNNING).values_list(owner_f).annotate(n=Count("pk")).order_by()
+    )
+    now = timezone.now()
+    keyed = [
+        ((effective_rank(p, (now - created).total_seconds()), running.get(owner, 0), created), pk)
+        for pk, p, owner, created in rows
+    ]
+    keyed.sort(key=lambda kv: kv[0])
+    return keyed
+
+def claim_order(model, queryset=None, classes: Optional[Sequence[str]] = None) -> List:
+    return [pk for _, pk in ranked(model, queryset, classes)]
+
+def chunks_first(classes: Optional[Sequence[str]] = None) -> bool:
+    """Whether the best queued chunk ranks at least as high as the best queued job."""
+    chunk, job = ranked(RenderChunk, classes=classes)[:1], ranked(RenderJob, classes=classes)[:1]
+    return bool(chunk) and (not job or chunk[0][0][0] <= job[0][0][0])
+
+# ---------- metrics ----------
+def _p95(values: List[float]) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(0.95 * (len(values) - 1))))]
+
+def _avg(values: List[float]) -> Optional[float]:
+    return sum(values) / len(values) if values else None
+
+def class_metrics(hours: float = 24) -> Dict[str, Dict]:
+    """Per class: current queue depth (and its estimated render time), and queue wait / run time of renders in the last `hours`."""
+    since = timezone.now() - timedelta(hours=hours)
+    depth = dict(RenderJob.objects.filter(status=RenderJob.QUEUED).values_list("priority").annotate(n=Count("pk")).order_by())
+    running = dict(RenderJob.objects.filter(status=RenderJob.RUNNING).values_list("priority").annotate(n=Count("pk")).order_by())
+    backlog = {}  # estimated render seconds still queued, per class
+    for p, est in RenderJob.objects.filter(status=RenderJob.QUEUED, estimate__isnull=False).values_list("priority", "estimate"):
+        backlog[p] = backlog.get(p, 0.0) + (est or {}).get("wall_sec", 0.0)
+    out = {}
+    for p in PRIORITIES:
+        runs = list(RenderRun.objects.filter(priority=p, created_at__gte=since).values_list("queue_wait_sec", "wall_sec", "status"))
+        waits = [w for w, _, _ in runs]
+        walls = [r for _, r, _ in runs]
+        out[p] = {
+            "queued": depth.get(p, 0),
+            "running": running.get(p, 0),
+            "queued_estimated_sec": round(backlog.get(p, 0.0), 1),
+            "runs": len(runs),
+            "failed": sum(1 for *_, s in runs if s == RenderRun.FAILED),
+            "queue_wait_avg_sec": _avg(waits),
+            "queue_wait_p95_sec": _p95(waits),
+            "run_avg_sec": _avg(walls),
+            "run_p95_sec": _p95(walls),
+        }
+    return out
@@ -0,0 +1,155 @@
+# renderer/serializers.py
+from dataclasses import asdict
+
+from django.conf import settings
+from rest_framework import serializers
+
+from .models import RenderJob, UploadedAsset
+from .outputs import MAX_TARGETS, PRESETS, X264_PRESETS, X264_PROFILES
+from .overlay import W, H
+from .preflight import check_input
+from .preview import CLIP_PAD, MAX_CLIP_PAD, PREVIEW_WIDTH, ROW_KINDS
+from .silence import PADDING
+from .timeline import TimelineSpec, ZOOM_DIRECTIONS
+from .uploads import asset_path
+
+CAPTION_MODELS = ("tiny", "base", "small", "medium", "large")
+MAX_ROWS = 1000
+
+class BrollRowSerializer(serializers.Serializer):
+    asset = serializers.UUIDField()
+    start = serializers.FloatField(min_value=0)
+    duration = serializers.FloatField(min_value=0)
+
+class PipRowSerializer(serializers.Serializer):
+    start = serializers.FloatField(min_value=0)
+    duration = serializers.FloatField(min_value=0)
+    overlay_asset = serializers.UUIDField(required=False, allow_null=True, default=None)
+    zoom_direction = serializers.ChoiceField(choices=ZOOM_DIRECTIONS, required=False, allow_null=True, default=None)
+    zoom_start = serializers.FloatField(required=False, allow_null=True, default=None)
+    zoom_end = serializers.FloatField(required=False, allow_null=True, default=None)
+
+    def validate(self, data):
+        zs, ze = data.get("zoom_start"), data.get("zoom_end")
+        if zs is not None and ze is not None and ze < zs:
+            raise serializers.ValidationError("zoom_end must not be before zoom_start.")
+        return data
+
+class OutputTargetSerializer(serializers.Serializer):
+    """An extra rendition; a preset name ("720p", "vertical", "square") alone fills in the rest."""
+    name = serializers.SlugField(max_length=32)
+    width = serializers.IntegerField(min_value=16, max_value=3840, required=False)
+    height = serializers.IntegerField(min_value=16, max_value=3840, required=False)
+    crop = serializers.ListField(child=serializers.IntegerField(min_value=0), min_length=4, max_length=4,
+                                 required=False, allow_null=True)
+    crf = serializers.IntegerField(min_value=0, max_value=51, required=False)
+    preset = serializers.ChoiceField(choices=X264_PRESETS, required=False)
+    profile = serializers.ChoiceField(choices=X264_PROFILES, required=False)
+
+    def validate(self, data):
+        base = PRESETS.get(data["name"])
+        if base is None and not ("width" in data and "height" in data):
+            raise serializers.ValidationError(
+                f"width and height are required unless name is one of {', '.join(PRESETS)}.")
+        target = {**(asdict(base) if base else {}), **data}
+        target["width"] -= target["width"] % 2  # yuv420p needs even dimensions
+        target["height"] -= target["height"] % 2
+        crop = target.get("crop")
+        if crop and (crop[0] + crop[2] > W or crop[1] + crop[3] > H or crop[2] < 2 or crop[3] < 2):
+            raise serializers.ValidationError(f"crop [x, y, w, h] must lie within the {W}x{H} frame.")
+        return target
+
+class TimelineSpecSerializer(serializers.Serializer):
+    """A render request; every media file is an already-uploaded asset id."""
+    main_asset = serializers.UUIDField()
+    title = serializers.CharField(max_length=255, required=False, allow_blank=True, default="")
+    broll = BrollRowSerializer(many=True, required=False, default=list)
+    pip = PipRowSerializer(many=True, required=False, default=list)
+    captions = serializers.BooleanField(required=False, default=False)
+    caption_model = serializers.ChoiceField(choices=CAPTION_MODELS, required=False, default="base")
+    trim_silence = serializers.BooleanField(required=False, default=False)
+    silence_padding = serializers.FloatField(min_value=0, max_value=5, required=False, default=PADDING)
+    snap_broll = serializers.BooleanField(required=False, default=False)
+    snap_pip = serializers.BooleanField(required=False, default=False)
+    outputs = OutputTargetSerializer(many=True, required=False, default=list)
+
+    def validate(self, data):
+        names = [t["name"] for t in data["outputs"]]
+        if len(names) > MAX_TARGETS:
+            raise serializers.ValidationError({"outputs": [f"At most {MAX_TARGETS} extra outputs."]})
+        if len(set(names)) != len(names) or {"video", "master"} & set(names):
+            raise serializers.ValidationError({"outputs": ["Output names must be unique and not 'video' or 'master'."]})
+        if len(data["broll"]) + len(data["pip"]) > MAX_ROWS:
+            raise serializers.ValidationError(f"At most {MAX_ROWS} B-roll/PiP rows per render.")
+        spec = TimelineSpec.from_dict(data)
+        ids = set(spec.asset_ids())
+        found = {str(a.pk): a for a in UploadedAsset.objects.filter(id__in=ids, completed=True)}
+        missing = sorted(ids - set(found))
+        if missing:
+            raise serializers.ValidationError({"assets": [f"Upload {i} not found or not complete." for i in missing]})
+        # Cached probe data (from the upload): reject media ffmpeg can't use before anything is queued
+        unusable = []
+        for pk, asset in sorted(found.items()):
+            problem = check_input(asset_path(asset))
+            if problem:
+                unusable.append(f"Upload {pk}: {problem}")
+        if unusable:
+            raise serializers.ValidationError({"assets": unusable})
+        data["spec"] = spec
+        return data
+
+    def to_spec(self) -> TimelineSpec:
+        return self.validated_data["spec"]
+
+class RenderRequestSerializer(TimelineSpecSerializer):
+    """POST /api/renders/: a timeline spec plus its scheduling class."""
+    priority = serializers.ChoiceField(choices=RenderJob.PRIORITY_CHOICES, required=False, default=RenderJob.FINAL)
+
+    def validate(self, data):
+        priority = data.pop("priority")
+        data = super().validate(data)
+        data["priority"] = priority
+        return data
+
+class RenderJobSerializer(serializers.ModelSerializer):
+    output_url = serializers.SerializerMethodField()
+    output_urls = serializers.SerializerMethodField()
+
+    class Meta:
+        model = RenderJob
+        fields = ("id", "title", "status", "priority", "estimate", "error", "log", "output_url", "output_urls",
+                  "input_data", "worker", "attempts", "created_at", "started_at", "finished_at")
+
+    def get_output_url(self, obj):
+        return obj.output.url if obj.output else None
+
+    def get_output_urls(self, obj):
+        return {name: f"{settings.MEDIA_URL}{path}" for name, path in (obj.outputs or {}).items()}
+
+class PreviewStreamSerializer(serializers.Serializer):
+    """The whole spec at preview quality, streamed while it renders."""
+    spec = TimelineSpecSerializer()
+    width = serializers.IntegerField(min_value=160, max_value=1920, required=False, default=PREVIEW_WIDTH)
+
+    def validate_width(self, value):
+        return value - value % 2
+
+class PreviewFrameSerializer(serializers.Serializer):
+    """One frame of a spec at time t (seconds on the rendered timeline)."""
+    spec = TimelineSpecSerializer()
+    t = serializers.FloatField(min_value=0)
+    width = serializers.IntegerField(min_value=160, max_value=1920, required=False, default=PREVIEW_WIDTH)
+
+    def validate_width(self, value):
+        return value - value % 2  # yuv420p needs even dimensions
+
+class PreviewClipSerializer(serializers.Serializer):
+    """A short clip around one B-roll/PiP row (`index` counts from 0 within `kind`)."""
+    spec = TimelineSpecSerializer()
+    kind = serializers.ChoiceField(choices=ROW_KINDS)
+    index = serializers.IntegerField(min_value=0)
+    pad = serializers.FloatField(min_value=0, max_value=MAX_CLIP_PAD, required=False, default=CLIP_PAD)
+    width = serializers.IntegerField(min_value=160, max_value=1920, required=False, default=PREVIEW_WIDTH)
+
+    def validate_width(self, value):
+        return value - value % 2
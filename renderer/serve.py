@@ -0,0 +1,77 @@
+# renderer/serve.py
+import os, re
+from pathlib import Path
+from typing import Optional, Tuple
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+def content_etag(path: Path, st: os.stat_result) -> str:
+    """
+    Strong ETag from size and mtime_ns (files are replaced, not edited in place, so this
+    changes with the content). Nothing is read, so it is cheap even for multi-GB outputs.
+    """
+    return f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    tags = [t.strip() for t in header.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range `Range: bytes=a-b` header into an inclusive (start, end).
+    Returns None for no/unsupported ranges (serve the whole file).
+    """
+    if not header:
+        return None
+    m = _RANGE_RE.match(header.strip())
+    if not m:
+        return None  # multi-range or other units: fall back to 200
+    first, last = m.groups()
+    if first == "" and last == "":
+        return None
+    if first == "":
+        # suffix range: last N bytes
+        n = int(last)
+        if n == 0:
+            raise RangeNotSatisfiable()
+        return max(0, size - n), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise RangeNotSatisfiable()
+    return start, min(end, size - 1)
+
+class RangeFile:
+    """
+    File wrapper that stops after `length` bytes.
+    Keeps fileno() so a sendfile-capable WSGI server (e.g. gunicorn) still takes
+    the zero-copy path from the current offset for Content-Length bytes.
+    """
+    def __init__(self, f, start: int, length: int):
+        self._f = f
+        self._f.seek(start)
+        self._remaining = length
+        self.name = f.name
+
+    def read(self, size: int = -1) -> bytes:
+        if self._remaining <= 0:
+            return b""
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._f.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def tell(self) -> int:
+        return self._f.tell()
+
+    def fileno(self) -> int:
+        return self._f.fileno()
+
+    def close(self):
+        self._f.close()
@@ -1,18 +1,16 @@
 # renderer/shrink.py
-import subprocess
+from functools import partial
 from math import sqrt
 from pathlib import Path
 from typing import Optional, List
-from .overlay import W, H, FPS, DEFAULT_FADE_IN, DEFAULT_FADE_OUT
+from .overlay import W, H, FPS, DEFAULT_FADE_IN, DEFAULT_FADE_OUT, is_image, prepare_still
+from .pipeline import Source, input_arg, output_args, render_stages
 
 # Match your project defaults
 CRF = 18
 AUDIO_BR = "192k"
 MARGIN = 24  # pixels from the edges
 
-def _run(cmd: str):
-    return subprocess.run(cmd, capture_output=True, text=True, check=True, shell=True)
-
 def apply_shrink_pip(
     base_path: Path,
     out_path: Path,
@@ -25,26 +23,46 @@ def apply_shrink_pip(
     zoom_start: float | None = None,
     zoom_end: float | None = None,
 ):
+    """Run the PiP stage as a standalone file-to-file encode (see build_shrink_pip_cmd)."""
+    stage = partial(
+        build_shrink_pip_cmd, start_sec=start_sec, dur_sec=dur_sec, overlay_path=overlay_path,
+        fade_in=fade_in, fade_out=fade_out, zoom_direction=zoom_direction,
+        zoom_start=zoom_start, zoom_end=zoom_end,
+    )
+    render_stages(base_path, [stage], out_path, audio_br=AUDIO_BR)
+
+def build_shrink_pip_cmd(
+    base_path: Source,
+    out_path: Optional[Path],
+    start_sec: float,
+    dur_sec: float,
+    overlay_path: Path | None = None,
+    fade_in: float = DEFAULT_FADE_IN,
+    fade_out: float = DEFAULT_FADE_OUT,
+    zoom_direction: str | None = None,
+    zoom_start: float | None = None,
+    zoom_end: float | None = None,
+) -> List[str]:
     """
     Picture-in-Picture effect:
       - Base video is full frame by default.
       - Between [start_sec, start_sec+dur_sec]:
            * base video also appears as a small PiP (1/12 area) at bottom-left
            * optional overlay (video/image) fills the canvas behind the small PiP
-      - Audio always comes from the base video (0:a).
+      - Video only; audio is muxed from the base video once, after all stages.
 
-    overlay_path can be a video or an image (images are looped).
+    overlay_path can be a video or an image (images are pre-scaled once and held
+    for the window as a single repeated frame).
+    base_path may be PIPE and out_path None to run as a piped stage.
+    Returns the ffmpeg argv.
     """
     if dur_sec <= 0:
         # nothing to do; just passthrough encode to normalize
-        cmd = (
-            f'ffmpeg -y -i "{base_path}" '
-            f'-vf "scale={W}:{H},fps={FPS},format=yuv420p,setsar=1" '
-            f'-c:v libx264 -preset medium -crf {CRF} '
-            f'-c:a aac -b:a {AUDIO_BR} -movflags +faststart "{out_path}"'
-        )
-        _run(cmd)
-        return
+        return [
+            "ffmpeg", "-y", *input_arg(base_path),
+            "-vf", f"scale={W}:{H},fps={FPS},format=yuv420p,setsar=1",
+            *output_args(out_path, CRF),
+        ]
 
     # Compute PiP size as 1/12 of the AREA -> linear scale = 1/sqrt(12)
     scale_linear = 1.0 / sqrt(12.0)  # ≈ 0.288675
@@ -52,17 +70,12 @@ def apply_shrink_pip(
     pip_h = max(1, int(H * scale_linear))
 
     # Inputs: 0 = base, 1 = overlay (optional)
+    still = bool(overlay_path) and is_image(overlay_path)
+    if still:
+        overlay_path = prepare_still(overlay_path)
+    inputs = input_arg(base_path)
     if overlay_path:
-        is_img = overlay_path.suffix.lower() in {".png", ".jpg", ".jpeg", ".webp", ".bmp"}
-        if is_img:
-            inputs = f'-i "{base_path}" -loop 1 -i "{overlay_path}"'
-            tail = "-shortest"
-        else:
-            inputs = f'-i "{base_path}" -i "{overlay_path}"'
-            tail = ""
-    else:
-        inputs = f'-i "{base_path}"'
-        tail = ""
+        inputs += ["-i", str(overlay_path)]
 
     t0 = float(start_sec)
     t1 = float(start_sec + dur_sec)
@@ -92,6 +105,7 @@ def apply_shrink_pip(
             t1=t1,
             fade_in=fade_in,
             fade_out=fade_out,
+            still=still,
         )
         chains.extend(overlay_chains)
         
@@ -131,11 +145,9 @@ def apply_shrink_pip(
 
     filter_complex = ";".join(chains)
 
-    cmd = (
-        f'ffmpeg -y {inputs} '
-        f'-filter_complex "{filter_complex}" '
-        f'-map "[vout]" -map 0:a? '
-        f'-c:v libx264 -preset medium -crf {CRF} '
-        f'-c:a aac -b:a {AUDIO_BR} -movflags +faststart {tail} "{out_path}"'
-    )
-    _run(cmd)
+    return [
+        "ffmpeg", "-y", *inputs,
+        "-filter_complex", filter_complex,
+        "-map", "[vout]",
+        *output_args(out_path, CRF),
+    ]
@@ -1,17 +1,15 @@
 # renderer/shrink.py
-import subprocess
 from math import sqrt
 from pathlib import Path
 
+from .ffmpeg import run
+
 # Match your project defaults
 W, H, FPS = 1920, 1080, 30
 CRF = 18
 AUDIO_BR = "192k"
 MARGIN = 24  # pixels from the edges
 
-def _run(cmd: str):
-    return subprocess.run(cmd, capture_output=True, text=True, check=True, shell=True)
-
 def apply_shrink_pip(
     base_path: Path,
     out_path: Path,
@@ -31,13 +29,13 @@ def apply_shrink_pip(
     """
     if dur_sec <= 0:
         # nothing to do; just passthrough encode to normalize
-        cmd = (
-            f'ffmpeg -y -i "{base_path}" '
-            f'-vf "scale={W}:{H},fps={FPS},format=yuv420p,setsar=1" '
-            f'-c:v libx264 -preset medium -crf {CRF} '
-            f'-c:a aac -b:a {AUDIO_BR} -movflags +faststart "{out_path}"'
-        )
-        _run(cmd)
+        cmd = [
+            "ffmpeg", "-y", "-i", str(base_path),
+            "-vf", f"scale={W}:{H},fps={FPS},format=yuv420p,setsar=1",
+            "-c:v", "libx264", "-preset", "medium", "-crf", str(CRF),
+            "-c:a", "aac", "-b:a", AUDIO_BR, "-movflags", "+faststart", str(out_path),
+        ]
+        run(cmd)
         return
 
     # Compute PiP size as 1/12 of the AREA -> linear scale = 1/sqrt(12)
@@ -49,14 +47,14 @@ def apply_shrink_pip(
     if overlay_path:
         is_img = overlay_path.suffix.lower() in {".png", ".jpg", ".jpeg", ".webp", ".bmp"}
         if is_img:
-            inputs = f'-i "{base_path}" -loop 1 -i "{overlay_path}"'
-            tail = "-shortest"
+            inputs = ["-i", str(base_path), "-loop", "1", "-i", str(overlay_path)]
+            tail = ["-shortest"]
         else:
-            inputs = f'-i "{base_path}" -i "{overlay_path}"'
-            tail = ""
+            inputs = ["-i", str(base_path), "-i", str(overlay_path)]
+            tail = []
     else:
-        inputs = f'-i "{base_path}"'
-        tail = ""
+        inputs = ["-i", str(base_path)]
+        tail = []
 
     t0 = float(start_sec)
     t1 = float(start_sec + dur_sec)
@@ -93,11 +91,11 @@ def apply_shrink_pip(
 
     filter_complex = ";".join(chains)
 
-    cmd = (
-        f'ffmpeg -y {inputs} '
-        f'-filter_complex "{filter_complex}" '
-        f'-map "[vout]" -map 0:a? '
-        f'-c:v libx264 -preset medium -crf {CRF} '
-        f'-c:a aac -b:a {AUDIO_BR} -movflags +faststart {tail} "{out_path}"'
-    )
-    _run(cmd)
+    cmd = [
+        "ffmpeg", "-y", *inputs,
+        "-filter_complex", filter_complex,
+        "-map", "[vout]", "-map", "0:a?",
+        "-c:v", "libx264", "-preset", "medium", "-crf", str(CRF),
+        "-c:a", "aac", "-b:a", AUDIO_BR, "-movflags", "+faststart", *tail, str(out_path),
+    ]
+    run(cmd)
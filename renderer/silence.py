@@ -0,0 +1,130 @@
+# renderer/silence.py
+import re
+from pathlib import Path
+from typing import List, Tuple
+
+from .ffmpeg import run
+from .keyframes import KeyframeIndex
+
+# ===== Silence detection settings =====
+SILENCE_DB = -35.0      # audio below this level (dBFS) counts as silence
+MIN_SILENCE = 0.8       # only silences at least this long (sec) are cut
+PADDING = 0.15          # seconds of silence kept either side of speech
+MIN_KEEP = 0.2          # drop kept islands shorter than this (clicks, breaths)
+MIN_COPY_SAVING = 0.75  # stream-copy only while keyframe alignment still cuts this share of the silence
+CRF = 18                # exact (re-encoded) trims: match project defaults
+AUDIO_BR = "192k"
+
+_START_RE = re.compile(r"silence_start:\s*(-?[0-9.]+)")
+_END_RE = re.compile(r"silence_end:\s*(-?[0-9.]+)")
+
+# ---------- analysis ----------
+def detect_silences(media_path: Path, video_dur: float,
+                    noise_db: float = SILENCE_DB, min_dur: float = MIN_SILENCE) -> List[Tuple[float, float]]:
+    """
+    Return (start, end) silence intervals using ffmpeg silencedetect.
+    Audio-only decode (-vn), so this costs a fraction of a video pass.
+    """
+    cmd = [
+        "ffmpeg", "-hide_banner", "-nostats", "-vn", "-sn", "-dn", "-i", media_path,
+        "-af", f"silencedetect=noise={noise_db}dB:d={min_dur}", "-f", "null", "-",
+    ]
+    res = run(cmd, stage="silence_detect")
+    silences = []
+    start = None
+    for line in res.stderr.splitlines():
+        m = _START_RE.search(line)
+        if m:
+            start = max(0.0, float(m.group(1)))
+            continue
+        m = _END_RE.search(line)
+        if m and start is not None:
+            silences.append((start, min(video_dur, float(m.group(1)))))
+            start = None
+    if start is not None and start < video_dur:
+        # silence runs to the end of the file
+        silences.append((start, video_dur))
+    return silences
+
+def build_keep_list(silences: List[Tuple[float, float]], video_dur: float,
+                    padding: float = PADDING) -> List[Tuple[float, float]]:
+    """Invert silences into sorted, non-overlapping (start, end) ranges to keep, padded on each side."""
+    keeps = []
+    cursor = 0.0
+    for s0, s1 in sorted(silences):
+        cut0 = s0 + padding if s0 > 0 else 0.0
+        cut1 = s1 - padding if s1 < video_dur else video_dur
+        if cut1 <= cut0:
+            continue
+        if cut0 > cursor:
+            keeps.append((cursor, cut0))
+        cursor = max(cursor, cut1)
+    if cursor < video_dur:
+        keeps.append((cursor, video_dur))
+    return [(a, b) for a, b in keeps if b - a >= MIN_KEEP]
+
+def align_keeps_to_keyframes(keeps: List[Tuple[float, float]], keyframes: KeyframeIndex) -> List[Tuple[float, float]]:
+    """
+    Move each keep start back to the keyframe at or before it, so every piece can
+    be stream-copied. Starts only ever move earlier, so no speech is lost.
+    """
+    aligned: List[Tuple[float, float]] = []
+    for a, b in keeps:
+        a = keyframes.before(a) or 0.0
+        if aligned and a <= aligned[-1][1]:
+            aligned[-1] = (aligned[-1][0], max(aligned[-1][1], b))
+        else:
+            aligned.append((a, b))
+    return aligned
+
+# ---------- assembly ----------
+def trim_to_keep_list(src_path: Path, keeps: List[Tuple[float, float]], out_path: Path):
+    """Assemble the kept ranges with the concat demuxer (stream copy, no re-encode)."""
+    list_path = out_path.with_suffix(".concat.txt")
+    lines = ["ffconcat version 1.0"]
+    src = Path(src_path).resolve().as_posix().replace("'", "'\\''")
+    for a, b in keeps:
+        lines += [f"file '{src}'", f"inpoint {a:.6f}", f"outpoint {b:.6f}"]
+    list_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    try:
+        cmd = [
+            "ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", list_path,
+            "-map", "0:v", "-map", "0:a?", "-c", "copy", "-avoid_negative_ts", "make_zero",
+            "-movflags", "+faststart", out_path,
+        ]
+        run(cmd, stage="silence_trim")
+    finally:
+        list_path.unlink(missing_ok=True)
+
+def kept_seconds(keeps: List[Tuple[float, float]]) -> float:
+    return sum(b - a for a, b in keeps)
+
+def trim_exact(src_path: Path, keeps: List[Tuple[float, float]], out_path: Path):
+    """
+    Assemble the kept ranges frame-exactly, re-encoding video and audio. For sources whose
+    keyframes are too far apart for trim_to_keep_list to cut near the silences.
+    """
+    expr = "+".join(f"between(t,{a:.6f},{b:.6f})" for a, b in keeps)
+    cmd = [
+        "ffmpeg", "-y", "-i", src_path,
+        "-vf", f"select='{expr}',setpts=N/FRAME_RATE/TB",
+        "-af", f"aselect='{expr}',asetpts=N/SR/TB",
+        "-c:v", "libx264", "-preset", "medium", "-crf", str(CRF), "-pix_fmt", "yuv420p",
+        "-c:a", "aac", "-b:a", AUDIO_BR, "-movflags", "+faststart", out_path,
+    ]
+    run(cmd, stage="silence_trim_exact")
+
+# ---------- timeline remap ----------
+def remap_time(t: float, keeps: List[Tuple[float, float]]) -> float:
+    """
+    Map a time on the original timeline onto the trimmed timeline.
+    Times inside a removed gap land on the start of the next kept range.
+    """
+    out = 0.0
+    for a, b in keeps:
+        if t < a:
+            return out
+        if t <= b:
+            return out + (t - a)
+        out += b - a
+    return out
@@ -0,0 +1,188 @@
+# renderer/telemetry.py
+"""
+Per-stage render telemetry.
+
+ffmpeg.run()/run_pipeline() report every ffmpeg process they reap (wall time, the
+child's own CPU time and peak RSS from wait4, input/output sizes, frames and fps) to the
+recorder active in the current context; in-process work such as whisper is timed with
+stage(). A view wrapped in @record_render saves the collected stages as a RenderRun.
+Outside a recording (CLI, management commands) reporting is a no-op.
+"""
+import os, re, resource, socket, time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import wraps
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+FRAME_RE = re.compile(r"frame=\s*(\d+)")
+MAX_COMMAND_CHARS = 4000
+
+@dataclass
+class StageSample:
+    name: str
+    wall_sec: float
+    cpu_user_sec: float = 0.0
+    cpu_sys_sec: float = 0.0
+    max_rss_kb: Optional[int] = None
+    input_bytes: Optional[int] = None
+    output_bytes: Optional[int] = None
+    frames: Optional[int] = None
+    fps: Optional[float] = None
+    returncode: Optional[int] = None
+    command: str = ""
+
+@dataclass
+class Recorder:
+    title: str = ""
+    stages: List[StageSample] = field(default_factory=list)
+    started: float = field(default_factory=time.monotonic)
+    source_duration: Optional[float] = None
+    input_data: object = None
+    error: str = ""
+    priority: str = ""
+    queue_wait_sec: float = 0.0  # time queued for a worker or ffmpeg slot before running
+
+_current: ContextVar[Optional[Recorder]] = ContextVar("render_recorder", default=None)
+
+def current() -> Optional[Recorder]:
+    return _current.get()
+
+@contextmanager
+def recording(title: str = ""):
+    """Collect stages reported in this context into a fresh Recorder."""
+    rec = Recorder(title=title)
+    token = _current.set(rec)
+    try:
+        yield rec
+    finally:
+        _current.reset(token)
+
+# ---------- helpers ----------
+def _file_size(path) -> Optional[int]:
+    try:
+        return os.path.getsize(path)
+    except (OSError, TypeError, ValueError):
+        return None
+
+def _sum_sizes(paths) -> Optional[int]:
+    sizes = [s for s in (_file_size(p) for p in paths) if s is not None]
+    return sum(sizes) if sizes else None
+
+def input_paths(args: Sequence[str]) -> List[str]:
+    return [args[i + 1] for i, a in enumerate(args[:-1]) if a == "-i"]
+
+def stage_name(stage) -> str:
+    """'build_burn_in_cmd' (possibly wrapped in functools.partial) -> 'burn_in'."""
+    name = getattr(getattr(stage, "func", stage), "__name__", "ffmpeg")
+    if name.startswith("build_"):
+        name = name[len("build_"):]
+    if name.endswith("_cmd"):
+        name = name[:-len("_cmd")]
+    return name
+
+# ---------- reporting ----------
+def add_queue_wait(seconds: float):
+    rec = _current.get()
+    if rec is not None:
+        rec.queue_wait_sec += seconds
+
+def record_process(name: Optional[str], args: Sequence[str], wall_sec: float,
+                   rusage, returncode: Optional[int], stderr: str = ""):
+    """Record one reaped ffmpeg process (rusage is the struct from os.wait4, or None)."""
+    rec = _current.get()
+    if rec is None:
+        return
+    frames = FRAME_RE.findall(stderr or "")
+    n_frames = int(frames[-1]) if frames else None
+    rec.stages.append(StageSample(
+        name=name or os.path.basename(args[0]),
+        wall_sec=wall_sec,
+        cpu_user_sec=rusage.ru_utime if rusage else 0.0,
+        cpu_sys_sec=rusage.ru_stime if rusage else 0.0,
+        max_rss_kb=rusage.ru_maxrss if rusage else None,  # KiB on Linux
+        input_bytes=_sum_sizes(input_paths(args)),
+        output_bytes=_file_size(args[-1]),
+        frames=n_frames,
+        fps=(n_frames / wall_sec) if n_frames and wall_sec > 0 else None,
+        returncode=returncode,
+        command=" ".join(args)[:MAX_COMMAND_CHARS],
+    ))
+
+@dataclass
+class _InProcess:
+    output: Optional[Path] = None
+
+@contextmanager
+def stage(name: str, inputs: Sequence = ()):
+    """
+    Time in-process work (e.g. whisper). CPU is the process-wide delta, so it also counts
+    other threads busy at the same time; peak RSS is the process high-water mark.
+    Set .output on the yielded object to record the output size.
+    """
+    rec = _current.get()
+    box = _InProcess()
+    if rec is None:
+        yield box
+        return
+    t0 = time.monotonic()
+    ru0 = resource.getrusage(resource.RUSAGE_SELF)
+    ok = False
+    try:
+        yield box
+        ok = True
+    finally:
+        ru1 = resource.getrusage(resource.RUSAGE_SELF)
+        rec.stages.append(StageSample(
+            name=name,
+            wall_sec=time.monotonic() - t0,
+            cpu_user_sec=ru1.ru_utime - ru0.ru_utime,
+            cpu_sys_sec=ru1.ru_stime - ru0.ru_stime,
+            max_rss_kb=ru1.ru_maxrss,
+            input_bytes=_sum_sizes(inputs),
+            output_bytes=_file_size(box.output) if box.output else None,
+            returncode=0 if ok else 1,
+        ))
+
+# ---------- persistence ----------
+def save_run(rec: Recorder):
+    """Store the recorder as a RenderRun with its RenderStage rows."""
+    from .models import RenderRun, RenderStage  # keep this module importable without Django
+
+    run = RenderRun.objects.create(
+        input_data=rec.input_data,
+        title=(rec.title or "")[:255],
+        status=RenderRun.FAILED if rec.error else RenderRun.OK,
+        error=rec.error,
+        priority=rec.priority,
+        host=socket.gethostname(),
+        queue_wait_sec=rec.queue_wait_sec,
+        source_duration=rec.source_duration,
+        wall_sec=time.monotonic() - rec.started,
+    )
+    RenderStage.objects.bulk_create([
+        RenderStage(run=run, order=i, **vars(s)) for i, s in enumerate(rec.stages)
+    ])
+    return run
+
+def record_render(view):
+    """View decorator: collect stages for the request and save them as one RenderRun."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        rec = Recorder(title=request.POST.get("title", ""))
+        token = _current.set(rec)
+        try:
+            return view(request, *args, **kwargs)
+        except Exception as e:
+            rec.error = rec.error or str(e)
+            raise
+        finally:
+            _current.reset(token)
+            if rec.stages:
+                try:
+                    save_run(rec)
+                except Exception as e:
+                    # Telemetry must never break a render
+                    print(f"Could not save render telemetry: {e}")
+    return wrapper
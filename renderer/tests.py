@@ -1,3 +1,814 @@
-from django.test import TestCase
+import fcntl, io, json, os, shutil, subprocess, tempfile, threading, time
+from datetime import timedelta
+from functools import partial
+from pathlib import Path
+from typing import Optional
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.http import Http404, HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from . import (cancellation, coalesce, farm, ffmpeg, jobs, mediainfo, preflight, preview, scenes, scheduler,
+               serve, silence, timeline, uploads, views, workspace)
+from .broll import FPS, BRollSeg, build_base_only_cmd, build_overlay_cmd
+from .ffmpeg import run_pipeline
+from .keyframes import KeyframeIndex
+from .models import RenderChunk, RenderJob
+from .overlay import prepare_still, still_cache_dir
+from .pipeline import PIPE, build_pipeline, input_arg
+from .timeline import Plan, pip_stage
+
+HAVE_FFMPEG = bool(shutil.which("ffmpeg"))
+HALF_FRAME = 0.5 / FPS
+
+
+def make_job(**fields):
+    fields.setdefault("spec", {})
+    return RenderJob.objects.create(**fields)
+
+
+def arg(cmd, flag):
+    """The value after flag in an ffmpeg argv."""
+    return cmd[cmd.index(flag) + 1]
+
+
+def prepared(segs=(), pips=(), base=Path("base.mp4"), video_dur=60.0):
+    """preview.Prepared for a plan with B-roll segs and (start, duration) PiP rows, without any media."""
+    pip_rows = [{"start": start, "duration": dur, "overlay_path": None, "row_index": i}
+                for i, (start, dur) in enumerate(pips)]
+    plan = Plan(stages=[partial(build_overlay_cmd, segs=list(segs))] + [pip_stage(p) for p in pip_rows],
+                segs=list(segs), pips=pip_rows, messages=[])
+    return preview.Prepared(main_path=base, base_path=base, video_dur=video_dur, plan=plan, srt_path=None)
+
+
+def make_video(path: Path, graph: str, seconds: float) -> Path:
+    """Small H.264 file from a lavfi source graph."""
+    subprocess.run(["ffmpeg", "-v", "error", "-y", "-f", "lavfi", "-i", graph, "-t", str(seconds),
+                    "-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p", str(path)], check=True)
+    return path
+
+
+def duration(path: Path) -> float:
+    out = subprocess.run(["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", str(path)],
+                         check=True, capture_output=True, text=True).stdout
+    return float(out)
+
+
+def brightness(path: Path, t: float = 0.0) -> int:
+    """Mean luma (0-255) of the frame at t."""
+    out = subprocess.run(["ffmpeg", "-v", "error", "-ss", f"{t:.3f}", "-i", str(path), "-frames:v", "1",
+                          "-vf", "scale=1:1,format=gray", "-f", "rawvideo", "-"],
+                         check=True, capture_output=True).stdout
+    return out[0]
+
+
+class MediaRootMixin:
+    """A throwaway MEDIA_ROOT (self.media) for the test."""
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        media = override_settings(MEDIA_ROOT=tmp.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.media = Path(tmp.name)
+
+
+class ClaimTests(TestCase):
+    def test_claims_each_row_once(self):
+        job = make_job()
+        self.assertEqual(farm.claim(RenderJob, "w1").pk, job.pk)
+        self.assertIsNone(farm.claim(RenderJob, "w2"))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker, job.attempts), (RenderJob.RUNNING, "w1", 1))
+        self.assertIsNotNone(job.lease_expires_at)
+
+    def test_lost_race_moves_on_to_next_candidate(self):
+        # both workers computed the same order before either updated a row
+        a, b = make_job(), make_job()
+        with mock.patch.object(scheduler, "claim_order", return_value=[a.pk, b.pk]):
+            first = farm.claim(RenderJob, "w1")
+            second = farm.claim(RenderJob, "w2")
+        self.assertEqual((first.pk, second.pk), (a.pk, b.pk))
+        a.refresh_from_db()
+        self.assertEqual((a.worker, a.attempts), ("w1", 1))
+
+    def test_lost_race_with_no_other_candidate(self):
+        job = make_job()
+        with mock.patch.object(scheduler, "claim_order", return_value=[job.pk]):
+            farm.claim(RenderJob, "w1")
+            self.assertIsNone(farm.claim(RenderJob, "w2"))
+
+    def test_claims_chunks(self):
+        job = make_job(status=RenderJob.RUNNING)
+        chunk = RenderChunk.objects.create(job=job, index=0, start=0, end=10)
+        self.assertEqual(farm.claim(RenderChunk, "w1").pk, chunk.pk)
+        self.assertIsNone(farm.claim(RenderChunk, "w2"))
+
+
+@override_settings(RENDER_MAX_ATTEMPTS=2)
+class RequeueTests(TestCase):
+    def expired(self, attempts, **fields):
+        return make_job(status=RenderJob.RUNNING, worker="gone", attempts=attempts,
+                        lease_expires_at=timezone.now() - timedelta(seconds=1), **fields)
+
+    def test_requeues_lapsed_lease(self):
+        job = self.expired(1)
+        self.assertEqual(farm.requeue_expired(RenderJob), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker, job.lease_expires_at), (RenderJob.QUEUED, "", None))
+        self.assertEqual(farm.claim(RenderJob, "w1").pk, job.pk)
+
+    def test_fails_after_max_attempts(self):
+        job = self.expired(2)
+        self.assertEqual(farm.requeue_expired(RenderJob), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, RenderJob.FAILED)
+        self.assertIsNotNone(job.finished_at)
+        self.assertIsNone(farm.claim(RenderJob, "w1"))
+
+    def test_keeps_live_leases(self):
+        job = make_job(status=RenderJob.RUNNING, worker="w1", attempts=1,
+                       lease_expires_at=timezone.now() + timedelta(seconds=60))
+        self.assertEqual(farm.requeue_expired(RenderJob), 0)
+        job.refresh_from_db()
+        self.assertEqual(job.status, RenderJob.RUNNING)
+
+
+class LeaseTests(TestCase):
+    def setUp(self):
+        make_job()
+        self.job = farm.claim(RenderJob, "w1")
+        self.lease = farm.Lease(self.job, "w1")  # not entered: renew() is driven by hand
+
+    def test_renew_extends_lease(self):
+        self.assertTrue(self.lease.renew())
+        self.assertFalse(self.lease.lost.is_set())
+        self.lease.check()
+
+    def test_cancel_loses_lease(self):
+        chunk = RenderChunk.objects.create(job=self.job, index=0, start=0, end=10)
+        self.assertTrue(jobs.cancel(self.job.pk))
+        self.assertFalse(self.lease.renew())
+        self.assertTrue(self.lease.lost.is_set())
+        with self.assertRaises(farm.LeaseLost):
+            self.lease.check()
+        self.assertFalse(self.lease.finish(status=RenderJob.DONE))
+        self.job.refresh_from_db()
+        chunk.refresh_from_db()
+        self.assertEqual((self.job.status, chunk.status), (RenderJob.CANCELLED, RenderJob.CANCELLED))
+        self.assertFalse(jobs.cancel(self.job.pk))
+
+    def test_requeued_row_is_lost(self):
+        RenderJob.objects.filter(pk=self.job.pk).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        farm.requeue_expired(RenderJob)
+        farm.claim(RenderJob, "w2")
+        self.assertFalse(self.lease.renew())
+        self.assertFalse(self.lease.finish(status=RenderJob.DONE))
+
+
+class ChunkBoundsTests(SimpleTestCase):
+    def assertCovers(self, bounds, video_dur):
+        self.assertEqual(bounds[0][0], 0.0)
+        self.assertEqual(bounds[-1][1], video_dur)
+        for (_, end), (start, _) in zip(bounds, bounds[1:]):
+            self.assertEqual(end, start)
+
+    def test_short_video_is_one_chunk(self):
+        self.assertEqual(farm.chunk_bounds(14.0, 10.0), [(0.0, 14.0)])
+
+    def test_even_split_without_keyframes(self):
+        bounds = farm.chunk_bounds(44.0, 10.0)  # a remainder under 1.5 chunks joins the last one
+        self.assertEqual(bounds, [(0.0, 10.0), (10.0, 20.0), (20.0, 30.0), (30.0, 44.0)])
+        self.assertCovers(bounds, 44.0)
+
+    def test_cuts_move_to_next_keyframe_on_frame_grid(self):
+        keyframes = KeyframeIndex(times=np.array([0.0, 4.0, 11.01, 30.0]), offsets=np.full(4, -1))
+        bounds = farm.chunk_bounds(40.0, 10.0, keyframes)
+        self.assertAlmostEqual(bounds[0][1], 11.0)  # 11.01 snapped to the 30 fps grid
+        self.assertEqual(bounds[1][1], 21.0)        # next keyframe too far away: cut at the target
+        self.assertCovers(bounds, 40.0)
+
+
+class ChunkStageTests(SimpleTestCase):
+    def test_each_chunk_cut_on_its_own_timeline(self):
+        prep = prepared(segs=[BRollSeg(12.0, 14.0, Path("clip.mp4"))], pips=[(15.0, 2.0)])
+        bounds = [(0.0, 10.0), (10.0, 20.0)]
+        cmds = [build_pipeline(prep.base_path, farm.chunk_stages(prep, a, b), Path(f"{i}.mp4"))
+                for i, (a, b) in enumerate(bounds)]
+        self.assertEqual([len(c) for c in cmds], [2, 3])  # the PiP row only falls in chunk 1
+        for cmd, (a, b) in zip(cmds, bounds):
+            first, last = cmd[0], cmd[-1]
+            graph = arg(first, "-filter_complex")
+            if a:
+                self.assertEqual(arg(first, "-ss"), f"{a:.3f}")
+                self.assertIn(f"setpts=PTS+{a:.3f}/TB", graph)
+            else:
+                self.assertNotIn("-ss", first)
+                self.assertNotIn("setpts=PTS+", graph)
+            self.assertEqual(arg(first, "-t"), f"{b - a:.3f}")
+            for stage in cmd[1:]:
+                self.assertIn("-copyts", stage[:stage.index("pipe:0")])
+            self.assertEqual(arg(last, "-vf"),
+                             f"trim=start={a - HALF_FRAME:.6f}:end={b - HALF_FRAME:.6f},setpts=PTS-STARTPTS")
+        self.assertIn("between(t,15.000,17.000)", arg(cmds[1][1], "-filter_complex"))
+
+
+class EffectiveRankTests(SimpleTestCase):
+    INTERACTIVE, FINAL, BATCH = (scheduler.RANKS[p] for p in scheduler.PRIORITIES)
+
+    @override_settings(RENDER_AGING_SECONDS=600)
+    def test_batch_ages_up_to_final_only(self):
+        self.assertEqual(scheduler.effective_rank(RenderJob.BATCH, 0), self.BATCH)
+        self.assertEqual(scheduler.effective_rank(RenderJob.BATCH, 599), self.BATCH)
+        self.assertEqual(scheduler.effective_rank(RenderJob.BATCH, 600), self.FINAL)
+        self.assertEqual(scheduler.effective_rank(RenderJob.BATCH, 10 ** 6), self.FINAL)
+
+    @override_settings(RENDER_AGING_SECONDS=600)
+    def test_final_and_interactive_do_not_age(self):
+        self.assertEqual(scheduler.effective_rank(RenderJob.FINAL, 10 ** 6), self.FINAL)
+        self.assertEqual(scheduler.effective_rank(RenderJob.INTERACTIVE, 10 ** 6), self.INTERACTIVE)
+
+    @override_settings(RENDER_AGING_SECONDS=0)
+    def test_aging_disabled(self):
+        self.assertEqual(scheduler.effective_rank(RenderJob.BATCH, 10 ** 6), self.BATCH)
+
+    def test_unknown_priority_ranks_as_final(self):
+        self.assertEqual(scheduler.effective_rank("bogus", 0), self.FINAL)
+
+
+class StillCacheTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.stills = still_cache_dir()
+        self.stills.mkdir(parents=True)
+
+    def age(self, path: Path, days: float):
+        t = time.time() - days * 86400
+        os.utime(path, (t, t))
+
+    def test_unused_stills_age_out(self):
+        old, recent = self.stills / "old.png", self.stills / "recent.png"
+        old.touch()
+        recent.touch()
+        self.age(old, 8)
+        self.age(recent, 1)
+        self.assertEqual(workspace.collect_garbage(media_age_sec=7 * 86400), [old])
+        self.assertEqual(sorted(p.name for p in self.stills.iterdir()), ["recent.png"])
+
+    def test_cache_hit_counts_as_use(self):
+        image = Path(settings.MEDIA_ROOT) / "logo.png"
+        image.write_bytes(b"not really a png")
+        with mock.patch("renderer.overlay.run") as run:
+            run.side_effect = lambda cmd, stage: Path(cmd[-1]).write_bytes(b"scaled")
+            cached = prepare_still(image)
+            self.age(cached, 8)
+            self.assertEqual(prepare_still(image), cached)
+        self.assertEqual(run.call_count, 1)
+        self.assertEqual(workspace.collect_garbage(media_age_sec=7 * 86400), [])
+
+
+class PipedTimestampTests(SimpleTestCase):
+    def test_piped_stages_keep_timestamps(self):
+        self.assertEqual(input_arg(PIPE)[:1], ["-copyts"])
+        self.assertNotIn("-copyts", input_arg(Path("base.mp4")))
+
+    def test_frame_stages_use_timeline_time(self):
+        t = 40.0
+        stages = preview.windowed_stages(prepared(), (t, t + 2.0 / FPS)) + [partial(preview.build_frame_cmd, t=t)]
+        first, last = build_pipeline(Path("base.mp4"), stages, Path("out.jpg"))
+        self.assertEqual(arg(first, "-ss"), "40.000")
+        self.assertIn("setpts=PTS+40.000/TB", arg(first, "-filter_complex"))
+        self.assertIn("-copyts", last[:last.index("pipe:0")])
+        self.assertTrue(arg(last, "-vf").startswith("trim=start=40.000000,"))
+
+    def test_only_pips_in_window(self):
+        prep = prepared(pips=[(5.0, 2.0), (41.0, 2.0)])
+        stages = preview.windowed_stages(prep, (41.5, 41.5 + 2.0 / FPS))
+        self.assertEqual(stages[1:], prep.plan.stages[2:])
+
+
+@skipUnless(HAVE_FFMPEG, "needs ffmpeg")
+class FrameRenderTests(MediaRootMixin, SimpleTestCase):
+    def test_frame_after_start_shows_that_time(self):
+        base = make_video(self.media / "base.mp4", "color=black:s=320x240:r=30:d=3[a];"
+                          "color=white:s=320x240:r=30:d=3[b];[a][b]concat=n=2:v=1:a=0[out0]", 6)
+        for t, white in ((1.0, False), (4.0, True)):
+            out = self.media / f"frame{t:g}.jpg"
+            stages = [partial(build_overlay_cmd, segs=[], window=(t, t + 2.0 / FPS)), build_base_only_cmd,
+                      partial(preview.build_frame_cmd, t=t, width=160)]
+            run_pipeline(build_pipeline(base, stages, out))
+            self.assertEqual(brightness(out) > 128, white, f"frame at {t}s")
+
+
+class ClipStageTests(SimpleTestCase):
+    def test_clip_cut_on_timeline_time(self):
+        prep = prepared(segs=[BRollSeg(30.0, 31.0, Path("clip.mp4"))])
+        stages = preview.windowed_stages(prep, (29.0, 32.0)) + [partial(preview.build_clip_cmd, w0=29.0, w1=32.0)]
+        first, last = build_pipeline(Path("base.mp4"), stages, Path("out.mp4"))
+        self.assertEqual(arg(first, "-ss"), "29.000")
+        self.assertIn("setpts=PTS+29.000/TB", arg(first, "-filter_complex"))
+        self.assertIn("-copyts", last[:last.index("pipe:0")])
+        self.assertTrue(arg(last, "-vf").startswith(
+            f"trim=start={29.0 - HALF_FRAME:.6f}:end={32.0 - HALF_FRAME:.6f},setpts=PTS-STARTPTS"))
+
+
+@skipUnless(HAVE_FFMPEG, "needs ffmpeg")
+class ClipRenderTests(MediaRootMixin, SimpleTestCase):
+    def test_clip_around_row_at_30s(self):
+        base = make_video(self.media / "base.mp4", "color=black:s=320x240:r=30", 40)
+        clip = make_video(self.media / "clip.mp4", "color=white:s=320x240:r=30", 2)
+        stages = [partial(build_overlay_cmd, segs=[BRollSeg(30.0, 31.0, clip)], window=(29.0, 32.0)),
+                  partial(preview.build_clip_cmd, w0=29.0, w1=32.0, width=160)]
+        out = self.media / "clip_preview.mp4"
+        run_pipeline(build_pipeline(base, stages, out))
+        self.assertAlmostEqual(duration(out), 3.0, delta=2.0 / FPS)
+        self.assertLess(brightness(out, 0.5), 64)     # base before the row
+        self.assertGreater(brightness(out, 1.5), 192)  # the B-roll row, 30.5s on the timeline
+        self.assertLess(brightness(out, 2.5), 64)     # base after it
+
+
+def sh_stage(script: str, piped_script: Optional[str] = None):
+    """A pipeline stage running a shell script instead of ffmpeg (piped_script when it writes to a pipe)."""
+    return lambda src, out_path: ["sh", "-c", script if out_path or piped_script is None else piped_script]
+
+
+BROKEN_PIPE = "echo 'av_interleaved_write_frame(): Broken pipe' >&2; exit 1"
+
+
+class PipelineFailureTests(SimpleTestCase):
+    def test_reports_stage_that_broke_not_broken_pipe(self):
+        cmds = [["sh", "-c", BROKEN_PIPE], ["sh", "-c", "echo 'Unable to open subs.srt' >&2; exit 1"]]
+        with self.assertRaises(subprocess.CalledProcessError) as caught:
+            run_pipeline(cmds)
+        self.assertEqual(caught.exception.cmd, cmds[1])
+
+    def test_reports_earliest_failure(self):
+        cmds = [["sh", "-c", "exit 2"], ["sh", "-c", "exit 3"]]
+        with self.assertRaises(subprocess.CalledProcessError) as caught:
+            run_pipeline(cmds)
+        self.assertEqual(caught.exception.returncode, 2)
+
+
+class CaptionFallbackTests(SimpleTestCase):
+    srt = Path("captions.srt")
+
+    def render(self, upstream):
+        """render_with_captions with a failing burn-in stage after `upstream`; returns (result, warnings, runs)."""
+        runs, warnings = [], []
+
+        def render_stages(src, stages, out_path):
+            runs.append(len(stages))
+            run_pipeline(build_pipeline(src, stages, out_path))
+
+        def burn_in(src, out_path, srt_path):
+            return ["sh", "-c", "echo 'Unable to open' >&2; exit 1", f"subtitles={srt_path.as_posix()}"]
+
+        with mock.patch.object(timeline, "render_stages", render_stages), \
+                mock.patch.object(timeline, "build_burn_in_cmd", burn_in):
+            result = timeline.render_with_captions(Path("base.mp4"), [upstream], Path("out.mp4"),
+                                                   self.srt, warnings.append)
+        return result, warnings, runs
+
+    def test_burn_in_failure_falls_back(self):
+        # upstream only fails while piping into the (dead) burn-in stage
+        result, warnings, runs = self.render(sh_stage("exit 0", piped_script=BROKEN_PIPE))
+        self.assertFalse(result)
+        self.assertEqual(runs, [2, 1])
+        self.assertTrue(warnings[0].startswith("Captions skipped: Unable to open"))
+
+    def test_other_failure_is_raised(self):
+        with self.assertRaises(subprocess.CalledProcessError):
+            self.render(sh_stage("echo 'Invalid filter' >&2; exit 1"))
+
+
+class ProbeTests(MediaRootMixin, SimpleTestCase):
+    STILL = '{"format": {"size": "5"}, "streams": [{"codec_type": "video", "width": 640, "height": 480}]}'
+
+    def probe(self, name: str, returncode=0, stdout="", stderr=""):
+        path = self.media / name
+        path.write_bytes(b"bytes")
+        result = subprocess.CompletedProcess([], returncode, stdout, stderr)
+        return path, mock.patch.object(mediainfo, "run", return_value=result)
+
+    def test_unreadable_input_fails_preflight_with_message(self):
+        path, run = self.probe("broken.mp4", 1, stderr="broken.mp4: Invalid data found when processing input\n")
+        with run:
+            problem = preflight.check_input(path)
+        self.assertEqual(problem, "broken.mp4 has no duration (unreadable or empty media): "
+                                  "broken.mp4: Invalid data found when processing input")
+
+    def test_failed_probe_not_cached(self):
+        path, run = self.probe("broken.mp4", 1)
+        with run as probe:
+            mediainfo.media_info(path)
+            mediainfo.media_info(path)
+        self.assertEqual(probe.call_count, 2)
+
+    def test_still_probed_once(self):
+        path, run = self.probe("logo.png", stdout=self.STILL)
+        with run as probe:
+            self.assertEqual(preflight.check_input(path), "")
+            self.assertEqual(preflight.check_input(path), "")
+        self.assertEqual(probe.call_count, 1)
+
+
+@override_settings(RENDER_SCRATCH_DIR="")
+class ScratchGarbageTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.scratch = workspace.default_scratch_root()
+
+    def age(self, path: Path, hours: float):
+        t = time.time() - hours * 3600
+        os.utime(path, (t, t))
+
+    def stale_dir(self, root: Path, name: str, fresh_file: bool = False) -> Path:
+        d = root / name
+        d.mkdir(parents=True)
+        f = d / "part.mp4"
+        f.touch()
+        if not fresh_file:
+            self.age(f, 7)
+        self.age(d, 7)
+        return d
+
+    def test_removes_abandoned_scratch(self):
+        d = self.stale_dir(self.scratch, "crashed")
+        self.assertEqual(workspace.collect_garbage(), [d])
+        self.assertFalse(d.exists())
+
+    def test_keeps_dir_with_recent_writes(self):
+        self.stale_dir(self.scratch, "long-render", fresh_file=True)
+        self.assertEqual(workspace.collect_garbage(), [])
+
+    def test_keeps_workspace_held_by_a_render(self):
+        with workspace.RenderWorkspace(self.scratch) as ws:
+            for path in (ws.dir / workspace.LOCK_NAME, ws.dir):
+                self.age(path, 7)
+            self.assertEqual(workspace.collect_garbage(), [])
+        self.assertFalse(ws.dir.exists())
+        self.assertEqual(workspace.collect_garbage(), [])
+
+    def test_keeps_chunks_of_unfinished_job(self):
+        job = make_job(status=RenderJob.RUNNING)
+        d = self.stale_dir(self.media / "chunks", str(job.pk))
+        self.assertEqual(workspace.collect_garbage(), [])
+        RenderJob.objects.filter(pk=job.pk).update(status=RenderJob.DONE)
+        self.assertEqual(workspace.collect_garbage(), [d])
+
+    def test_scratch_files(self):
+        self.assertEqual(workspace.scratch_files(), 2)
+        self.assertEqual(workspace.scratch_files(trimmed=True, targets=2), 7)
+
+
+class SilenceTrimTests(SimpleTestCase):
+    SILENCES = [(10.0, 14.0), (30.0, 35.0)]
+
+    def trim(self, keyframe_times):
+        """trim_silence on a 60s video with SILENCES; returns (keeps, how it was cut, log lines)."""
+        keyframes = KeyframeIndex(times=np.array(keyframe_times, dtype=float),
+                                  offsets=np.full(len(keyframe_times), -1))
+        lines, calls = [], []
+        with mock.patch.object(timeline, "detect_silences", return_value=self.SILENCES), \
+                mock.patch.object(timeline, "load_keyframes", return_value=keyframes), \
+                mock.patch.object(timeline, "trim_to_keep_list", lambda *a: calls.append("copy")), \
+                mock.patch.object(timeline, "trim_exact", lambda *a: calls.append("exact")), \
+                mock.patch.object(timeline, "probe_duration_seconds", return_value=50.0):
+            _, _, keeps = timeline.trim_silence(Path("main.mp4"), 60.0, 0.15, Path("/tmp"), lines.append)
+        return keeps, calls, lines
+
+    def test_short_gop_stream_copies_from_keyframes(self):
+        keeps, calls, lines = self.trim(np.arange(0, 60, 0.5))
+        self.assertEqual(calls, ["copy"])
+        self.assertEqual([a for a, _ in keeps], [0.0, 13.5, 34.5])  # back to the keyframe before each start
+        self.assertEqual(lines, [])
+
+    def test_long_gop_cuts_exactly(self):
+        keeps, calls, lines = self.trim([0.0, 10.0, 20.0, 30.0, 40.0, 50.0])
+        self.assertEqual(calls, ["exact"])
+        self.assertEqual(keeps, [(0.0, 10.15), (13.85, 30.15), (34.85, 60.0)])
+        self.assertIn("re-encoding exact cuts", lines[0])
+
+    def test_nothing_to_cut(self):
+        with mock.patch.object(timeline, "detect_silences", return_value=[]):
+            self.assertEqual(timeline.trim_silence(Path("main.mp4"), 60.0, 0.15, Path("/tmp")),
+                             (Path("main.mp4"), 60.0, None))
+
+
+class ServeMediaTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        (self.media / "outputs").mkdir()
+        (self.media / "outputs" / "video.mp4").write_bytes(b"0123456789")
+        (self.media / "scratch").mkdir()
+        (self.media / "scratch" / "part.mp4").write_bytes(b"0123456789")
+
+    def get(self, path, user=None, **headers):
+        request = RequestFactory().get(f"/media/{path}", headers=headers)
+        request.user = user or AnonymousUser()
+        return views.serve_media(request, path)
+
+    @override_settings(DEBUG=False)
+    def test_production_requires_login(self):
+        with self.assertRaises(Http404):
+            self.get("outputs/video.mp4")
+        self.assertEqual(self.get("outputs/video.mp4", user=User(username="editor")).status_code, 200)
+
+    @override_settings(DEBUG=True)
+    def test_debug_serves_public_folders_only(self):
+        response = self.get("outputs/video.mp4", Range="bytes=2-4")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), b"234")
+        for path in ("scratch/part.mp4", "../outside.mp4"):
+            with self.assertRaises(Http404):
+                self.get(path)
+
+
+class ParseRangeTests(SimpleTestCase):
+    def test_single_ranges(self):
+        self.assertIsNone(serve.parse_range(None, 1000))
+        self.assertEqual(serve.parse_range("bytes=0-99", 1000), (0, 99))
+        self.assertEqual(serve.parse_range("bytes=900-", 1000), (900, 999))
+        self.assertEqual(serve.parse_range("bytes=500-5000", 1000), (500, 999))  # end clamped to the file
+
+    def test_suffix_ranges(self):
+        self.assertEqual(serve.parse_range("bytes=-100", 1000), (900, 999))
+        self.assertEqual(serve.parse_range("bytes=-5000", 1000), (0, 999))
+        with self.assertRaises(serve.RangeNotSatisfiable):
+            serve.parse_range("bytes=-0", 1000)
+
+    def test_multi_and_other_units_serve_whole_file(self):
+        for header in ("bytes=0-1,5-9", "items=0-1", "bytes=-", "bytes=a-b"):
+            self.assertIsNone(serve.parse_range(header, 1000), header)
+
+    def test_unsatisfiable(self):
+        for header in ("bytes=1000-", "bytes=1000-2000", "bytes=5-4"):
+            with self.assertRaises(serve.RangeNotSatisfiable):
+                serve.parse_range(header, 1000)
+
+
+class DroppedStream:
+    """Request body whose connection drops after data."""
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def read(self, n: int) -> bytes:
+        if not self.data:
+            raise OSError("connection reset by peer")
+        out, self.data = self.data[:n], self.data[n:]
+        return out
+
+
+class AppendChunkTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.asset = uploads.create_upload("clip.mp4", 10)
+        self.path = uploads.asset_path(self.asset)
+
+    def append(self, offset, data, length=None, asset=None):
+        return uploads.append_chunk(asset or self.asset, offset, io.BytesIO(data),
+                                    len(data) if length is None else length)
+
+    def test_appends_until_complete(self):
+        self.assertEqual(self.append(0, b"01234").offset, 5)
+        asset = self.append(5, b"56789")
+        self.assertEqual((asset.offset, asset.completed), (10, True))
+        self.assertEqual(self.path.read_bytes(), b"0123456789")
+        self.assertEqual(list(self.path.parent.glob("*.part")), [])
+
+    def test_wrong_offset_conflicts(self):
+        self.append(0, b"01234")
+        with self.assertRaises(uploads.UploadError) as cm:
+            self.append(3, b"34567")
+        self.assertEqual(cm.exception.status, 409)
+        self.assertEqual(self.path.read_bytes(), b"01234")
+
+    def test_dropped_connection_keeps_what_arrived(self):
+        asset = uploads.append_chunk(self.asset, 0, DroppedStream(b"012"), 5)
+        self.assertEqual((asset.offset, asset.completed), (3, False))
+        self.assertEqual(self.append(3, b"3456789").offset, 10)  # the client resumes at the stored offset
+        self.assertEqual(self.path.read_bytes(), b"0123456789")
+        self.assertEqual(list(self.path.parent.glob("*.part")), [])
+
+    def test_concurrent_append_of_same_range_applies_once(self):
+        # both PATCHes started at offset 0; the retry of the same range answers with the stored offset
+        stale = type(self.asset).objects.get(pk=self.asset.pk)
+        self.append(0, b"01234")
+        self.assertEqual(self.append(0, b"01234", asset=stale).offset, 5)
+        self.assertEqual(self.path.read_bytes(), b"01234")
+        stale = type(self.asset).objects.get(pk=self.asset.pk)
+        self.append(5, b"567")
+        with self.assertRaises(uploads.UploadError) as cm:
+            self.append(5, b"56", asset=stale)
+        self.assertEqual(cm.exception.status, 409)
+        self.assertEqual(self.path.read_bytes(), b"01234567")
+        self.assertEqual(list(self.path.parent.glob("*.part")), [])
+
+    def test_chunk_past_declared_size(self):
+        with self.assertRaises(uploads.UploadError) as cm:
+            self.append(0, b"0123456789ab")
+        self.assertEqual(cm.exception.status, 413)
+
+    def test_completed_upload_is_read_only(self):
+        self.append(0, b"0123456789")
+        with self.assertRaises(uploads.UploadError) as cm:
+            self.append(10, b"")
+        self.assertEqual(cm.exception.status, 403)
+
+
+class KeepListTests(SimpleTestCase):
+    def test_pads_speech_into_each_silence(self):
+        self.assertEqual(silence.build_keep_list([(2.0, 5.0)], 10.0, padding=0.15), [(0.0, 2.15), (4.85, 10.0)])
+
+    def test_leading_and_trailing_silence_cut_to_the_edges(self):
+        self.assertEqual(silence.build_keep_list([(8.0, 10.0), (0.0, 1.0)], 10.0, padding=0.15), [(0.85, 8.15)])
+
+    def test_silence_shorter_than_padding_is_kept(self):
+        self.assertEqual(silence.build_keep_list([(3.0, 3.2)], 10.0, padding=0.15), [(0.0, 10.0)])
+
+    def test_drops_short_islands(self):
+        self.assertEqual(silence.build_keep_list([(1.0, 3.0), (3.1, 6.0)], 10.0, padding=0.0), [(0.0, 1.0), (6.0, 10.0)])
+
+    def test_remap_time(self):
+        keeps = [(0.0, 2.0), (5.0, 8.0)]
+        self.assertAlmostEqual(silence.remap_time(1.0, keeps), 1.0)
+        self.assertAlmostEqual(silence.remap_time(3.0, keeps), 2.0)  # in the gap: start of the next keep
+        self.assertAlmostEqual(silence.remap_time(6.5, keeps), 3.5)
+        self.assertAlmostEqual(silence.remap_time(9.0, keeps), 5.0)  # past the end: end of the trimmed video
+
+
+class SnapToCutTests(SimpleTestCase):
+    CUTS = [10.0, 20.0]
+
+    def test_snaps_within_tolerance(self):
+        self.assertEqual(scenes.snap_to_cut(10.3, self.CUTS), 10.0)
+        self.assertEqual(scenes.snap_to_cut(19.6, self.CUTS), 20.0)
+
+    def test_leaves_distant_times(self):
+        self.assertEqual(scenes.snap_to_cut(10.6, self.CUTS), 10.6)
+        self.assertEqual(scenes.snap_to_cut(15.0, self.CUTS), 15.0)
+        self.assertEqual(scenes.snap_to_cut(15.0, []), 15.0)
+
+    def test_nearest_cut_wins(self):
+        self.assertEqual(scenes.snap_to_cut(14.0, self.CUTS, tolerance=10), 10.0)
+        self.assertEqual(scenes.snap_to_cut(16.0, self.CUTS, tolerance=10), 20.0)
+        self.assertEqual(scenes.snap_to_cut(25.0, self.CUTS, tolerance=10), 20.0)
+
+
+class PlaceWindowTests(SimpleTestCase):
+    def test_clamps_to_video(self):
+        self.assertEqual(timeline.place_window(-1.0, 5.0, 10.0), (0.0, 5.0))
+        self.assertEqual(timeline.place_window(8.0, 5.0, 10.0), (8.0, 2.0))
+        self.assertEqual(timeline.place_window(12.0, 5.0, 10.0), (10.0, 0.0))
+
+    def test_remaps_through_silence_trim(self):
+        keeps = [(0.0, 2.0), (5.0, 10.0)]
+        self.assertEqual(timeline.place_window(6.0, 2.0, 7.0, keeps=keeps), (3.0, 2.0))
+        self.assertEqual(timeline.place_window(3.0, 4.0, 7.0, keeps=keeps), (2.0, 2.0))  # starts in a cut gap
+
+    def test_snaps_both_ends_to_cuts(self):
+        start, dur = timeline.place_window(9.8, 5.0, 60.0, cuts=[10.0, 15.2])
+        self.assertEqual(start, 10.0)
+        self.assertAlmostEqual(dur, 5.2)
+        self.assertEqual(timeline.place_window(57.0, 3.0, 60.0, cuts=[60.2]), (57.0, 3.0))  # never past the end
+
+
+@override_settings(RENDER_AGING_SECONDS=600)
+class RankedTests(TestCase):
+    def queued(self, owner="", priority=RenderJob.FINAL, age=0):
+        job = make_job(owner=owner, priority=priority)
+        RenderJob.objects.filter(pk=job.pk).update(created_at=timezone.now() - timedelta(seconds=age))
+        return job.pk
+
+    def order(self, model=RenderJob):
+        return [pk for _, pk in scheduler.ranked(model)]
+
+    def test_class_before_age(self):
+        batch = self.queued(priority=RenderJob.BATCH, age=60)
+        final = self.queued(priority=RenderJob.FINAL, age=30)
+        interactive = self.queued(priority=RenderJob.INTERACTIVE)
+        self.assertEqual(self.order(), [interactive, final, batch])
+
+    def test_owner_with_fewest_running_goes_first(self):
+        make_job(owner="alice", status=RenderJob.RUNNING)
+        alice = self.queued("alice", age=60)
+        carol = self.queued("carol", age=30)
+        bob = self.queued("bob")
+        self.assertEqual(self.order(), [carol, bob, alice])
+
+    def test_aged_batch_competes_with_final(self):
+        final = self.queued(priority=RenderJob.FINAL, age=10)
+        batch = self.queued(priority=RenderJob.BATCH, age=1200)
+        self.assertEqual(self.order(), [batch, final])
+
+    def test_chunks_rank_by_their_job(self):
+        batch = make_job(owner="a", priority=RenderJob.BATCH, status=RenderJob.RUNNING)
+        interactive = make_job(owner="b", priority=RenderJob.INTERACTIVE, status=RenderJob.RUNNING)
+        late = RenderChunk.objects.create(job=batch, index=0, start=0, end=10)
+        early = RenderChunk.objects.create(job=interactive, index=0, start=0, end=10)
+        self.assertEqual(self.order(RenderChunk), [early.pk, late.pk])
+
+
+class CoalesceTests(MediaRootMixin, SimpleTestCase):
+    A, B = "a" * 32, "b" * 32
+
+    def setUp(self):
+        super().setUp()
+        for patch in (mock.patch.object(coalesce, "FLIGHT_DIR", str(self.media / "flights")),
+                      mock.patch.object(coalesce, "POLL_SECONDS", 0.01)):
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.calls = []
+        self.view = coalesce.coalesced(self.render)
+
+    def render(self, request):
+        self.calls.append(request.POST["render_token"])
+        return HttpResponse(f"rendered {request.POST['render_token']}", content_type="text/plain")
+
+    def post(self, token, previous="", title="demo"):
+        return RequestFactory().post("/", {"title": title, "render_token": token, "previous_render_token": previous})
+
+    def test_key_ignores_tokens(self):
+        key = coalesce.submission_key(self.post(self.A))
+        self.assertEqual(coalesce.submission_key(self.post(self.B, previous=self.A)), key)
+        self.assertNotEqual(coalesce.submission_key(self.post(self.A, title="other")), key)
+
+    def test_duplicate_in_flight_gets_the_leaders_page(self):
+        path = Path(coalesce.FLIGHT_DIR) / f"{coalesce.submission_key(self.post(self.A))}.flight"
+        path.parent.mkdir()
+        fd = os.open(path, os.O_RDWR | os.O_CREAT)
+        self.addCleanup(os.close, fd)
+        fcntl.flock(fd, fcntl.LOCK_EX)  # the leader is rendering
+        result = []
+        waiter = threading.Thread(target=lambda: result.append(self.view(self.post(self.B))))
+        waiter.start()
+        time.sleep(0.1)
+        page = {"status": 200, "content_type": "text/plain", "body": "leader's page"}
+        coalesce._write(fd, {"token": self.A, "response": page})
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        waiter.join(5)
+        self.assertEqual(result[0].content, b"leader's page")
+        self.assertEqual(self.calls, [])
+
+    def test_later_duplicate_renders_again(self):
+        self.view(self.post(self.A))
+        self.assertEqual(self.view(self.post(self.B)).content, b"rendered " + self.B.encode())
+        self.assertEqual(self.calls, [self.A, self.B])
+        (flight,) = Path(coalesce.FLIGHT_DIR).glob("*.flight")
+        self.assertEqual(json.loads(flight.read_text())["response"]["body"], "rendered " + self.B)
+
+    def test_different_submission_cancels_the_one_it_replaces(self):
+        self.view(self.post(self.B, previous=self.A, title="other"))
+        self.assertTrue(cancellation.marker_path(self.A).exists())
+        self.assertFalse(cancellation.marker_path(self.B).exists())
+
+    def test_malformed_previous_token_is_ignored(self):
+        self.view(self.post(self.B, previous="../../settings"))
+        self.assertEqual(self.calls, [self.B])
+        self.assertFalse(cancellation.marker_dir().exists())
+
+
+class CancellationTests(MediaRootMixin, SimpleTestCase):
+    TOKEN = "0123456789abcdef" * 2
+
+    def test_rejects_malformed_tokens(self):
+        for token in ("", None, "../../settings", self.TOKEN.upper(), self.TOKEN + "0"):
+            with self.assertRaises(ValueError):
+                cancellation.marker_path(token)
+        self.assertEqual(cancellation.marker_path(self.TOKEN), self.media / "cancel" / self.TOKEN)
+
+    @mock.patch.object(cancellation, "WATCH_SECONDS", 0.01)
+    def test_marker_cancels_watched_render(self):
+        with cancellation.watching(self.TOKEN) as cancelled:
+            self.assertFalse(ffmpeg.cancelled())
+            cancellation.request_cancel(self.TOKEN)
+            self.assertTrue(cancelled.wait(5))
+            self.assertTrue(ffmpeg.cancelled())
+        self.assertFalse(ffmpeg.cancelled())
+        self.assertFalse(cancellation.marker_path(self.TOKEN).exists())  # consumed, so the token can't cancel twice
+
+    def test_finishes_without_marker(self):
+        with cancellation.watching(self.TOKEN) as cancelled:
+            pass
+        self.assertFalse(cancelled.is_set())
+
+
+class GraphCheckTests(SimpleTestCase):
+    SUFFIX = "(the row ends before its fade can run)"
+
+    def test_flags_negative_fade_start(self):
+        cmd = ["ffmpeg", "-i", "a.mp4", "-filter_complex",
+               "[1:v]fade=t=in:st=0.5:d=0.5,fade=t=out:st=-1.25:d=0.5[pip]", "-map", "[pip]"]
+        self.assertEqual(preflight.check_graphs([cmd], ["Stage 2 (pip)"]),
+                         [f"Stage 2 (pip): fade would start at -1.25s {self.SUFFIX}"])
+
+    def test_checks_vf_graphs_only(self):
+        ok = ["ffmpeg", "-vf", "fade=t=in:st=0:d=1", "-metadata", "comment=st=-1"]
+        bad = ["ffmpeg", "-vf", "fade=t=out:st=-0.2:d=1"]
+        self.assertEqual(preflight.check_graphs([ok, bad], ["one", "two"]),
+                         [f"two: fade would start at -0.20s {self.SUFFIX}"])
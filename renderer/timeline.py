@@ -0,0 +1,304 @@
+# renderer/timeline.py
+"""
+Request-free rendering: a TimelineSpec references already-stored assets by id and is
+turned into the same pipeline stages the form view builds. Used by the JSON render API
+and by the view helpers, so both paths place, snap and composite identically.
+"""
+import os, subprocess, uuid
+from dataclasses import dataclass, field, asdict
+from functools import partial
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+from . import preflight, telemetry
+from .broll import BRollSeg, build_segments_from_rows, build_overlay_cmd, build_base_only_cmd, probe_duration_seconds
+from .captions import transcribe_to_srt, build_burn_in_cmd
+from .keyframes import keyframe_index
+from .mediainfo import media_duration
+from .models import InputData, PiPClip, BrollClip, UploadedAsset
+from .outputs import OutputTarget, render_outputs, sibling_path
+from .pipeline import Stage, render_stages
+from .scenes import scene_cut_index, snap_to_cut
+from .shrink import build_shrink_pip_cmd
+from .silence import (
+    detect_silences, build_keep_list, kept_seconds,
+    align_keeps_to_keyframes, trim_to_keep_list, trim_exact, remap_time, MIN_COPY_SAVING, PADDING
+)
+from .uploads import asset_path
+from .workspace import open_workspace, scratch_files
+
+PIP_FADE = 1.0  # PiP background fade in/out, seconds
+ZOOM_DIRECTIONS = ("left", "center", "right")
+
+# ---------- spec ----------
+@dataclass
+class BrollRow:
+    asset: str
+    start: float
+    duration: float
+
+@dataclass
+class PipRow:
+    start: float
+    duration: float
+    overlay_asset: Optional[str] = None
+    zoom_direction: Optional[str] = None
+    zoom_start: Optional[float] = None
+    zoom_end: Optional[float] = None
+
+@dataclass
+class TimelineSpec:
+    main_asset: str
+    title: str = ""
+    broll: List[BrollRow] = field(default_factory=list)
+    pip: List[PipRow] = field(default_factory=list)
+    captions: bool = False
+    caption_model: str = "base"
+    trim_silence: bool = False
+    silence_padding: float = PADDING
+    snap_broll: bool = False
+    snap_pip: bool = False
+    outputs: List[OutputTarget] = field(default_factory=list)  # extra renditions besides the master
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "TimelineSpec":
+        data = dict(data)
+        data["main_asset"] = str(data["main_asset"])
+        data["broll"] = [BrollRow(**{**r, "asset": str(r["asset"])}) for r in data.get("broll", [])]
+        data["pip"] = [
+            PipRow(**{**r, "overlay_asset": str(r["overlay_asset"]) if r.get("overlay_asset") else None})
+            for r in data.get("pip", [])
+        ]
+        data["outputs"] = [OutputTarget(**o) for o in data.get("outputs", [])]
+        return cls(**data)
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+    def asset_ids(self) -> List[str]:
+        ids = [self.main_asset] + [r.asset for r in self.broll]
+        return ids + [r.overlay_asset for r in self.pip if r.overlay_asset]
+
+# ---------- shared placement helpers (also used by the form view) ----------
+def place_window(start: float, duration: float, video_dur: float,
+                 keeps=None, cuts=None) -> Tuple[float, float]:
+    """
+    Move a [start, start+duration] window entered against the original timeline onto the
+    rendered one: remap through silence trimming, clamp, then snap to scene cuts.
+    """
+    if keeps:
+        end = remap_time(start + duration, keeps)
+        start = remap_time(start, keeps)
+        duration = end - start
+    start = max(0.0, min(start, video_dur))
+    duration = max(0.0, min(duration, max(0.0, video_dur - start)))
+    if cuts:
+        end = min(video_dur, snap_to_cut(start + duration, cuts))
+        start = snap_to_cut(start, cuts)
+        duration = max(0.0, end - start)
+    return start, duration
+
+def pip_stage(pip_data: Dict) -> Stage:
+    """Pipeline stage for a single PiP effect - direct control, no black box"""
+    # Pass zoom data to build_shrink_pip_cmd for processing
+    return partial(
+        build_shrink_pip_cmd,
+        start_sec=pip_data['start'],
+        dur_sec=pip_data['duration'],
+        overlay_path=pip_data['overlay_path'],
+        fade_in=PIP_FADE,
+        fade_out=PIP_FADE,
+        zoom_direction=pip_data.get('zoom_direction'),
+        zoom_start=pip_data.get('zoom_start'),
+        zoom_end=pip_data.get('zoom_end'),
+    )
+
+def trim_silence(base_path: Path, video_dur: float, padding: float, workdir: Path,
+                 log: Callable[[str], None] = print):
+    """
+    Cut dead air out of the main video.
+    The kept ranges are stream-copied from the keyframe before each one, unless that would
+    bring back most of the silence (long-GOP camera/screen recordings): then they are
+    re-encoded with exact cuts.
+    Returns (base_path, video_dur, keeps); keeps is None when nothing was cut.
+    """
+    silences = detect_silences(base_path, video_dur)
+    keeps = build_keep_list(silences, video_dur, padding=max(0.0, padding))
+    if not keeps:
+        raise ValueError("Silence trimming would remove the whole video.")
+    cut = video_dur - kept_seconds(keeps)
+    if cut < 0.05:
+        return base_path, video_dur, None
+
+    trimmed_path = Path(workdir) / f"{uuid.uuid4()}_trimmed.mp4"
+    aligned = align_keeps_to_keyframes(keeps, load_keyframes(base_path))
+    aligned_cut = video_dur - kept_seconds(aligned)
+    if aligned_cut >= MIN_COPY_SAVING * cut:
+        keeps = aligned
+        trim_to_keep_list(base_path, keeps, trimmed_path)
+    else:
+        log(f"Silence trim: keyframes too far apart to cut by stream copy "
+            f"({aligned_cut:.1f}s of {cut:.1f}s silence removed); re-encoding exact cuts")
+        trim_exact(base_path, keeps, trimmed_path)
+    trimmed_dur = probe_duration_seconds(trimmed_path)
+    if trimmed_dur <= 0:
+        raise ValueError("Could not detect duration of the silence-trimmed video.")
+    return trimmed_path, trimmed_dur, keeps
+
+def load_keyframes(base_path: Path):
+    """Keyframe index for cut planning and seeks, cached per main video."""
+    return keyframe_index(base_path, Path(settings.MEDIA_ROOT) / "cache" / "keyframes")
+
+def load_cuts(base_path: Path) -> List[float]:
+    """Scene-cut times for snap-to-cut, cached per main video."""
+    return scene_cut_index(base_path, Path(settings.MEDIA_ROOT) / "cache" / "scenes")
+
+def render_with_captions(base_path: Path, stages: List[Stage], out_path: Path,
+                         srt_path: Optional[Path], warn: Callable[[str], None],
+                         targets: Optional[List[OutputTarget]] = None) -> bool:
+    """
+    Render, adding the burn-in caption stage when there is an SRT. A failing burn-in stage
+    still yields the uncaptioned video; any other stage's failure is raised. Extra targets
+    are encoded from the same composite next to out_path (see renderer/outputs.py).
+    Returns whether captions were burned in.
+    """
+    def render(stages):
+        if targets:
+            render_outputs(base_path, stages, out_path, targets)
+        else:
+            render_stages(base_path, stages, out_path)
+
+    if not srt_path:
+        render(stages)
+        return False
+    try:
+        render(stages + [partial(build_burn_in_cmd, srt_path=srt_path)])
+        return True
+    except subprocess.CalledProcessError as cap_err:
+        if not any(f"subtitles={srt_path.as_posix()}" in str(a) for a in cap_err.cmd or []):
+            raise  # B-roll/PiP/encode failure: rendering again without captions would fail the same way
+        warn(f"Captions skipped: {(cap_err.stderr or '').strip()[-500:] or cap_err}")
+        render(stages)
+        return False
+
+def promote_outputs(ws, out_path: Path, targets: List[OutputTarget], outdir: Path) -> Path:
+    """Move the master and every target's file out of scratch; returns the master's new path."""
+    for t in targets:
+        ws.promote(sibling_path(out_path, t.name), outdir)
+    return ws.promote(out_path, outdir)
+
+# ---------- spec -> stages ----------
+@dataclass
+class Plan:
+    stages: List[Stage]
+    segs: List[BRollSeg]
+    pips: List[Dict]
+    messages: List[str]
+
+def resolve_assets(spec: TimelineSpec) -> Dict[str, Path]:
+    """Map every asset id in the spec to its file (one query)."""
+    ids = set(spec.asset_ids())
+    found = {str(a.id): asset_path(a) for a in UploadedAsset.objects.filter(id__in=ids, completed=True)}
+    missing = ids - set(found)
+    if missing:
+        raise ValueError(f"Upload(s) not found or not complete: {', '.join(sorted(missing))}")
+    return found
+
+def plan_stages(spec: TimelineSpec, paths: Dict[str, Path], video_dur: float,
+                keeps=None, cuts=None) -> Plan:
+    """Build the B-roll + PiP stages for a spec on a (possibly trimmed) timeline of video_dur."""
+    time_map = (lambda t: remap_time(t, keeps)) if keeps else None
+    segs, messages = build_segments_from_rows(
+        [paths[r.asset] for r in spec.broll],
+        [r.start for r in spec.broll], [r.duration for r in spec.broll],
+        Path(settings.MEDIA_ROOT) / "uploads", video_dur,
+        cuts=cuts if spec.snap_broll else None, time_map=time_map,
+    )
+    stages = [partial(build_overlay_cmd, segs=segs) if segs else build_base_only_cmd]
+
+    pips = []
+    for i, row in enumerate(spec.pip):
+        start, duration = place_window(row.start, row.duration, video_dur, keeps,
+                                       cuts if spec.snap_pip else None)
+        if duration <= 0:
+            continue
+        pip_data = {
+            'start': start,
+            'duration': duration,
+            'overlay_path': paths[row.overlay_asset] if row.overlay_asset else None,
+            'row_index': i,
+            'zoom_direction': row.zoom_direction,
+            'zoom_start': row.zoom_start,
+            'zoom_end': row.zoom_end,
+        }
+        pips.append(pip_data)
+        stages.append(pip_stage(pip_data))
+        messages.append(f"+ PiP row {i+1}: {start:.2f}s for {duration:.2f}s")
+    return Plan(stages=stages, segs=segs, pips=pips, messages=messages)
+
+# ---------- full render ----------
+def render_timeline(spec: TimelineSpec, log: Callable[[str], None] = print) -> Tuple[Path, InputData]:
+    """Render a spec end to end and record it like the form does; returns (output path, InputData)."""
+    paths = resolve_assets(spec)
+    main_path = paths[spec.main_asset]
+    video_dur = media_duration(main_path)
+    if video_dur <= 0:
+        raise ValueError("Could not detect duration from the main video.")
+    rec = telemetry.current()
+    if rec:
+        rec.source_duration = video_dur
+
+    outdir = Path(settings.MEDIA_ROOT) / "outputs"
+    outdir.mkdir(parents=True, exist_ok=True)
+    with open_workspace(video_dur, outdir, files=scratch_files(spec.trim_silence, len(spec.outputs))) as ws:
+        base_path, dur, keeps = main_path, video_dur, None
+        if spec.trim_silence:
+            base_path, dur, keeps = trim_silence(main_path, video_dur, spec.silence_padding, ws.dir, log)
+        cuts = load_cuts(base_path) if (spec.snap_broll or spec.snap_pip) else None
+        plan = plan_stages(spec, paths, dur, keeps, cuts)
+        for msg in plan.messages:
+            log(msg)
+        preflight.check_stages(base_path, plan.stages)
+
+        srt_path = None
+        if spec.captions:
+            try:
+                with telemetry.stage("transcribe", inputs=[base_path]) as st:
+                    srt_path = st.output = transcribe_to_srt(Path(base_path), spec.caption_model)
+            except Exception as cap_err:
+                log(f"Captions skipped: {cap_err}")
+
+        out_path = ws.new_path()
+        render_with_captions(base_path, plan.stages, out_path, srt_path, log, spec.outputs)
+        out_path = promote_outputs(ws, out_path, spec.outputs, outdir)
+
+    return out_path, save_render_rows(spec, main_path, out_path, plan)
+
+def save_render_rows(spec: TimelineSpec, main_path: Path, out_path: Path, plan: Plan) -> InputData:
+    """Record a finished render the way the form does: InputData plus its PiP and B-roll rows."""
+    input_data = InputData.objects.create(
+        title=spec.title or Path(main_path).stem,
+        main_video=os.path.relpath(main_path, settings.MEDIA_ROOT),
+        completed_video=os.path.relpath(out_path, settings.MEDIA_ROOT),
+        outputs={t.name: os.path.relpath(sibling_path(out_path, t.name), settings.MEDIA_ROOT) for t in spec.outputs},
+    )
+    for pip in plan.pips:
+        PiPClip.objects.create(
+            input_data=input_data,
+            start=pip['start'],
+            duration=pip['duration'],
+            overlay=os.path.relpath(pip['overlay_path'], settings.MEDIA_ROOT) if pip['overlay_path'] else None,
+            zoom_direction=pip['zoom_direction'],
+            zoom_start=pip['zoom_start'],
+            zoom_end=pip['zoom_end'],
+        )
+    for seg in plan.segs:
+        BrollClip.objects.create(
+            input_data=input_data,
+            file=os.path.relpath(seg.clip_path, settings.MEDIA_ROOT),
+            start=seg.t0,
+            duration=seg.t1 - seg.t0,
+        )
+    return input_data
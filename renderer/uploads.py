@@ -0,0 +1,135 @@
+# renderer/uploads.py
+import fcntl, hashlib, os, re, shutil, threading, uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import close_old_connections, transaction
+
+from .models import UploadedAsset
+
+# ===== Chunked upload settings =====
+READ_SIZE = 1 << 20               # bytes read from the request per write (bounds memory)
+MAX_UPLOAD_SIZE = 20 * (1 << 30)  # refuse declared sizes above 20 GB
+
+HASH_WORKERS = 1
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _pool() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="upload-hash")
+        return _executor
+
+class UploadError(Exception):
+    """Raised for client errors; `status` is the HTTP status to return."""
+    def __init__(self, msg: str, status: int = 400):
+        super().__init__(msg)
+        self.status = status
+
+def _safe_name(filename: str) -> str:
+    name = os.path.basename(filename or "upload.bin")
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", name)[:200] or "upload.bin"
+
+def asset_path(asset: UploadedAsset) -> Path:
+    return Path(settings.MEDIA_ROOT) / asset.file.name
+
+def create_upload(filename: str, size: int) -> UploadedAsset:
+    """Register a new upload and create its empty target file."""
+    if size < 0 or size > MAX_UPLOAD_SIZE:
+        raise UploadError(f"Invalid upload size: {size}", status=413 if size > 0 else 400)
+    asset = UploadedAsset(filename=_safe_name(filename), size=size)
+    asset.file.name = f"uploads/{asset.id}_{asset.filename}"
+    path = asset_path(asset)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.touch()
+    if size == 0:
+        asset.completed = True
+        asset.sha256 = hashlib.sha256().hexdigest()
+    asset.save()
+    return asset
+
+def _stage(path: Path, stream, length: int) -> int:
+    """Copy up to `length` bytes of the request body into path (no lock held); returns bytes received."""
+    written = 0
+    with open(path, "wb") as f:
+        while written < length:
+            buf = stream.read(min(READ_SIZE, length - written))
+            if not buf:
+                break
+            f.write(buf)
+            written += len(buf)
+    return written
+
+def append_chunk(asset: UploadedAsset, offset: int, stream, length: int) -> UploadedAsset:
+    """
+    Append `length` bytes from `stream` at `offset` (must equal the stored offset).
+    Whatever arrives before a dropped connection is kept, so the client can resume.
+
+    The body is first received into a staging file with no lock held; only the append
+    itself runs under an flock on the asset's file (per asset, across processes), so a
+    slow client never blocks other uploads.
+    """
+    if asset.completed:
+        raise UploadError("Upload already completed.", status=403)
+    if offset != asset.offset:
+        raise UploadError(f"Offset mismatch: expected {asset.offset}, got {offset}", status=409)
+    if length < 0 or offset + length > asset.size:
+        raise UploadError("Chunk exceeds declared upload length.", status=413)
+
+    path = asset_path(asset)
+    staged = path.with_name(f".{path.name}.{uuid.uuid4().hex}.part")
+    try:
+        try:
+            received = _stage(staged, stream, length)
+        except OSError:
+            received = staged.stat().st_size if staged.exists() else 0  # connection dropped mid-chunk
+        with open(path, "r+b") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            # another PATCH may have appended this range while the body was arriving
+            if UploadedAsset.objects.filter(pk=asset.pk, offset=offset).exists():
+                f.seek(offset)
+                with open(staged, "rb") as src:
+                    shutil.copyfileobj(src, f, READ_SIZE)
+                f.truncate(offset + received)
+                f.flush()
+                fields = {"offset": offset + received}
+                if offset + received == asset.size:
+                    fields["completed"] = True
+                # compare-and-set so two concurrent PATCHes can't both advance
+                if UploadedAsset.objects.filter(pk=asset.pk, offset=offset).update(**fields) and fields.get("completed"):
+                    transaction.on_commit(lambda: _pool().submit(hash_upload, asset.pk))
+    finally:
+        staged.unlink(missing_ok=True)
+    asset.refresh_from_db()
+    if asset.offset != offset + received and not asset.completed:
+        raise UploadError(f"Offset mismatch: expected {asset.offset}, got {offset}", status=409)
+    return asset
+
+def hash_upload(pk) -> str:
+    """sha256 a completed upload once, in the background, and store it; never raises."""
+    try:
+        asset = UploadedAsset.objects.get(pk=pk, completed=True)
+        h = hashlib.sha256()
+        with open(asset_path(asset), "rb") as f:
+            for buf in iter(lambda: f.read(READ_SIZE), b""):
+                h.update(buf)
+        UploadedAsset.objects.filter(pk=pk).update(sha256=h.hexdigest())
+        return h.hexdigest()
+    except Exception as e:
+        print(f"Could not hash upload {pk}: {e}")
+        return ""
+    finally:
+        close_old_connections()
+
+def completed_asset_path(asset_id: str) -> Path:
+    """Resolve a completed asset id (as posted by the render form) to its file path."""
+    try:
+        asset = UploadedAsset.objects.get(pk=asset_id, completed=True)
+    except (UploadedAsset.DoesNotExist, ValidationError, ValueError):
+        raise ValueError(f"Upload {asset_id} not found or not complete.")
+    return asset_path(asset)
@@ -1,5 +1,9 @@
 from django.urls import path
-from .views import index, explainer_video, render_video
+from .views import index, explainer_video, render_video, render_cancel, upload_create, upload_detail
+from .api import (
+    render_jobs, render_job_detail, render_job_cancel, render_estimate, render_stats, preview_frame, preview_clip,
+    preview_stream, preview_stream_detail,
+)
 
 app_name = 'renderer'
 
@@ -7,4 +11,16 @@ urlpatterns = [
     path('', index, name='index'),
     path('explainer/', explainer_video, name='explainer_video'),
     path('render/', render_video, name='render_video'),
+    path('render/cancel/', render_cancel, name='render_cancel'),
+    path('uploads/', upload_create, name='upload_create'),
+    path('uploads/<uuid:asset_id>/', upload_detail, name='upload_detail'),
+    path('api/renders/', render_jobs, name='render_jobs'),
+    path('api/renders/estimate/', render_estimate, name='render_estimate'),
+    path('api/renders/stats/', render_stats, name='render_stats'),
+    path('api/renders/<uuid:job_id>/', render_job_detail, name='render_job_detail'),
+    path('api/renders/<uuid:job_id>/cancel/', render_job_cancel, name='render_job_cancel'),
+    path('api/previews/frame/', preview_frame, name='preview_frame'),
+    path('api/previews/clip/', preview_clip, name='preview_clip'),
+    path('api/previews/stream/', preview_stream, name='preview_stream'),
+    path('api/previews/stream/<str:stream_id>/', preview_stream_detail, name='preview_stream_detail'),
 ]
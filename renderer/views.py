@@ -1,23 +1,33 @@
 # renderer/views.py
 import uuid
 import os
+from functools import partial
 from pathlib import Path
 from typing import List
 from django.conf import settings
-from django.shortcuts import render
+from django.shortcuts import render, get_object_or_404
+from django.http import JsonResponse, HttpResponse, FileResponse, Http404
+from django.utils.http import http_date, parse_http_date_safe
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
-from .captions import transcribe_to_srt, burn_in_subtitles
-from .shrink import apply_shrink_pip
+from .captions import transcribe_to_srt
+from .silence import remap_time, PADDING
+from .timeline import place_window, pip_stage, trim_silence, load_cuts, render_with_captions, promote_outputs
+from .outputs import PRESETS, sibling_path
 
 
 from .broll import (
     save_uploaded_file, probe_duration_seconds,
-    build_segments_from_rows, encode_with_overlays, encode_base_only
+    build_segments_from_rows, build_overlay_cmd, build_base_only_cmd
 )
 
-from .models import InputData, PiPClip, BrollClip
+from .models import InputData, PiPClip, BrollClip, UploadedAsset
+from .mediainfo import media_info
+from .uploads import asset_path, create_upload, append_chunk, completed_asset_path, UploadError
+from .workspace import open_workspace, scratch_files
+from .serve import content_etag, etag_matches, parse_range, RangeFile, RangeNotSatisfiable
 from .signals import render_clicked
+from . import cancellation, coalesce, packaging, preflight, telemetry
 
 # Import PreProduction model
 from preproduction.models import PreProduction
@@ -45,8 +55,17 @@ def process_main_video(request, updir):
     
     # Check if using pre-production video
     use_preprod_main = request.POST.get("use_preprod_main")
+    main_asset = request.POST.get("main_asset")
     
-    if use_preprod_main:
+    if main_asset:
+        # Already on disk via the chunked upload endpoint - no copy needed
+        base_path = completed_asset_path(main_asset)
+        video_dur = probe_duration_seconds(base_path)
+        if video_dur <= 0:
+            raise ValueError("Could not detect duration from the uploaded video.")
+        relative_path = os.path.relpath(base_path, settings.MEDIA_ROOT)
+        return base_path, video_dur, relative_path
+    elif use_preprod_main:
         # Using pre-production video - copy to uploads directory
         
         # Convert URL to file path
@@ -94,41 +113,81 @@ def process_main_video(request, updir):
         relative_path = os.path.relpath(base_path, settings.MEDIA_ROOT)
         return base_path, video_dur, relative_path
 
-def process_broll_clips(request, base_path, video_dur, updir, outdir):
-    """Handle B-roll processing"""
+def process_silence_trim(request, base_path, video_dur, updir, log=print):
+    """
+    Optional pre-pass: cut dead air out of the main video.
+    Returns (base_path, video_dur, keeps); keeps is None when trimming is off or nothing was cut.
+    """
+    if request.POST.get("trim_silence") != "on":
+        return base_path, video_dur, None
+
+    try:
+        padding = float(request.POST.get("silence_padding") or PADDING)
+    except (ValueError, TypeError):
+        padding = PADDING
+
+    return trim_silence(base_path, video_dur, padding, updir, log)
+
+def load_scene_cuts(request, base_path):
+    """Return scene-cut times for the main video if any snap-to-cut option is on, else None"""
+    if request.POST.get("snap_broll") != "on" and request.POST.get("snap_pip") != "on":
+        return None
+    return load_cuts(base_path)
+
+def collect_broll_sources(request):
+    """
+    One source per B-roll row, in DOM order: the completed chunked-upload asset path
+    when the row posted a `broll_asset` id, otherwise the next multipart file.
+    """
     files = request.FILES.getlist("broll_file")
+    assets = request.POST.getlist("broll_asset")
+    if not assets:
+        return files
+    sources = []
+    file_iter = iter(files)
+    for asset_id in assets:
+        if asset_id:
+            sources.append(completed_asset_path(asset_id))
+        else:
+            sources.append(next(file_iter, None))
+    return sources
+
+def process_broll_clips(request, video_dur, updir, cuts=None, keeps=None):
+    """Handle B-roll rows; returns the B-roll pipeline stage, a status message and the segments"""
+    files = collect_broll_sources(request)
     starts = request.POST.getlist("broll_start")
     durs = request.POST.getlist("broll_dur")
-    segs, debug = build_segments_from_rows(files, starts, durs, updir, video_dur)
+    if request.POST.get("snap_broll") != "on":
+        cuts = None
+    time_map = (lambda t: remap_time(t, keeps)) if keeps else None
+    segs, debug = build_segments_from_rows(files, starts, durs, updir, video_dur, cuts=cuts, time_map=time_map)
     
-    out_path = outdir / f"{uuid.uuid4()}.mp4"
     if segs:
-        encode_with_overlays(base_path, segs, out_path)
+        stage = partial(build_overlay_cmd, segs=segs)
         status_msg = "\n".join(debug) if debug else "B-roll applied."
     else:
-        encode_base_only(base_path, out_path)
+        stage = build_base_only_cmd
         status_msg = "No B-roll rows. Base-only render."
     
-    return out_path, status_msg, segs  # Return segments for DB saving
+    return stage, status_msg, segs  # Return segments for DB saving
 
-def process_pip_clips(request, base_path, video_dur, updir, outdir):
-    """Handle PiP processing - one PiP effect per overlay"""
+def process_pip_clips(request, video_dur, updir, cuts=None, keeps=None):
+    """Handle PiP rows - one pipeline stage per enabled PiP row"""
     rows = int(request.POST.get("pip_rows") or 0)
-    pip_results = []
+    pip_stages = []
     status_messages = []
+    if request.POST.get("snap_pip") != "on":
+        cuts = None
     
-    current_base = base_path
     for i in range(rows):
-        pip_data = extract_pip_data(request, i, video_dur, updir)
+        pip_data = extract_pip_data(request, i, video_dur, updir, cuts=cuts, keeps=keeps)
         if pip_data:
-            result = apply_single_pip_effect(current_base, pip_data, outdir)
-            current_base = result  # Use this result as input for next iteration
-            pip_results.append(result)
+            pip_stages.append(pip_stage(pip_data))
             status_messages.append(f"+ PiP row {i+1}: {pip_data['start']:.2f}s for {pip_data['duration']:.2f}s")
     
-    return pip_results, status_messages
+    return pip_stages, status_messages
 
-def extract_pip_data(request, row_index, video_dur, updir):
+def extract_pip_data(request, row_index, video_dur, updir, cuts=None, keeps=None):
     """Extract PiP data for a single row"""
     enabled = request.POST.get(f"pip_enable_{row_index}") == "on"
     if not enabled:
@@ -140,9 +199,8 @@ def extract_pip_data(request, row_index, video_dur, updir):
     except (ValueError, TypeError):
         return None
     
-    # Clamp to video duration
-    start = max(0.0, min(start, video_dur))
-    duration = max(0.0, min(duration, max(0.0, video_dur - start)))
+    # Times are entered against the original timeline: remap, clamp, snap
+    start, duration = place_window(start, duration, video_dur, keeps, cuts)
     
     if duration <= 0:
         return None
@@ -185,27 +243,152 @@ def extract_pip_data(request, row_index, video_dur, updir):
         'zoom_end': zoom_end_float
     }
 
-def apply_single_pip_effect(base_path, pip_data, outdir):
-    """Apply a single PiP effect - direct control, no black box"""
-    out_path = outdir / f"{uuid.uuid4()}.mp4"
-    
+def _tus_response(status, asset=None, **extra):
+    response = HttpResponse(status=status)
+    response["Tus-Resumable"] = "1.0.0"
+    response["Cache-Control"] = "no-store"
+    if asset is not None:
+        response["Upload-Offset"] = str(asset.offset)
+        response["Upload-Length"] = str(asset.size)
+    for k, v in extra.items():
+        response[k.replace("_", "-")] = v
+    return response
 
-    
-    # Pass zoom data to apply_shrink_pip for processing
-    apply_shrink_pip(
-        base_path=base_path,
-        out_path=out_path,
-        start_sec=pip_data['start'],
-        dur_sec=pip_data['duration'],
-        overlay_path=pip_data['overlay_path'],
-        fade_in=1.0,
-        fade_out=1.0,
-        zoom_direction=pip_data.get('zoom_direction'),
-        zoom_start=pip_data.get('zoom_start'),
-        zoom_end=pip_data.get('zoom_end'),
-    )
-    
-    return out_path
+def _parse_upload_metadata(header):
+    """Decode a tus Upload-Metadata header ("key b64value,key2 b64value2")"""
+    import base64
+    meta = {}
+    for pair in (header or "").split(","):
+        parts = pair.strip().split(" ", 1)
+        if not parts[0]:
+            continue
+        try:
+            meta[parts[0]] = base64.b64decode(parts[1]).decode("utf-8") if len(parts) > 1 else ""
+        except Exception:
+            meta[parts[0]] = ""
+    return meta
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def upload_create(request):
+    """tus-style creation: Upload-Length + Upload-Metadata (filename) -> 201 with Location"""
+    try:
+        size = int(request.headers.get("Upload-Length", ""))
+    except ValueError:
+        return JsonResponse({"error": "Upload-Length header is required"}, status=400)
+    meta = _parse_upload_metadata(request.headers.get("Upload-Metadata"))
+    try:
+        asset = create_upload(meta.get("filename", "upload.bin"), size)
+    except UploadError as e:
+        return JsonResponse({"error": str(e)}, status=e.status)
+    response = _tus_response(201, asset, Location=f"{request.path.rstrip('/')}/{asset.id}/")
+    response["Upload-Id"] = str(asset.id)
+    return response
+
+@csrf_exempt
+@require_http_methods(["HEAD", "GET", "PATCH"])
+def upload_detail(request, asset_id):
+    """HEAD/GET report the current offset; PATCH appends one chunk from the raw request body"""
+    asset = get_object_or_404(UploadedAsset, pk=asset_id)
+    if request.method == "HEAD":
+        return _tus_response(200, asset)
+    if request.method == "GET":
+        return JsonResponse({
+            "id": str(asset.id), "filename": asset.filename, "size": asset.size,
+            "offset": asset.offset, "completed": asset.completed, "sha256": asset.sha256,
+        })
+
+    try:
+        offset = int(request.headers.get("Upload-Offset", ""))
+        length = int(request.headers.get("Content-Length", ""))
+    except ValueError:
+        return JsonResponse({"error": "Upload-Offset and Content-Length headers are required"}, status=400)
+    try:
+        # request is read as a stream, never buffered whole
+        asset = append_chunk(asset, offset, request, length)
+    except UploadError as e:
+        return JsonResponse({"error": str(e)}, status=e.status)
+    if asset.completed:
+        try:
+            media_info(asset_path(asset))  # probe once now, so estimates and renders never wait on ffprobe
+        except Exception as e:
+            print(f"Could not probe upload {asset.pk}: {e}")
+    return _tus_response(204, asset)
+
+# Top-level MEDIA_ROOT folders that may be downloaded; everything else is internal
+SERVED_MEDIA_DIRS = ("uploads", "outputs", "streams", "preproduction")
+
+@require_http_methods(["GET", "HEAD"])
+def serve_media(request, path):
+    """
+    Serve files under MEDIA_ROOT's public folders (SERVED_MEDIA_DIRS) with Range, ETag and
+    conditional request support. Scratch, chunks, caches and unfinished uploads are never
+    served. Whole-file and open-ended ranges go through FileResponse, which WSGI servers with
+    sendfile support send zero-copy. With MEDIA_ACCEL_REDIRECT set, nginx serves the bytes.
+    Outside DEBUG only logged-in users get media from here (settings.MEDIA_SERVE).
+    """
+    if not settings.DEBUG and not request.user.is_authenticated:
+        raise Http404("Media file not found")
+    root = Path(settings.MEDIA_ROOT).resolve()
+    full_path = (root / path).resolve()
+    if root not in full_path.parents or not full_path.is_file():
+        raise Http404("Media file not found")
+    rel = full_path.relative_to(root)
+    if rel.parts[0] not in SERVED_MEDIA_DIRS or any(part.startswith(".") for part in rel.parts):  # staging/tmp
+        raise Http404("Media file not found")
+    if rel.parts[0] == "uploads" and UploadedAsset.objects.filter(file=rel.as_posix(), completed=False).exists():
+        raise Http404("Upload not complete")
+
+    st = full_path.stat()
+    etag = content_etag(full_path, st)
+    last_modified = http_date(st.st_mtime)
+
+    # Conditional GET
+    if_none_match = request.headers.get("If-None-Match")
+    if_modified_since = parse_http_date_safe(request.headers.get("If-Modified-Since") or "")
+    if etag_matches(if_none_match, etag) or (
+        not if_none_match and if_modified_since and int(st.st_mtime) <= if_modified_since
+    ):
+        response = HttpResponse(status=304)
+        response["ETag"] = etag
+        response["Last-Modified"] = last_modified
+        return response
+
+    accel_prefix = getattr(settings, "MEDIA_ACCEL_REDIRECT", "")
+    if accel_prefix:
+        # Let nginx serve the bytes (it handles Range itself)
+        response = HttpResponse()
+        response["X-Accel-Redirect"] = accel_prefix.rstrip("/") + "/" + rel.as_posix()
+        response["Content-Type"] = ""
+        response["ETag"] = etag
+        response["Last-Modified"] = last_modified
+        return response
+
+    # Honour Range only if If-Range (when sent) still matches this version
+    byte_range = None
+    if_range = request.headers.get("If-Range")
+    if not if_range or if_range.strip() == etag or if_range.strip() == last_modified:
+        try:
+            byte_range = parse_range(request.headers.get("Range"), st.st_size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{st.st_size}"
+            return response
+
+    f = open(full_path, "rb")
+    if byte_range:
+        start, end = byte_range
+        length = end - start + 1
+        response = FileResponse(RangeFile(f, start, length), status=206)
+        response["Content-Length"] = str(length)
+        response["Content-Range"] = f"bytes {start}-{end}/{st.st_size}"
+    else:
+        response = FileResponse(f)
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    response["Last-Modified"] = last_modified
+    response["Cache-Control"] = "private, max-age=0, must-revalidate"
+    return response
 
 def handle_completion_submission(request):
     """Handle submission of completed video and mark pre-production as completed"""
@@ -234,6 +417,8 @@ def handle_completion_submission(request):
             # Update the completed_video field
             input_data.completed_video = video_path
             input_data.save()
+            # HLS/DASH ladder for reviewers on slow links, built in the background
+            packaging.submit(input_data)
             
             # Find and mark the matching pre-production video as completed
             preprod_video = PreProduction.objects.filter(title=title).first()
@@ -246,7 +431,8 @@ def handle_completion_submission(request):
                 "output_url": video_url,
                 "rendered_title": title,
                 "submit_success": True,
-                "broll_hits": f"Completed video saved for: {title}",
+                "broll_hits": f"Completed video saved for: {title}"
+                              + ("\nAdaptive streaming versions are being packaged" if packaging.enabled() else ""),
                 "preproduction_videos": preproduction_videos,
                 "active_tab": "titles-pip"
             })
@@ -264,9 +450,22 @@ def handle_completion_submission(request):
             "active_tab": "titles-pip"
         })
 
+@require_http_methods(["POST"])
+def render_cancel(request):
+    """Beacon from the form page (closed, or the form submitted again): stop the render started with this token."""
+    try:
+        cancellation.request_cancel(request.POST.get("render_token", ""))
+    except ValueError:
+        return HttpResponse(status=400)
+    return HttpResponse(status=204)
+
 @csrf_exempt
+@telemetry.record_render
+@cancellation.cancellable_render
+@coalesce.coalesced
 def render_video(request):
     ctx = {}
+    rec = telemetry.current()
 
     # Check if this is a completion submission
     if request.method == "POST" and request.POST.get("submit_completed") == "true":
@@ -290,46 +489,72 @@ def render_video(request):
             # Backward compatibility for old return format
             base_path, video_dur = result
             main_video_path = os.path.relpath(base_path, settings.MEDIA_ROOT)
+        rec.source_duration = video_dur
         
         # Get the media file for database saving (only if not using pre-production)
         media = request.FILES.get("media")
         
-        # 2. Process B-roll clips
-        out_path, broll_status, broll_segs = process_broll_clips(request, base_path, video_dur, updir, outdir)
-        add_status(broll_status)
-        
-        # 3. Process PiP clips (one PiP effect per overlay)
-        pip_results, pip_status_messages = process_pip_clips(request, out_path, video_dur, updir, outdir)
-        for status_msg in pip_status_messages:
-            add_status(status_msg)
-        
-        # Update out_path to the last PiP result if any were processed
-        if pip_results:
-            out_path = pip_results[-1]
+        # Admission control: refuse early if the disks can't hold this render.
+        # Scratch holds the trimmed main video and each output's encode until promoted.
+        targets = [PRESETS[name] for name in request.POST.getlist("output_targets") if name in PRESETS]
+        files = scratch_files(request.POST.get("trim_silence") == "on", len(targets))
+        with open_workspace(video_dur, outdir, files=files) as ws:
+            # Optional silence trimming (B-roll/PiP times are remapped onto the trimmed timeline)
+            orig_dur = video_dur
+            base_path, video_dur, keeps = process_silence_trim(request, base_path, video_dur, ws.dir, add_status)
+            if keeps:
+                add_status(f"Silence trimmed: {orig_dur:.2f}s → {video_dur:.2f}s ({len(keeps)} pieces)")
+            
+            # Scene cuts for snap-to-cut (cached per main video)
+            cuts = load_scene_cuts(request, base_path)
+            if cuts is not None:
+                add_status(f"Scene index: {len(cuts)} cuts")
+            
+            # 2. B-roll stage
+            broll_stage, broll_status, broll_segs = process_broll_clips(request, video_dur, updir, cuts=cuts, keeps=keeps)
+            add_status(broll_status)
+            
+            # 3. PiP stages (one PiP effect per overlay)
+            pip_stages, pip_status_messages = process_pip_clips(request, video_dur, updir, cuts=cuts, keeps=keeps)
+            for status_msg in pip_status_messages:
+                add_status(status_msg)
+            stages = [broll_stage] + pip_stages
+            # Reject broken inputs/graphs in about a second, before transcription and the encode
+            preflight.check_stages(base_path, stages)
 
-        # ---- OPTIONAL BURN-IN CAPTIONS ----
-        enable_captions = request.POST.get("enable_captions") == "on"
-        if enable_captions:
-            try:
-                # Transcribe from the original base (same audio)
-                srt_path = transcribe_to_srt(base_path)
+            # ---- OPTIONAL BURN-IN CAPTIONS ----
+            def add_error(msg: str):
+                prev = ctx.get("error") or ""
+                ctx["error"] = prev + ("\n" if prev else "") + msg
 
-                # Burn captions onto the just-rendered video (out_path) -> final_path
-                final_path = outdir / f"{uuid.uuid4()}.mp4"
-                burn_in_subtitles(out_path, srt_path, final_path)
+            srt_path = None
+            enable_captions = request.POST.get("enable_captions") == "on"
+            if enable_captions:
+                try:
+                    # Transcribe from the original base (same audio)
+                    with telemetry.stage("transcribe", inputs=[base_path]) as st:
+                        srt_path = st.output = transcribe_to_srt(Path(base_path))
+                except Exception as cap_err:
+                    add_error(f"Captions skipped: {cap_err}")
+            else:
+                add_status("Captions disabled by user")
 
-                # Serve the captioned file
-                out_path = final_path
+            # 4. Run all stages at once, connected by pipes; only the last one encodes video.
+            #    Stages are video-only; the main audio is muxed once at the end.
+            #    A caption failure still yields the uncaptioned video.
+            # Extra renditions (720p, vertical, ...) come from the same decode and composite
+            out_path = ws.new_path()
+            if render_with_captions(base_path, stages, out_path, srt_path, add_error, targets):
                 add_status("+ Burn-in captions added")
-            except Exception as cap_err:
-                prev = ctx.get("error") or ""
-                msg = f"Captions skipped: {cap_err}"
-                ctx["error"] = prev + ("\n" if prev else "") + msg
-        else:
-            add_status("Captions disabled by user")
+
+            # Only the final files leave scratch
+            out_path = promote_outputs(ws, out_path, targets, outdir)
 
         # Done
         ctx["output_url"] = f'{settings.MEDIA_URL}outputs/{out_path.name}'
+        ctx["extra_outputs"] = [
+            (t.name, f'{settings.MEDIA_URL}outputs/{sibling_path(out_path, t.name).name}') for t in targets
+        ]
 
         title = request.POST.get("title")
         if not title:
@@ -367,12 +592,15 @@ def render_video(request):
         )
 
         # Save the InputData
+        # Extra output targets are recorded so gc_media keeps them
+        outputs = {t.name: os.path.relpath(sibling_path(out_path, t.name), settings.MEDIA_ROOT) for t in targets}
         if main_video_path:
             # Using pre-production video or processed file
-            input_data = InputData.objects.create(title=title, main_video=main_video_path)
+            input_data = InputData.objects.create(title=title, main_video=main_video_path, outputs=outputs)
         else:
             # Using uploaded file
-            input_data = InputData.objects.create(title=title, main_video=media)
+            input_data = InputData.objects.create(title=title, main_video=media, outputs=outputs)
+        rec.input_data = input_data
 
         # Save PiP clips
         for i in range(pip_rows):
@@ -436,6 +664,7 @@ def render_video(request):
         return render(request, "renderer/explainer_video.html", ctx)
 
     except Exception as e:
+        rec.error = str(e)
         ctx["error"] = str(e)
         ctx["preproduction_videos"] = PreProduction.objects.all()
         ctx["active_tab"] = "video-production"
@@ -0,0 +1,244 @@
+# renderer/workspace.py
+import fcntl, os, shutil, time, uuid
+from pathlib import Path
+from typing import List, Optional
+
+from django.conf import settings
+
+# ===== Disk budgeting =====
+EST_BYTES_PER_SEC = 1_250_000   # ~10 Mbit/s: CRF 18 H.264 at 1080p30, with headroom
+DISK_HEADROOM = 1.2             # require 20% more free space than estimated
+MIN_FREE_BYTES = 512 * (1 << 20)  # never fill a disk below this
+LOCK_NAME = ".lock"             # held by the process rendering in a workspace
+
+class InsufficientDiskSpace(ValueError):
+    pass
+
+def default_scratch_root() -> Path:
+    return Path(settings.MEDIA_ROOT) / "scratch"
+
+def scratch_roots() -> List[Path]:
+    """Scratch tiers, fastest first: RENDER_SCRATCH_DIR (tmpfs / local SSD) if configured, then MEDIA_ROOT/scratch."""
+    roots = []
+    fast = getattr(settings, "RENDER_SCRATCH_DIR", "")
+    if fast:
+        roots.append(Path(fast))
+    roots.append(default_scratch_root())
+    return roots
+
+def free_bytes(path: Path) -> int:
+    path.mkdir(parents=True, exist_ok=True)
+    return shutil.disk_usage(path).free
+
+def estimate_output_bytes(video_dur: float) -> int:
+    return int(max(0.0, video_dur) * EST_BYTES_PER_SEC)
+
+class RenderWorkspace:
+    """
+    Per-job scratch directory for intermediates.
+    Stages write into `dir`; only the final file is promoted to the outputs dir and the
+    rest is deleted when the workspace closes (also on errors). An flock on dir/.lock
+    marks the workspace live, so collect_garbage never removes it mid-render.
+    """
+    def __init__(self, root: Path, job_id: Optional[str] = None):
+        self.job_id = job_id or uuid.uuid4().hex
+        self.dir = Path(root) / self.job_id
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._lock_fd = os.open(self.dir / LOCK_NAME, os.O_RDWR | os.O_CREAT, 0o666)
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cleanup()
+
+    def new_path(self, suffix: str = ".mp4") -> Path:
+        return self.dir / f"{uuid.uuid4()}{suffix}"
+
+    def release(self, path: Path):
+        """Delete an intermediate as soon as the next stage has consumed it."""
+        path = Path(path)
+        if self.dir in path.parents:
+            path.unlink(missing_ok=True)
+
+    def promote(self, path: Path, outdir: Path) -> Path:
+        """Move the final file out of scratch (rename on the same filesystem, copy otherwise)."""
+        path = Path(path)
+        if self.dir not in path.parents:
+            return path
+        outdir.mkdir(parents=True, exist_ok=True)
+        dest = outdir / path.name
+        shutil.move(str(path), str(dest))
+        return dest
+
+    def cleanup(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+def scratch_files(trimmed: bool = False, targets: int = 0) -> int:
+    """
+    Full-length files a render keeps in scratch at once: the silence-trimmed main video,
+    and for the master and each extra target its video-only encode plus the muxed file.
+    """
+    return int(trimmed) + 2 * (1 + targets)
+
+def open_workspace(video_dur: float, outdir: Path, files: int = 2) -> RenderWorkspace:
+    """
+    Admission control + tier selection.
+    Picks the first scratch tier with room for `files` full-length files (see
+    scratch_files), and refuses the render if the outputs disk can't take the final file.
+    """
+    est = estimate_output_bytes(video_dur)
+    out_need = int(est * DISK_HEADROOM) + MIN_FREE_BYTES
+    out_free = free_bytes(outdir)
+    if out_free < out_need:
+        raise InsufficientDiskSpace(
+            f"Not enough disk space for this render: need ~{out_need / 1e9:.1f} GB "
+            f"free for the output, have {out_free / 1e9:.1f} GB."
+        )
+
+    scratch_need = int(est * max(1, files) * DISK_HEADROOM) + MIN_FREE_BYTES
+    for root in scratch_roots():
+        try:
+            if free_bytes(root) >= scratch_need:
+                return RenderWorkspace(root)
+        except OSError:
+            continue
+    raise InsufficientDiskSpace(
+        f"Not enough scratch space for this render: need ~{scratch_need / 1e9:.1f} GB free."
+    )
+
+# ---------- garbage collection ----------
+def _older_than(path: Path, max_age_sec: float, now: float) -> bool:
+    try:
+        return now - path.stat().st_mtime > max_age_sec
+    except FileNotFoundError:
+        return False
+
+def _last_modified(path: Path) -> float:
+    """
+    Newest mtime of a directory and everything in it (the dir's own mtime only changes
+    when entries are added or removed, not while a file in it is being written).
+    """
+    newest = path.stat().st_mtime
+    for root, dirs, files in os.walk(path):
+        for name in dirs + files:
+            try:
+                newest = max(newest, os.stat(os.path.join(root, name)).st_mtime)
+            except FileNotFoundError:
+                pass
+    return newest
+
+def _locked(path: Path) -> bool:
+    """Whether a render holds path's workspace lock (RenderWorkspace)."""
+    try:
+        fd = os.open(path / LOCK_NAME, os.O_RDWR)
+    except FileNotFoundError:
+        return False
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return False
+    except BlockingIOError:
+        return True
+    finally:
+        os.close(fd)
+
+def _referenced_media() -> set:
+    """Relative MEDIA_ROOT paths still referenced from the database."""
+    from preproduction.models import PreProduction
+    from .models import InputData, PiPClip, BrollClip, RenderJob, UploadedAsset
+
+    refs = set()
+    for name in InputData.objects.values_list("main_video", flat=True):
+        refs.add(name)
+    for name, outputs in InputData.objects.values_list("completed_video", "outputs"):
+        refs.add(name)
+        refs.update((outputs or {}).values())  # extra output targets of form renders
+    for name in BrollClip.objects.values_list("file", flat=True):
+        refs.add(name)
+    for name in PiPClip.objects.values_list("overlay", flat=True):
+        refs.add(name)
+    for name in UploadedAsset.objects.values_list("file", flat=True):
+        refs.add(name)
+    for name, outputs in RenderJob.objects.values_list("output", "outputs"):
+        refs.add(name)
+        refs.update((outputs or {}).values())  # extra output targets
+    for main, pip in PreProduction.objects.values_list("main_video", "pip_video"):
+        refs.update([main, pip])
+    return {r for r in refs if r}
+
+def collect_garbage(scratch_age_sec: float = 6 * 3600, media_age_sec: float = 7 * 86400,
+                    upload_age_sec: float = 2 * 86400, dry_run: bool = False) -> List[Path]:
+    """
+    Delete leftover render files and return what was (or would be) removed:
+      - scratch job dirs and render-farm chunk dirs untouched for scratch_age_sec (crashed/killed
+        renders); never a workspace a render still holds, nor the chunks of an unfinished job
+      - progressive preview streams (full-length, cheap to redo) older than scratch_age_sec
+      - render cancel markers older than scratch_age_sec (beacons for renders already over)
+      - unreferenced files in uploads/ and outputs/ older than media_age_sec
+      - prescaled stills (renderer/overlay.py) not used for media_age_sec
+      - incomplete chunked uploads untouched for upload_age_sec
+    """
+    from .models import RenderJob, UploadedAsset
+
+    now = time.time()
+    media_root = Path(settings.MEDIA_ROOT)
+    removed: List[Path] = []
+
+    unfinished = {str(pk) for pk in RenderJob.objects.filter(
+        status__in=[RenderJob.QUEUED, RenderJob.RUNNING]).values_list("pk", flat=True)}
+    for root in scratch_roots() + [media_root / "chunks"]:
+        if not root.is_dir():
+            continue
+        for job_dir in root.iterdir():
+            if not job_dir.is_dir() or job_dir.name in unfinished or _locked(job_dir):
+                continue
+            if now - _last_modified(job_dir) > scratch_age_sec:
+                removed.append(job_dir)
+                if not dry_run:
+                    shutil.rmtree(job_dir, ignore_errors=True)
+
+    for folder in (media_root / "cache" / "previews" / "streams", media_root / "cancel"):
+        if not folder.is_dir():
+            continue
+        for path in folder.iterdir():
+            if path.is_file() and _older_than(path, scratch_age_sec, now):
+                removed.append(path)
+                if not dry_run:
+                    path.unlink(missing_ok=True)
+
+    stale = UploadedAsset.objects.filter(completed=False)
+    for asset in stale:
+        path = media_root / asset.file.name
+        if not path.exists() or _older_than(path, upload_age_sec, now):
+            removed.append(path)
+            if not dry_run:
+                path.unlink(missing_ok=True)
+                asset.delete()
+
+    stills = media_root / "cache" / "stills"
+    if stills.is_dir():
+        for path in stills.iterdir():
+            if path.is_file() and _older_than(path, media_age_sec, now):
+                removed.append(path)
+                if not dry_run:
+                    path.unlink(missing_ok=True)
+
+    refs = _referenced_media()
+    for sub in ("uploads", "outputs"):
+        folder = media_root / sub
+        if not folder.is_dir():
+            continue
+        for path in folder.iterdir():
+            if not path.is_file():
+                continue
+            rel = path.relative_to(media_root).as_posix()
+            if rel in refs or not _older_than(path, media_age_sec, now):
+                continue
+            removed.append(path)
+            if not dry_run:
+                path.unlink(missing_ok=True)
+    return removed
@@ -17,7 +17,7 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
-from django.conf.urls.static import static
+from renderer.views import serve_media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -26,5 +26,9 @@ urlpatterns = [
     path('script/', include('script.urls')),  # Includes script/AI assistant URLs
     path('description/', include('description.urls')),  # Includes description/AI assistant URLs
 ]
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# Media (uploads, rendered outputs) with Range/ETag support; see renderer.views.serve_media.
+# Production serves media from the front web server unless MEDIA_SERVE is set.
+if settings.MEDIA_SERVE:
+    urlpatterns += [
+        path(f"{settings.MEDIA_URL.lstrip('/')}<path:path>", serve_media, name='media'),
+    ]